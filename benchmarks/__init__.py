@@ -0,0 +1,4 @@
+"""Бенчмарки бота. Запуск из корня репозитория: python -m benchmarks.<имя_модуля>
+
+Полный набор сценариев с результатами в JSON: python -m benchmarks.bench_suite
+"""
@@ -0,0 +1,48 @@
+"""Рассылка анонса подписчикам: последовательная отправка против BroadcastService.
+
+Используется FakeBot с задержкой 150 мс и лимитами Telegram
+(30 сообщений в секунду, 1 в секунду на чат); 2% подписчиков заблокировали бота.
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks.fake_bot import FakeBot
+from services.broadcast_service import BroadcastService
+
+LATENCY = 0.15
+
+
+async def sequential(chat_ids) -> dict:
+    """Прежний способ: await send_message по одному"""
+    bot = FakeBot(latency=LATENCY, blocked=chat_ids[::50])
+    started = time.monotonic()
+    sent = failed = 0
+    for chat_id in chat_ids:
+        try:
+            await bot.send_message(chat_id=chat_id, text="🏐 Новое событие")
+            sent += 1
+        except Exception:
+            failed += 1
+    return {'duration': round(time.monotonic() - started, 2), 'sent': sent, 'failed': failed,
+            'retry_after': bot.retry_after_count}
+
+
+async def engine(chat_ids) -> dict:
+    bot = FakeBot(latency=LATENCY, blocked=chat_ids[::50])
+    result = await BroadcastService(bot).broadcast(chat_ids, {'text': "🏐 Новое событие"})
+    return {'duration': result['duration'], 'sent': result['sent'], 'failed': result['failed'],
+            'blocked': result['blocked'], 'retry_after': bot.retry_after_count}
+
+
+def main():
+    subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    chat_ids = list(range(1, subscribers + 1))
+    for name, scenario in (('последовательно', sequential), ('BroadcastService', engine)):
+        result = asyncio.run(scenario(chat_ids))
+        rate = result['sent'] / result['duration'] if result['duration'] else 0
+        print(f"{name:<18} {subscribers} подписчиков: {result}, {rate:.1f} сообщений/с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Задержка выборок участников и событий с индексами миграции 1 и без них.
+
+Наполняет временную базу: 10 000 пользователей, 1 000 прошедших событий
+по 20 участников и одно активное событие, затем замеряет get_participant,
+get_event_participants и get_active_events.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from data.database import Database
+
+USERS = 10_000
+PAST_EVENTS = 1_000
+PARTICIPANTS_PER_EVENT = 20
+ACTIVE_PARTICIPANTS = 40
+ITERATIONS = 300
+
+INDEXES = [
+    'ux_participants_event_user',
+    'idx_participants_event_status_position',
+    'idx_participants_event_position',
+    'idx_events_status_date_time',
+]
+
+
+def seed(db: Database) -> int:
+    """Наполнить базу данными, вернуть ID активного события"""
+    rng = random.Random(42)
+    today = date.today()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            'INSERT INTO users (telegram_id, username, first_name) VALUES (?, ?, ?)',
+            [(1_000_000 + i, f'user{i}', f'Игрок {i}') for i in range(USERS)]
+        )
+        cursor.executemany(
+            'INSERT INTO events (name, date, time, max_participants) VALUES (?, ?, ?, 18)',
+            [(f'Прошедшая тренировка {i}', today - timedelta(days=i + 1), '20:00') for i in range(PAST_EVENTS)]
+        )
+        cursor.execute('SELECT id FROM events')
+        event_ids = [row[0] for row in cursor.fetchall()]
+        rows = []
+        for event_id in event_ids:
+            for position, user_id in enumerate(rng.sample(range(1, USERS + 1), PARTICIPANTS_PER_EVENT), 1):
+                rows.append((event_id, user_id, 'confirmed' if position <= 18 else 'reserve', position))
+        cursor.execute('INSERT INTO events (name, date, time, max_participants) VALUES (?, ?, ?, 18)',
+                       ('Активная тренировка', today + timedelta(days=1), '20:00'))
+        active_id = cursor.lastrowid
+        for position, user_id in enumerate(range(1, ACTIVE_PARTICIPANTS + 1), 1):
+            rows.append((active_id, user_id, 'confirmed' if position <= 18 else 'reserve', position))
+        cursor.executemany(
+            'INSERT INTO participants (event_id, user_id, status, position) VALUES (?, ?, ?, ?)', rows
+        )
+        conn.commit()
+        cursor.execute('ANALYZE')
+    return active_id
+
+
+def measure(func, *args) -> dict:
+    """Замерить задержку вызова в микросекундах"""
+    timings = []
+    for _ in range(ITERATIONS):
+        started = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    timings.sort()
+    return {
+        'p50_us': round(statistics.median(timings), 1),
+        'p99_us': round(timings[int(len(timings) * 0.99) - 1], 1),
+    }
+
+
+def run_suite(db: Database, event_id: int) -> dict:
+    return {
+        'get_participant': measure(db.get_participant, event_id, 1_000_000 + ACTIVE_PARTICIPANTS // 2),
+        'get_event_participants': measure(db.get_event_participants, event_id),
+        'get_active_events': measure(db.get_active_events),
+    }
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        event_id = seed(db)
+
+        with_indexes = run_suite(db, event_id)
+
+        with db.get_connection() as conn:
+            for index in INDEXES:
+                conn.execute(f'DROP INDEX IF EXISTS {index}')
+            conn.execute('ANALYZE')
+        without_indexes = run_suite(db, event_id)
+        db.close()
+
+    print(f"{'запрос':<24}{'без индексов p50/p99, мкс':>30}{'с индексами p50/p99, мкс':>30}")
+    for name in with_indexes:
+        before, after = without_indexes[name], with_indexes[name]
+        print(f"{name:<24}{before['p50_us']:>18} / {before['p99_us']:<10}{after['p50_us']:>18} / {after['p99_us']:<10}")
+
+
+if __name__ == '__main__':
+    main()
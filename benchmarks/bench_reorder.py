@@ -0,0 +1,91 @@
+"""Пересчет позиций и статусов: построчные UPDATE в цикле против одного запроса.
+
+Для составов из 18, 200 и 2000 участников замеряются _reorder_participants
+(после удаления первого участника) и recalculate_participant_statuses
+(смена лимита 18 -> 12 -> 18).
+"""
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from data.database import Database
+
+ROSTER_SIZES = (18, 200, 2000)
+ROUNDS = 50
+
+
+def legacy_reorder(db: Database, event_id: int):
+    """Прежняя реализация: по одному UPDATE на участника"""
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM participants WHERE event_id = ? ORDER BY position', (event_id,))
+        for i, (participant_id,) in enumerate(cursor.fetchall(), 1):
+            cursor.execute('UPDATE participants SET position = ? WHERE id = ?', (i, participant_id))
+        conn.commit()
+
+
+def legacy_recalculate(db: Database, event_id: int):
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        limit = db.get_participant_limit()
+        cursor.execute('SELECT id, status FROM participants WHERE event_id = ? ORDER BY position', (event_id,))
+        for i, (participant_id, status) in enumerate(cursor.fetchall()):
+            new_status = 'confirmed' if i < limit else 'reserve'
+            if status != new_status:
+                cursor.execute('UPDATE participants SET status = ? WHERE id = ?', (new_status, participant_id))
+        conn.commit()
+
+
+def seed(db: Database, size: int) -> int:
+    event_id = db.create_event(f'Тренировка на {size}', date.today() + timedelta(days=1), '20:00')
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('INSERT OR IGNORE INTO users (telegram_id, username) VALUES (?, ?)',
+                           [(i, f'user{i}') for i in range(1, size + 1)])
+        cursor.executemany(
+            'INSERT INTO participants (event_id, user_id, status, position) '
+            'SELECT ?, id, ?, ? FROM users WHERE telegram_id = ?',
+            [(event_id, 'confirmed' if i <= 18 else 'reserve', i, i) for i in range(1, size + 1)]
+        )
+        conn.commit()
+    return event_id
+
+
+def timed(func) -> float:
+    """Среднее время одного прогона в миллисекундах"""
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    return (time.perf_counter() - started) / ROUNDS * 1000
+
+
+def main():
+    print(f"{'участников':>10} {'reorder цикл':>14} {'reorder SQL':>12} {'recalc цикл':>12} {'recalc SQL':>11}  (мс)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        for size in ROSTER_SIZES:
+            event_id = seed(db, size)
+
+            def shift_positions():
+                # Имитируем удаление первого участника: все позиции сдвинуты на 1
+                with db.get_connection() as conn:
+                    conn.execute('UPDATE participants SET position = position + 1 WHERE event_id = ?', (event_id,))
+
+            def flip_limit(implementation):
+                def run():
+                    for limit in (12, 18):
+                        db.set_participant_limit(limit)
+                        implementation(db, event_id) if implementation else db.recalculate_participant_statuses(event_id)
+                return run
+
+            reorder_loop = timed(lambda: (shift_positions(), legacy_reorder(db, event_id)))
+            reorder_sql = timed(lambda: (shift_positions(), db._reorder_participants(event_id)))
+            recalc_loop = timed(flip_limit(legacy_recalculate))
+            recalc_sql = timed(flip_limit(None))
+            print(f"{size:>10} {reorder_loop:>14.2f} {reorder_sql:>12.2f} {recalc_loop:>12.2f} {recalc_sql:>11.2f}")
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Пропускная способность параллельных чтений и записей для профилей хранения.
+
+Писатели записывают и отписывают участников (как «Иду на тренировку!» и
+отметки напоминаний), читатели запрашивают список участников (как
+«Список участников»). Сравниваются профили legacy (журнал отката) и
+balanced (WAL).
+"""
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from data.database import Database
+
+DURATION = 3.0
+READERS = 4
+WRITERS = 2
+USERS_PER_WRITER = 50
+
+
+def run_profile(profile: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_POOL_SIZE'] = str(READERS + WRITERS)
+        db = Database(os.path.join(tmp, 'bench.db'), profile=profile)
+        event_id = db.create_event('Тренировка', date.today() + timedelta(days=1), '20:00')
+        for i in range(WRITERS * USERS_PER_WRITER):
+            db.add_user(10_000 + i, f'user{i}')
+
+        counters = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + DURATION
+
+        def reader():
+            done = 0
+            while time.monotonic() < deadline:
+                db.get_event_participants(event_id)
+                done += 1
+            with lock:
+                counters['reads'] += done
+
+        def writer(offset: int):
+            done = errors = 0
+            users = [10_000 + offset * USERS_PER_WRITER + i for i in range(USERS_PER_WRITER)]
+            while time.monotonic() < deadline:
+                for telegram_id in users:
+                    try:
+                        db.add_participant(event_id, telegram_id)
+                        db.mark_reminder_sent(event_id, telegram_id)
+                        db.remove_participant(event_id, telegram_id)
+                        done += 3
+                    except Exception:
+                        errors += 1
+                    if time.monotonic() >= deadline:
+                        break
+            with lock:
+                counters['writes'] += done
+                counters['errors'] += errors
+
+        threads = [threading.Thread(target=reader) for _ in range(READERS)]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(WRITERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        db.close()
+
+    return {
+        'reads_per_s': round(counters['reads'] / DURATION),
+        'writes_per_s': round(counters['writes'] / DURATION),
+        'errors': counters['errors'],
+    }
+
+
+def main():
+    print(f"{'профиль':<10}{'чтений/с':>12}{'записей/с':>12}{'ошибок':>10}")
+    for profile in ('legacy', 'balanced'):
+        result = run_profile(profile)
+        print(f"{profile:<10}{result['reads_per_s']:>12}{result['writes_per_s']:>12}{result['errors']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+"""Набор нагрузочных сценариев бота с сохранением результатов в JSON.
+
+Каждый сценарий поднимает настоящее приложение (VolleyballBot: обработчики,
+процессор обновлений, persistence, очередь сообщений) на чистой базе SQLite
+во временном каталоге. Bot API заменен FakeRequest поверх FakeBot, который
+имитирует сетевую задержку и отвечает RetryAfter при превышении лимита
+Telegram. Обработчики получают синтетические Update, задачи планировщика
+вызываются напрямую.
+
+Сценарии:
+    announcement  - анонс нового события всем подписчикам
+    join_rush     - все подписчики нажимают «Иду на тренировку!» после анонса
+    roster_views  - подписчики запрашивают «Список участников»
+    reminders     - первая и вторая волна напоминаний основному составу
+    auto_leave    - автоматическая отписка неподтвердивших
+    limit_change  - администратор меняет лимит участников (24, затем 12)
+
+Для каждого сценария: число операций, длительность, пропускная способность,
+перцентили задержки (обновления - от постановки в очередь до конца
+обработки, рассылки - от запуска задачи до отправки сообщения), число
+SQL-запросов (всего и по меткам обработчиков), вызовы Bot API по методам,
+RetryAfter и ошибки обработчиков.
+
+    python -m benchmarks.bench_suite [--users N] [--latency С] [--only СЦЕНАРИЙ ...]
+                                     [--out ФАЙЛ] [--baseline ФАЙЛ]
+
+Без --out результат пишется в benchmarks/results/; с --baseline печатается
+сравнение с прошлым запуском.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import CallbackContext, ExtBot, TypeHandler
+
+from benchmarks.fake_bot import FakeBot, FakeRequest
+from config.settings import ADMIN_IDS, BROADCAST_SETTINGS, JOIN_RUSH_SETTINGS
+from data.backends import SQLiteBackend
+from data.database import Database
+
+FIRST_USER_ID = 100_000
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+class CountingSQLiteBackend(SQLiteBackend):
+    """SQLite, считающий выполненные SQL-запросы на всех соединениях пула"""
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+        self.statements = 0
+
+    def configure(self, conn):
+        super().configure(conn)
+        conn.set_trace_callback(self._count)
+
+    def _count(self, statement: str):
+        self.statements += 1
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Harness:
+    """Приложение бота на FakeBot: подача обновлений, вызов задач, счетчики"""
+
+    def __init__(self, workdir: str, latency: float, global_rate: Optional[int]):
+        from main import VolleyballBot
+
+        self.backend = CountingSQLiteBackend(os.path.join(workdir, 'bench.db'))
+        self.fake = FakeBot(latency=latency, global_rate=global_rate, per_chat_rate=None)
+        self.bot = VolleyballBot(bot=ExtBot('0:bench', request=FakeRequest(self.fake)),
+                                 db=Database(backend=self.backend))
+        self.bot.setup_handlers()
+        self.application = self.bot.application
+        self.db = self.bot.db
+        self.errors = 0
+        self._update_ids = iter(range(1, 10 ** 9))
+        self._queued_at: Dict[int, float] = {}
+        self._latencies: List[float] = []
+        self._done = asyncio.Event()
+        self._sql_mark = self._api_mark = 0
+        self._label_marks: Dict[str, int] = {}
+        self.started = 0.0
+        # Последняя группа: выполняется после всех обработчиков обновления
+        self.application.add_handler(TypeHandler(Update, self._finished), group=100)
+        self.application.add_error_handler(self._error)
+
+    async def _finished(self, update: Update, context):
+        self._latencies.append(time.monotonic() - self._queued_at.pop(update.update_id))
+        self._done.set()
+
+    async def _error(self, update, context):
+        self.errors += 1
+
+    async def start(self):
+        await self.application.initialize()
+        await self.application.start()
+        await self.bot.on_startup(self.application)
+
+    async def stop(self):
+        await self.bot.on_stop(self.application)
+        await self.application.stop()
+        await self.application.shutdown()
+        self.bot.async_db.close()
+        self.db.close()
+
+    # Данные
+    def seed_users(self, count: int) -> List[int]:
+        telegram_ids = [FIRST_USER_ID + i for i in range(count)]
+        for telegram_id in telegram_ids:
+            self.db.add_user(telegram_id, f'player{telegram_id}', f'Игрок {telegram_id}')
+        return telegram_ids
+
+    def seed_event(self, max_participants: int = 18) -> int:
+        return self.db.create_event('Тренировка', date.today() + timedelta(days=1), '20:00', max_participants)
+
+    def seed_participants(self, event_id: int, telegram_ids: List[int], confirmed_presence: bool = False):
+        self.db.join_participants(event_id, [
+            (telegram_id, f'player{telegram_id}', f'Игрок {telegram_id}', None, confirmed_presence)
+            for telegram_id in telegram_ids
+        ])
+
+    # Нагрузка
+    def begin(self):
+        """Начать замер: подготовка данных в результаты не входит"""
+        self._sql_mark = self.backend.statements
+        self._label_marks = self._statements_by_label()
+        self._api_mark = len(self.fake.calls)
+        self.started = time.monotonic()
+
+    def sql_statements(self) -> int:
+        return self.backend.statements - self._sql_mark
+
+    def _statements_by_label(self) -> Dict[str, int]:
+        query_stats = self.db.get_query_stats()
+        return {item['label']: item['statements'] for item in query_stats['labels']} if query_stats else {}
+
+    def sql_by_label(self) -> Dict[str, int]:
+        """Запросы с начала замера по обработчикам (см. data/query_stats.py)"""
+        result = {}
+        for label, statements in self._statements_by_label().items():
+            delta = statements - self._label_marks.get(label, 0)
+            if delta:
+                result[label] = delta
+        return result
+
+    def api_calls(self) -> Counter:
+        return Counter(call[0] for call in self.fake.calls[self._api_mark:])
+
+    def message(self, telegram_id: int, text: str) -> Update:
+        update_id = next(self._update_ids)
+        return Update.de_json({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': telegram_id, 'type': 'private'},
+                'from': {'id': telegram_id, 'is_bot': False, 'first_name': f'Игрок {telegram_id}',
+                         'username': f'player{telegram_id}'},
+                'text': text,
+                # Команды распознаются по entities, как в настоящих обновлениях
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+                if text.startswith('/') else [],
+            },
+        }, self.application.bot)
+
+    async def feed(self, updates: List[Update], sequential: bool = False) -> List[float]:
+        """Подать обновления (все сразу или по одному) и дождаться их обработки"""
+        self._latencies = []
+        for update in updates:
+            self._queued_at[update.update_id] = time.monotonic()
+            await self.application.update_queue.put(update)
+            if sequential:
+                await self._wait(len(self._latencies) + 1)
+        await self._wait(len(updates))
+        return self._latencies
+
+    async def _wait(self, count: int):
+        while len(self._latencies) < count:
+            self._done.clear()
+            await asyncio.wait_for(self._done.wait(), timeout=600)
+
+    async def job(self, callback: Callable):
+        """Выполнить задачу планировщика"""
+        await callback(CallbackContext(self.application))
+
+    async def drain(self):
+        """Дождаться отложенных рассылок изменений состава и опустошения очереди сообщений"""
+        notification_service = self.bot.notification_service
+        while notification_service._update_tasks:
+            await asyncio.gather(*list(notification_service._update_tasks.values()), return_exceptions=True)
+        # Сообщения с отложенным повтором не ждем: они попадут в retried
+        while await notification_service.outbox.dispatch_once():
+            pass
+
+    def delivery_latencies(self) -> List[float]:
+        """Задержки отправленных с начала замера сообщений"""
+        return [moment - self.started for moment in self.fake.call_times[self._api_mark:]]
+
+
+async def scenario_announcement(h: Harness, users: int) -> Dict:
+    h.seed_users(users)
+    h.begin()
+    await h.job(h.bot.create_scheduled_events)
+    await h.drain()
+    return {'operations': users, 'latencies': h.delivery_latencies()}
+
+
+async def scenario_join_rush(h: Harness, users: int) -> Dict:
+    telegram_ids = h.seed_users(users)
+    event_id = h.seed_event()
+    h.bot.event_service.join_queue.start_rush(event_id)
+    h.begin()
+    latencies = await h.feed([h.message(telegram_id, "Иду на тренировку!") for telegram_id in telegram_ids])
+    await h.drain()
+    joined = [p['telegram_id'] for p in h.db.get_event_participants(event_id)]
+    return {'operations': users, 'latencies': latencies, 'joined': len(joined), 'fifo': joined == telegram_ids}
+
+
+async def scenario_roster_views(h: Harness, users: int) -> Dict:
+    telegram_ids = h.seed_users(users)
+    event_id = h.seed_event()
+    h.seed_participants(event_id, telegram_ids[:30], confirmed_presence=True)
+    h.begin()
+    latencies = await h.feed([h.message(telegram_id, "Список участников") for telegram_id in telegram_ids])
+    return {'operations': users, 'latencies': latencies}
+
+
+async def scenario_reminders(h: Harness, users: int) -> Dict:
+    telegram_ids = h.seed_users(users)
+    event_id = h.seed_event(max_participants=users)
+    h.seed_participants(event_id, telegram_ids)
+    h.begin()
+    await h.job(h.bot.send_presence_reminders)
+    await h.job(h.bot.send_second_reminders)
+    await h.drain()
+    return {'operations': 2 * users, 'latencies': h.delivery_latencies()}
+
+
+async def scenario_auto_leave(h: Harness, users: int) -> Dict:
+    telegram_ids = h.seed_users(users)
+    event_id = h.seed_event(max_participants=users // 2)
+    # Первая половина подтвердила присутствие, вторая - в резерве без подтверждения
+    h.seed_participants(event_id, telegram_ids[:users // 2], confirmed_presence=True)
+    h.seed_participants(event_id, telegram_ids[users // 2:])
+    h.begin()
+    await h.job(h.bot.auto_leave_unconfirmed)
+    await h.drain()
+    return {'operations': users - users // 2, 'latencies': h.delivery_latencies()}
+
+
+async def scenario_limit_change(h: Harness, users: int) -> Dict:
+    telegram_ids = h.seed_users(users)
+    event_id = h.seed_event()
+    h.seed_participants(event_id, telegram_ids[:30], confirmed_presence=True)
+    admin_id = ADMIN_IDS[0]
+    h.db.add_user(admin_id, 'admin')
+    steps = ["/admin", "⚙️ Настройки", "👥 Лимит участников", "24 участника",
+             "⚙️ Настройки", "👥 Лимит участников", "12 участников"]
+    h.begin()
+    # Шаги администратора зависят друг от друга - по одному
+    latencies = await h.feed([h.message(admin_id, text) for text in steps], sequential=True)
+    await h.drain()
+    return {'operations': len(steps), 'latencies': latencies}
+
+
+# Название -> (сценарий, глобальный лимит FakeBot). Рассылки идут с лимитом
+# Telegram (30 сообщений в секунду); ответы на нажатия пользователей
+# Telegram так жестко не ограничивает.
+SCENARIOS: Dict[str, tuple] = {
+    'announcement': (scenario_announcement, 30),
+    'join_rush': (scenario_join_rush, None),
+    'roster_views': (scenario_roster_views, None),
+    'reminders': (scenario_reminders, 30),
+    'auto_leave': (scenario_auto_leave, 30),
+    'limit_change': (scenario_limit_change, 30),
+}
+
+
+async def run_scenario(name: str, users: int, latency: float) -> Dict:
+    scenario, global_rate = SCENARIOS[name]
+    with tempfile.TemporaryDirectory() as workdir:
+        h = Harness(workdir, latency, global_rate)
+        await h.start()
+        try:
+            result = await scenario(h, users)
+            duration = time.monotonic() - h.started
+            sql = h.sql_statements()
+            sql_by_label = h.sql_by_label()
+            api_calls = h.api_calls()
+        finally:
+            await h.stop()
+    latencies = result.pop('latencies')
+    operations = result.pop('operations')
+    return {
+        'operations': operations,
+        'duration_s': round(duration, 3),
+        'throughput_per_s': round(operations / duration, 1) if duration else None,
+        'latency_ms': {
+            name: round(value * 1000, 1) if value is not None else None
+            for name, value in (('p50', percentile(latencies, 0.5)), ('p95', percentile(latencies, 0.95)),
+                                ('p99', percentile(latencies, 0.99)),
+                                ('max', max(latencies) if latencies else None))
+        },
+        'sql_statements': sql,
+        'sql_per_operation': round(sql / operations, 1) if operations else None,
+        'sql_by_label': sql_by_label,
+        'api_calls': sum(api_calls.values()),
+        'api_calls_by_method': dict(api_calls),
+        # Включая подготовку данных: до начала замера вызовов API нет
+        'retry_after': h.fake.retry_after_count,
+        'errors': h.errors,
+        **result,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(report: Dict, baseline: Dict):
+    """Изменение ключевых метрик относительно прошлого запуска"""
+    print(f"\nСравнение с {baseline.get('started_at')} ({baseline.get('revision')}):")
+    if baseline.get('params') != report['params']:
+        print(f"  Параметры отличаются: {baseline.get('params')} -> {report['params']}")
+    for name, result in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        changes = []
+        for label, key in (('throughput', ('throughput_per_s',)), ('p99', ('latency_ms', 'p99')),
+                           ('sql', ('sql_statements',)), ('api', ('api_calls',))):
+            new, old = result, previous
+            for part in key:
+                new, old = new.get(part), old.get(part)
+            if new is None or not old:
+                continue
+            changes.append(f"{label} {old} -> {new} ({(new - old) / old:+.0%})")
+        print(f"  {name:<14} " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочные сценарии бота")
+    parser.add_argument('--users', type=int, default=200, help="подписчиков в каждом сценарии")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка Bot API, секунды")
+    parser.add_argument('--only', nargs='+', choices=list(SCENARIOS), help="запустить только эти сценарии")
+    parser.add_argument('--out', help="файл для результатов в JSON")
+    parser.add_argument('--baseline', help="JSON прошлого запуска для сравнения")
+    args = parser.parse_args()
+
+    # Уведомления об изменениях состава объединяются на время сценария, а не на секунды
+    BROADCAST_SETTINGS['ROSTER_UPDATE_WINDOW'] = 1
+    JOIN_RUSH_SETTINGS['ROSTER_UPDATE_WINDOW'] = 1
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'params': {'users': args.users, 'latency': args.latency},
+        'scenarios': {},
+    }
+    for name in args.only or SCENARIOS:
+        result = asyncio.run(run_scenario(name, args.users, args.latency))
+        report['scenarios'][name] = result
+        latency = result['latency_ms']
+        print(f"{name:<14} {result['operations']:>5} оп. за {result['duration_s']:>7.2f} с "
+              f"({result['throughput_per_s']}/с), p50 {latency['p50']} мс, p99 {latency['p99']} мс, "
+              f"SQL {result['sql_statements']}, API {result['api_calls']}, "
+              f"RetryAfter {result['retry_after']}, ошибок {result['errors']}")
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"suite-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == '__main__':
+    # Журнал бота (уровень INFO) исказил бы замер
+    logging.disable(logging.INFO)
+    main()
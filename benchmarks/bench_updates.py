@@ -0,0 +1,116 @@
+"""Задержка обработки обновлений: последовательный процессор PTB против KeyedUpdateProcessor.
+
+Настоящее приложение бота (обработчики, persistence, база SQLite во
+временном каталоге) получает 1000 синтетических нажатий «Иду на тренировку!»
+от разных пользователей. Bot API заменен FakeRequest с сетевой задержкой,
+лимиты Telegram отключены - измеряется только обработка. Для каждого
+обновления считается время от постановки в очередь до конца обработки,
+и проверяется, что места в списке распределены в порядке нажатий.
+Третий прогон - в режиме наплыва после анонса (JoinQueue): записи пачками,
+один ответ пользователю.
+
+    python -m benchmarks.bench_updates [обновлений] [задержка_с]
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from telegram import Update
+from telegram.ext import ExtBot, TypeHandler
+
+from benchmarks.fake_bot import FakeBot, FakeRequest
+from config.settings import BROADCAST_SETTINGS
+
+FIRST_USER_ID = 100_000
+
+
+def make_update(update_id: int, telegram_id: int, bot) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': telegram_id, 'type': 'private'},
+            'from': {'id': telegram_id, 'is_bot': False, 'first_name': f'Игрок {update_id}'},
+            'text': 'Иду на тренировку!',
+        },
+    }, bot)
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run(concurrency: int, updates: int, latency: float, rush: bool = False) -> dict:
+    from main import VolleyballBot
+
+    os.environ['UPDATE_CONCURRENCY'] = str(concurrency)
+    fake = FakeBot(latency=latency, global_rate=None, per_chat_rate=None)
+    bot = VolleyballBot(bot=ExtBot('0:bench', request=FakeRequest(fake)))
+    bot.setup_handlers()
+    application = bot.application
+    event_id = bot.db.create_event('Тренировка', date.today() + timedelta(days=1), '20:00')
+    if rush:
+        bot.event_service.join_queue.start_rush(event_id)
+
+    queued_at = {}
+    latencies = []
+    done = asyncio.Event()
+
+    async def finished(update: Update, context):
+        latencies.append(time.monotonic() - queued_at[update.update_id])
+        if len(latencies) == updates:
+            done.set()
+
+    # Последняя группа: выполняется после всех обработчиков обновления
+    application.add_handler(TypeHandler(Update, finished), group=100)
+
+    await application.initialize()
+    await application.start()
+    started = time.monotonic()
+    for i in range(updates):
+        queued_at[i + 1] = time.monotonic()
+        await application.update_queue.put(make_update(i + 1, FIRST_USER_ID + i, application.bot))
+    await done.wait()
+    duration = time.monotonic() - started
+    await application.stop()
+    await application.shutdown()
+
+    participants = bot.db.get_event_participants(event_id)
+    joined = [p['telegram_id'] for p in sorted(participants, key=lambda p: p['position'])]
+    bot.async_db.close()
+    bot.db.close()
+    return {
+        'duration': round(duration, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'joined': len(joined),
+        'fifo': joined == sorted(joined),
+        'api_calls': fake.count(),
+        'batches': bot.event_service.join_queue.get_stats()['batches'],
+    }
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    # Уведомления об изменениях состава не должны попасть в замер
+    BROADCAST_SETTINGS['ROSTER_UPDATE_WINDOW'] = 3600
+    with tempfile.TemporaryDirectory() as tmp:
+        scenarios = (('последовательно', 1, False), ('KeyedUpdateProcessor', 256, False),
+                     ('+ режим наплыва', 256, True))
+        for index, (name, concurrency, rush) in enumerate(scenarios):
+            os.environ['DATABASE_PATH'] = os.path.join(tmp, f'bench_{index}.db')
+            result = asyncio.run(run(concurrency, updates, latency, rush))
+            print(f"{name:<22} {updates} обновлений: {result}")
+
+
+if __name__ == '__main__':
+    # Журнал бота (уровень INFO) исказил бы замер
+    logging.disable(logging.INFO)
+    main()
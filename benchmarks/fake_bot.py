@@ -0,0 +1,116 @@
+"""Локальная замена telegram.Bot для бенчмарков.
+
+Записывает все вызовы, имитирует сетевую задержку и лимиты Telegram:
+при превышении глобального лимита или лимита на чат выбрасывает
+RetryAfter, для заблокировавших бота чатов - Forbidden.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import Iterable, Optional
+
+from telegram.error import Forbidden, RetryAfter
+from telegram.request import BaseRequest
+
+# Методы Bot API, которые возвращают сообщение
+_MESSAGE_METHODS = {'sendMessage', 'editMessageText'}
+
+
+class FakeBot:
+    def __init__(self, latency: float = 0.05, global_rate: Optional[int] = 30,
+                 per_chat_rate: Optional[int] = 1, blocked: Iterable[int] = ()):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.blocked = set(blocked)
+        self.calls = []
+        # Момент каждого успешного вызова (time.monotonic), параллельно calls
+        self.call_times = []
+        self.retry_after_count = 0
+        self._message_ids = itertools.count(1)
+        self._global_window = deque()
+        self._chat_windows = defaultdict(deque)
+
+    def _check_limits(self, chat_id: int):
+        now = time.monotonic()
+        window = self._global_window
+        while window and now - window[0] >= 1:
+            window.popleft()
+        chat_window = self._chat_windows[chat_id]
+        while chat_window and now - chat_window[0] >= 1:
+            chat_window.popleft()
+        if (self.global_rate and len(window) >= self.global_rate) or \
+                (self.per_chat_rate and len(chat_window) >= self.per_chat_rate):
+            self.retry_after_count += 1
+            raise RetryAfter(1)
+        window.append(now)
+        chat_window.append(now)
+
+    async def _call(self, method: str, chat_id: int, **kwargs):
+        self._check_limits(chat_id)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        self.calls.append((method, chat_id, kwargs))
+        self.call_times.append(time.monotonic())
+        return SimpleNamespace(message_id=next(self._message_ids), chat_id=chat_id, text=kwargs.get('text'))
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        return await self._call('send_message', chat_id, text=text, **kwargs)
+
+    async def edit_message_text(self, text: str, chat_id: Optional[int] = None, message_id: Optional[int] = None, **kwargs):
+        return await self._call('edit_message_text', chat_id, text=text, message_id=message_id, **kwargs)
+
+    async def answer_callback_query(self, callback_query_id: str, **kwargs):
+        self.calls.append(('answer_callback_query', None, kwargs))
+        self.call_times.append(time.monotonic())
+        return True
+
+    def count(self, method: Optional[str] = None) -> int:
+        """Число успешных вызовов (всех или конкретного метода)"""
+        return sum(1 for call in self.calls if method is None or call[0] == method)
+
+
+class FakeRequest(BaseRequest):
+    """Сетевой слой telegram.Bot поверх FakeBot.
+
+    Позволяет запускать настоящее приложение PTB (обработчики, процессор
+    обновлений, persistence) без сети: ``ExtBot(token, request=FakeRequest(fake))``.
+    Вызовы, задержка и лимиты - как у переданного FakeBot.
+    """
+
+    BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Бот', 'username': 'volleyball_bench_bot'}
+
+    def __init__(self, fake: FakeBot):
+        self.fake = fake
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = {key: json.loads(value) if value.startswith(('{', '[', '"')) or value.lstrip('-').isdigit()
+                  else value
+                  for key, value in (request_data.json_parameters if request_data else {}).items()}
+        if api_method == 'getMe':
+            result = self.BOT_USER
+        else:
+            chat_id = params.pop('chat_id', None)
+            message = await self.fake._call(api_method, chat_id, **params)
+            result = True
+            if api_method in _MESSAGE_METHODS:
+                result = {'message_id': message.message_id, 'date': int(time.time()),
+                          'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text')}
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
@@ -1,4 +1,4 @@
-# Настройки бота
+# Настройки бота по умолчанию (действующие значения - в таблице bot_settings, см. data/settings_store.py)
 BOT_SETTINGS = {
     'MAX_PARTICIPANTS': 18,
     'TRAINING_DAYS': ['thursday', 'sunday'],
@@ -11,6 +11,32 @@ BOT_SETTINGS = {
     'EVENT_CLEANUP_TIME': '21:59'  # Удаление события
 }
 
+# Лимиты рассылок (Telegram: ~30 сообщений в секунду всего, 1 в секунду в один чат)
+BROADCAST_SETTINGS = {
+    'RATE': 25,  # Сообщений в секунду, с запасом до лимита Telegram
+    'BURST': 5,  # Сколько сообщений можно отправить разом после простоя
+    'PER_CHAT_INTERVAL': 1.0,  # Минимальный интервал между сообщениями в один чат, секунды
+    'CONCURRENCY': 8,  # Одновременных запросов к Telegram
+    'MAX_RETRIES': 3,  # Повторов при flood wait и сетевых ошибках
+    'BACKOFF_BASE': 0.5,  # Начальная задержка повтора, секунды
+    'REMINDER_RETRY_DELAY': 60,  # Через сколько секунд повторить неотправленные напоминания
+    'ROSTER_UPDATE_WINDOW': 5,  # За сколько секунд изменения состава объединяются в одно уведомление
+    'ROSTER_LOG_LINES': 30,  # Сколько последних изменений состава показывает живое сообщение
+    'OUTBOX_BATCH': 50,  # Сколько сообщений очереди отправляется за один проход
+    'OUTBOX_MAX_ATTEMPTS': 8,  # После стольких неудачных попыток сообщение уходит в dead-letter
+    'OUTBOX_BACKOFF_BASE': 5,  # Начальная задержка повтора сообщения из очереди, секунды
+    'OUTBOX_POLL_INTERVAL': 2,  # Как часто проверять очередь на сообщения для повтора, секунды
+    'OUTBOX_LEASE': 120  # Через сколько секунд забранное, но не отправленное сообщение вернется в очередь
+}
+
+# Режим наплыва записей в первые минуты после анонса события
+JOIN_RUSH_SETTINGS = {
+    'DURATION': 600,  # Сколько секунд после анонса действует режим
+    'BATCH_SIZE': 50,  # Максимум записей в одной транзакции
+    'BATCH_DELAY': 0.05,  # Сколько секунд копятся записи перед записью в базу
+    'ROSTER_UPDATE_WINDOW': 30  # Окно объединения уведомлений об изменениях состава в этом режиме, секунды
+}
+
 # Администраторы (Telegram ID)
 # ВАЖНО: Добавьте сюда свой Telegram ID для доступа к админ-функциям
 # Чтобы узнать свой ID, напишите боту @userinfobot
@@ -0,0 +1,64 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from data.database import Database
+
+logger = logging.getLogger(__name__)
+
+_shared = weakref.WeakKeyDictionary()
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над ``Database``.
+
+    Запросы выполняются на выделенных потоках-исполнителях, поэтому
+    медленный ``commit`` не блокирует цикл событий и обработку
+    следующих обновлений. Любой метод ``Database`` доступен как корутина:
+    ``await async_db.get_subscribed_users()``.
+    """
+
+    def __init__(self, database: Database, max_workers: int = 0):
+        self.db = database
+        if max_workers <= 0:
+            max_workers = int(os.getenv('DATABASE_WORKERS', '2'))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+
+    @classmethod
+    def shared(cls, database: Database) -> 'AsyncDatabase':
+        """Получить общий фасад для данного экземпляра ``Database``"""
+        async_db = _shared.get(database)
+        if async_db is None:
+            async_db = cls(database)
+            _shared[database] = async_db
+        return async_db
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Выполнить синхронную функцию в потоке базы данных.
+
+        Контекст (метка обработчика для статистики запросов) переходит в поток вместе с вызовом.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, func, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        method.__name__ = name
+        return method
+
+    def close(self):
+        """Дождаться завершения запросов и остановить потоки"""
+        self._executor.shutdown(wait=True)
+        logger.info("Потоки асинхронной базы данных остановлены")
@@ -0,0 +1,326 @@
+import functools
+import importlib.util
+import logging
+import os
+import re
+import sqlite3
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Профили хранения SQLite: PRAGMA, применяемые к каждому новому соединению.
+# legacy   - журнал отката и полная синхронизация (поведение SQLite по умолчанию)
+# balanced - WAL: читатели не ждут писателей, fsync только при checkpoint
+# durable  - WAL с fsync на каждый commit
+STORAGE_PROFILES = {
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'temp_store': 'MEMORY',
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,  # ~16 МБ
+        'mmap_size': 64 * 1024 * 1024,
+        'busy_timeout': 5000,
+        'temp_store': 'MEMORY',
+    },
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024,
+        'busy_timeout': 5000,
+        'temp_store': 'MEMORY',
+    },
+}
+DEFAULT_STORAGE_PROFILE = 'balanced'
+
+# UPDATE ... FROM появился в SQLite 3.33, без него пересчеты идут через executemany
+SUPPORTS_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+
+class StorageBackend:
+    """Интерфейс хранилища для ``Database``.
+
+    SQL в ``Database`` пишется в переносимом виде с плейсхолдерами ``?``;
+    бэкенд открывает и настраивает соединения, начинает транзакции и
+    отвечает за то, что в разных СУБД выражается по-разному: получение ID
+    вставленной строки, блокировку строк и выдачу позиций в очереди.
+    """
+
+    name = ''
+    # Нужна ли явная блокировка строки события (SELECT ... FOR UPDATE)
+    # перед изменением состава
+    row_locks = False
+    supports_update_from = True
+
+    def connect(self):
+        """Открыть новое соединение для пула"""
+        raise NotImplementedError
+
+    def configure(self, conn):
+        """Настроить новое соединение (один раз за его жизнь)"""
+
+    def ping(self, conn):
+        """Проверить, что соединение живо"""
+        conn.execute('SELECT 1').fetchone()
+
+    def begin(self, conn):
+        """Начать транзакцию с блокировкой записи"""
+        raise NotImplementedError
+
+    def init_schema(self, cursor):
+        """Создать объекты схемы, специфичные для бэкенда"""
+
+    def insert(self, cursor, sql: str, params: tuple) -> Optional[int]:
+        """Выполнить INSERT и вернуть id новой строки"""
+        raise NotImplementedError
+
+    def next_position_sql(self, event_id_sql: str) -> str:
+        """SQL-выражение для позиции нового участника в очереди события"""
+        return f'(SELECT COALESCE(MAX(position), 0) + 1 FROM participants WHERE event_id = {event_id_sql})'
+
+    def checkpoint(self, conn) -> Optional[Dict]:
+        """Служебное обслуживание журнала (если бэкенд его поддерживает)"""
+        return None
+
+    def explain(self, cursor, sql: str, params) -> str:
+        """План выполнения запроса (для журнала медленных запросов)"""
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return "\n".join(str(row[0]) for row in cursor.fetchall())
+
+    def describe(self) -> str:
+        """Описание бэкенда для логов"""
+        return self.name
+
+
+class SQLiteBackend(StorageBackend):
+    """SQLite: файл базы, профили PRAGMA, BEGIN IMMEDIATE для записи"""
+
+    name = 'sqlite'
+    supports_update_from = SUPPORTS_UPDATE_FROM
+
+    def __init__(self, db_path: str, profile: Optional[str] = None):
+        if profile is None:
+            profile = os.getenv('DATABASE_PROFILE', DEFAULT_STORAGE_PROFILE)
+        if profile not in STORAGE_PROFILES:
+            logger.warning(f"Неизвестный профиль хранения {profile}, используется {DEFAULT_STORAGE_PROFILE}")
+            profile = DEFAULT_STORAGE_PROFILE
+
+        # Создаем директорию для базы данных, если её нет
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+            logger.info(f"Создана директория для базы данных: {db_dir}")
+
+        self.db_path = db_path
+        self.profile = profile
+        self.pragmas = STORAGE_PROFILES[profile]
+
+    def connect(self) -> sqlite3.Connection:
+        # Соединение может переходить между потоками, но пул гарантирует,
+        # что в каждый момент им пользуется только один поток
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def configure(self, conn: sqlite3.Connection):
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+
+    def begin(self, conn: sqlite3.Connection):
+        # Блокировка записи берется сразу, а не при первой записи
+        conn.execute('BEGIN IMMEDIATE')
+
+    def insert(self, cursor, sql: str, params: tuple) -> Optional[int]:
+        cursor.execute(sql, params)
+        # При INSERT ... SELECT без строк lastrowid остался бы от прошлой вставки
+        return cursor.lastrowid if cursor.rowcount > 0 else None
+
+    def checkpoint(self, conn) -> Optional[Dict]:
+        if self.pragmas.get('journal_mode') != 'WAL':
+            return None
+        busy, log_pages, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        return {'busy': busy, 'log_pages': log_pages, 'checkpointed': checkpointed}
+
+    def explain(self, cursor, sql: str, params) -> str:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        # Строки плана: id, parent, notused, detail
+        return "; ".join(row[-1] for row in cursor.fetchall())
+
+    def describe(self) -> str:
+        return f"sqlite ({self.db_path}, профиль {self.profile})"
+
+
+# Сравнение с учетом NULL: в SQLite - IS NOT, в PostgreSQL - IS DISTINCT FROM
+_IS_NOT_RE = re.compile(r'\bIS NOT\b(?!\s+(?:NULL|TRUE|FALSE|DISTINCT)\b)')
+
+
+# Строковые литералы, идентификаторы в кавычках и комментарии: внутри них ? - не плейсхолдер
+_QUOTED_RE = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|--[^\n]*|/\*.*?\*/)""", re.S)
+
+
+def _translate_code(sql: str) -> str:
+    sql = sql.replace('%', '%%').replace('?', '%s')
+    sql = _IS_NOT_RE.sub('IS DISTINCT FROM', sql)
+    return sql.replace('INTEGER PRIMARY KEY AUTOINCREMENT', 'BIGSERIAL PRIMARY KEY')
+
+
+@functools.lru_cache(maxsize=512)
+def translate_sql(sql: str) -> str:
+    """Перевести переносимый SQL (плейсхолдеры ?, диалект SQLite) в диалект PostgreSQL.
+
+    ``?`` заменяется на ``%s`` только вне литералов и комментариев; ``%``
+    удваивается везде, потому что psycopg2 подставляет параметры во весь текст запроса.
+    """
+    parts = _QUOTED_RE.split(sql)
+    # После split с группой нечетные части - литералы и комментарии
+    return ''.join(
+        part.replace('%', '%%') if index % 2 else _translate_code(part)
+        for index, part in enumerate(parts)
+    )
+
+
+class _PostgresCursor:
+    """Курсор psycopg2 с интерфейсом курсора sqlite3 (плейсхолдеры ?)"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql: str, params=()):
+        self._cursor.execute(translate_sql(sql), tuple(params))
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        self._cursor.executemany(translate_sql(sql), [tuple(params) for params in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+
+class _PostgresConnection:
+    """Соединение psycopg2 с интерфейсом соединения sqlite3"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self) -> _PostgresCursor:
+        return _PostgresCursor(self._conn.cursor())
+
+    def execute(self, sql: str, params=()) -> _PostgresCursor:
+        return self.cursor().execute(sql, params)
+
+    @property
+    def in_transaction(self) -> bool:
+        from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+        return self._conn.info.transaction_status != TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def _time_as_text(value: Optional[str], cursor) -> Optional[str]:
+    if value is not None and len(value) == 8 and value.endswith(':00'):
+        return value[:5]
+    return value
+
+
+class PostgresBackend(StorageBackend):
+    """PostgreSQL через psycopg2.
+
+    Составы событий меняются под блокировкой строки события
+    (SELECT ... FOR UPDATE), позиции в очереди выдает последовательность
+    ``participants_position_seq``. Даты и время возвращаются строками,
+    как в SQLite, чтобы остальной код не зависел от бэкенда.
+    """
+
+    name = 'postgresql'
+    row_locks = True
+
+    def __init__(self, dsn: str):
+        if importlib.util.find_spec('psycopg2') is None:
+            raise RuntimeError("Для DATABASE_URL с PostgreSQL нужен пакет psycopg2-binary")
+        self.dsn = dsn
+
+    def connect(self) -> _PostgresConnection:
+        import psycopg2
+        return _PostgresConnection(psycopg2.connect(self.dsn))
+
+    def configure(self, conn: _PostgresConnection):
+        from psycopg2.extensions import new_type, register_type
+        # DATE и TIMESTAMP - строками, как их возвращает sqlite3
+        register_type(new_type((1082, 1114), 'TEXT_DATETIME', lambda value, cursor: value), conn._conn)
+        # TIME - в том виде, в котором его записывает бот (HH:MM)
+        register_type(new_type((1083,), 'TEXT_TIME', _time_as_text), conn._conn)
+
+    def begin(self, conn: _PostgresConnection):
+        # psycopg2 открывает транзакцию сам при первом запросе,
+        # блокировки берутся явно через SELECT ... FOR UPDATE
+        pass
+
+    def init_schema(self, cursor):
+        cursor.execute('CREATE SEQUENCE IF NOT EXISTS participants_position_seq')
+
+    def insert(self, cursor, sql: str, params: tuple) -> Optional[int]:
+        cursor.execute(f'{sql.rstrip()} RETURNING id', params)
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def next_position_sql(self, event_id_sql: str) -> str:
+        return "nextval('participants_position_seq')"
+
+    def explain(self, cursor, sql: str, params) -> str:
+        # Ошибка EXPLAIN не должна прерывать транзакцию, в которой выполнялся запрос
+        cursor.execute('SAVEPOINT explain_plan')
+        try:
+            plan = super().explain(cursor, sql, params)
+        except Exception:
+            cursor.execute('ROLLBACK TO SAVEPOINT explain_plan')
+            raise
+        cursor.execute('RELEASE SAVEPOINT explain_plan')
+        return plan
+
+    def describe(self) -> str:
+        parsed = urlparse(self.dsn)
+        return f"postgresql ({parsed.hostname or 'localhost'}{parsed.path})"
+
+
+def create_backend(database_url: Optional[str] = None, db_path: Optional[str] = None,
+                   profile: Optional[str] = None) -> StorageBackend:
+    """Выбрать бэкенд по DATABASE_URL.
+
+    postgres:// и postgresql:// - PostgreSQL, sqlite:///путь - SQLite по пути,
+    без DATABASE_URL - SQLite по DATABASE_PATH.
+    """
+    if database_url is None and db_path is None:
+        database_url = os.getenv('DATABASE_URL')
+    if database_url:
+        scheme = urlparse(database_url).scheme
+        if scheme in ('postgres', 'postgresql'):
+            return PostgresBackend(database_url)
+        if scheme == 'sqlite':
+            return SQLiteBackend(database_url[len('sqlite:///'):], profile)
+        raise ValueError(f"Неподдерживаемый DATABASE_URL: {scheme}://...")
+    if db_path is None:
+        db_path = os.getenv('DATABASE_PATH', '/data/volleyball_bot.db')
+    return SQLiteBackend(db_path, profile)
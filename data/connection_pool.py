@@ -0,0 +1,184 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolClosedError(Exception):
+    """Пул уже закрыт, новые соединения не выдаются"""
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось дождаться свободного соединения"""
+
+
+class ConnectionPool:
+    """Ограниченный пул долгоживущих соединений с базой данных.
+
+    Соединения создаются лениво через ``connect`` (до ``max_size`` штук),
+    при создании один раз настраиваются через ``on_connect`` и затем
+    переиспользуются. Повторный захват в том же потоке возвращает уже
+    выданное соединение, поэтому вложенные вызовы методов ``Database``
+    работают в одной транзакции и не могут исчерпать пул.
+    """
+
+    def __init__(self, connect: Callable, max_size: int = 4, timeout: float = 30.0,
+                 on_connect: Optional[Callable] = None, ping: Optional[Callable] = None,
+                 health_check_interval: float = 60.0):
+        self._connect = connect
+        self._on_connect = on_connect
+        self._ping = ping
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = queue.LifoQueue()
+        self._all = set()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'reentrant': 0,
+            'health_check_failures': 0,
+        }
+
+    def _create(self):
+        conn = self._connect()
+        if self._on_connect:
+            self._on_connect(conn)
+        return conn
+
+    def _is_healthy(self, conn) -> bool:
+        if self._ping is None:
+            return True
+        try:
+            self._ping(conn)
+            return True
+        except Exception as e:
+            logger.warning(f"Соединение с базой данных не прошло проверку: {e}")
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            if conn in self._all:
+                self._all.discard(conn)
+                self._size -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _acquire(self):
+        """Взять соединение из пула, при необходимости создав или дождавшись его"""
+        if self._closed:
+            raise PoolClosedError("Пул соединений закрыт")
+
+        try:
+            conn, released_at = self._idle.get_nowait()
+            with self._lock:
+                self._stats['hits'] += 1
+        except queue.Empty:
+            with self._lock:
+                can_create = self._size < self.max_size
+                if can_create:
+                    self._size += 1
+                    self._stats['misses'] += 1
+            if can_create:
+                try:
+                    conn = self._create()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                    raise
+                with self._lock:
+                    self._all.add(conn)
+                return conn
+
+            started = time.monotonic()
+            try:
+                conn, released_at = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolTimeoutError(f"Нет свободных соединений за {self.timeout} с")
+            with self._lock:
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += time.monotonic() - started
+
+        if time.monotonic() - released_at >= self.health_check_interval and not self._is_healthy(conn):
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+            self._discard(conn)
+            return self._acquire()
+        return conn
+
+    def _release(self, conn):
+        if self._closed:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def holds_connection(self) -> bool:
+        """Держит ли текущий поток соединение из пула"""
+        return getattr(self._local, 'conn', None) is not None
+
+    @contextmanager
+    def connection(self):
+        """Захватить соединение на время блока ``with``.
+
+        На выходе из внешнего блока незавершенная транзакция фиксируется
+        (или откатывается при исключении), а соединение возвращается в пул.
+        """
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            with self._lock:
+                self._stats['reentrant'] += 1
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def stats(self) -> Dict:
+        """Счетчики пула: попадания, ожидания, размер"""
+        with self._lock:
+            result = dict(self._stats)
+            result['size'] = self._size
+        result['idle'] = self._idle.qsize()
+        result['max_size'] = self.max_size
+        return result
+
+    def close(self):
+        """Закрыть все соединения и запретить выдачу новых"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        with self._lock:
+            in_use = len(self._all)
+        if in_use:
+            logger.warning(f"При закрытии пула заняты {in_use} соединений, они будут закрыты при возврате")
+        logger.info("Пул соединений с базой данных закрыт")
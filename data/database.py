@@ -1,30 +1,169 @@
-import sqlite3
 import logging
 import os
-from datetime import datetime, date
-from typing import List, Dict, Optional
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+from typing import List, Dict, Optional, Set, Tuple
+from data.backends import StorageBackend, create_backend
+from data.connection_pool import ConnectionPool
+from data.migrations import run_migrations
+from data.query_stats import InstrumentedConnection, QueryStats
 from utils.timezone_utils import get_now_with_timezone
 
 logger = logging.getLogger(__name__)
 
 class Database:
-    def __init__(self, db_path: Optional[str] = None):
-        # Используем переменную окружения или путь по умолчанию
-        if db_path is None:
-            db_path = os.getenv('DATABASE_PATH', '/data/volleyball_bot.db')
-        
-        # Создаем директорию для базы данных, если её нет
-        db_dir = os.path.dirname(db_path)
-        if db_dir and not os.path.exists(db_dir):
-            os.makedirs(db_dir, exist_ok=True)
-            logger.info(f"Создана директория для базы данных: {db_dir}")
-        
-        self.db_path = db_path
+    def __init__(self, db_path: Optional[str] = None, profile: Optional[str] = None,
+                 backend: Optional[StorageBackend] = None):
+        # Бэкенд выбирается по DATABASE_URL, без него - SQLite по DATABASE_PATH
+        if backend is None:
+            backend = create_backend(db_path=db_path, profile=profile)
+        self.backend = backend
+        self.db_path = getattr(backend, 'db_path', None)
+        self.profile = getattr(backend, 'profile', None)
+        # Версии составов событий: меняются после каждой записи, влияющей на список участников.
+        # По ним кэши (например, отрисованный список) понимают, что данные устарели.
+        self._roster_versions: Dict[int, int] = {}
+        self._roster_generation = 0
+        self._events_version = 0
+        self._roster_lock = threading.Lock()
+        self._pending_roster_changes = threading.local()
+        # Открыта ли transaction() в текущем потоке: psycopg2 начинает транзакцию только
+        # с первым запросом, поэтому in_transaction сразу после begin еще False
+        self._open_transaction = threading.local()
+        # Время, строки и соединения каждого запроса по обработчикам (DATABASE_QUERY_STATS=0 - выключить)
+        self.query_stats = None
+        if os.getenv('DATABASE_QUERY_STATS', '1') == '1':
+            self.query_stats = QueryStats(slow_query_ms=float(os.getenv('DATABASE_SLOW_QUERY_MS', '100')))
+        self.pool = ConnectionPool(
+            connect=self._connect,
+            max_size=int(os.getenv('DATABASE_POOL_SIZE', '4')),
+            ping=backend.ping
+        )
         self.init_database()
+        logger.info(f"Хранилище базы данных: {backend.describe()}")
+    
+    def checkpoint(self) -> Optional[Dict]:
+        """Перенести WAL в основной файл базы и обрезать журнал (только SQLite в режиме WAL)"""
+        with self.get_connection() as conn:
+            return self.backend.checkpoint(conn)
     
+    def _connect(self):
+        """Новое соединение для пула: настроенное бэкендом и, если включено, с замером запросов"""
+        conn = self.backend.connect()
+        self.backend.configure(conn)
+        if self.query_stats is None:
+            return conn
+        return InstrumentedConnection(conn, self.query_stats, self.backend.explain)
+    
+    @contextmanager
     def get_connection(self):
-        """Получить соединение с базой данных"""
-        return sqlite3.connect(self.db_path)
+        """Получить соединение с базой данных из пула.
+
+        Методы внутри блока не вызывают commit сами: изменения фиксируются при
+        выходе из внешнего блока (или внешней ``transaction()``), поэтому вложенные
+        вызовы атомарны вместе с ней.
+        """
+        outermost = not self.pool.holds_connection()
+        if outermost and self.query_stats is not None:
+            self.query_stats.record_connection()
+        try:
+            with self.pool.connection() as conn:
+                yield conn
+        finally:
+            if outermost:
+                self._publish_roster_changes()
+    
+    def _roster_changed(self, event_id: Optional[int] = None):
+        """Отметить изменение состава события (None - могли измениться все составы).
+
+        Версия меняется только после выхода из внешнего блока соединения, то есть
+        после commit: иначе кэш мог бы сохранить незафиксированное состояние
+        под новой версией.
+        """
+        pending = getattr(self._pending_roster_changes, 'events', None)
+        if pending is None:
+            pending = self._pending_roster_changes.events = set()
+        pending.add(event_id)
+    
+    def _events_changed(self):
+        """Отметить изменение таблицы событий (создание, удаление, лимит).
+
+        Как и версия состава, публикуется после выхода из внешнего блока соединения.
+        """
+        self._pending_roster_changes.events_table = True
+    
+    def _publish_roster_changes(self):
+        pending = getattr(self._pending_roster_changes, 'events', None)
+        events_table = getattr(self._pending_roster_changes, 'events_table', False)
+        if not pending and not events_table:
+            return
+        self._pending_roster_changes.events = None
+        self._pending_roster_changes.events_table = False
+        with self._roster_lock:
+            if events_table:
+                self._events_version += 1
+            for event_id in pending or ():
+                if event_id is None:
+                    self._roster_generation += 1
+                else:
+                    self._roster_versions[event_id] = self._roster_versions.get(event_id, 0) + 1
+    
+    def get_roster_version(self, event_id: int) -> tuple:
+        """Получить версию состава события для проверки актуальности кэшей"""
+        with self._roster_lock:
+            return (self._roster_generation, self._roster_versions.get(event_id, 0))
+    
+    def get_events_version(self) -> int:
+        """Получить версию таблицы событий для проверки актуальности кэшей"""
+        with self._roster_lock:
+            return self._events_version
+    
+    @contextmanager
+    def transaction(self):
+        """Транзакция с блокировкой записи с самого начала (BEGIN IMMEDIATE в SQLite).
+
+        Внутри уже открытой транзакции того же потока просто присоединяется к ней.
+        """
+        with self.get_connection() as conn:
+            started = not conn.in_transaction and not getattr(self._open_transaction, 'active', False)
+            if started:
+                self.backend.begin(conn)
+                self._open_transaction.active = True
+            try:
+                yield conn
+                if started:
+                    conn.commit()
+            except BaseException:
+                if started:
+                    conn.rollback()
+                raise
+            finally:
+                if started:
+                    self._open_transaction.active = False
+    
+    def _lock_roster(self, cursor, event_id: int):
+        """Заблокировать строку события до конца транзакции, чтобы изменения состава шли по очереди.
+
+        В SQLite запись уже заблокирована BEGIN IMMEDIATE, в PostgreSQL
+        берется SELECT ... FOR UPDATE.
+        """
+        if self.backend.row_locks:
+            cursor.execute('SELECT id FROM events WHERE id = ? FOR UPDATE', (event_id,))
+    
+    def get_query_stats(self) -> Optional[Dict]:
+        """Запросы, время, строки и соединения по обработчикам; последние медленные запросы"""
+        return self.query_stats.snapshot() if self.query_stats is not None else None
+    
+    def get_pool_stats(self) -> Dict:
+        """Получить счетчики пула соединений"""
+        return self.pool.stats()
+    
+    def close(self):
+        """Закрыть все соединения с базой данных"""
+        logger.info(f"Статистика пула соединений: {self.get_pool_stats()}")
+        self.pool.close()
     
     def init_database(self):
         """Инициализация базы данных"""
@@ -48,7 +187,7 @@ class Database:
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS users (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    telegram_id INTEGER UNIQUE NOT NULL,
+                    telegram_id BIGINT UNIQUE NOT NULL,
                     username TEXT,
                     first_name TEXT,
                     last_name TEXT,
@@ -87,12 +226,19 @@ class Database:
             
             # Инициализируем настройки по умолчанию
             cursor.execute('''
-                INSERT OR IGNORE INTO bot_settings (setting_key, setting_value) 
+                INSERT INTO bot_settings (setting_key, setting_value) 
                 VALUES ('participant_limit', '18')
+                ON CONFLICT (setting_key) DO NOTHING
             ''')
             
+            # Объекты схемы, специфичные для бэкенда (последовательности и т.п.)
+            self.backend.init_schema(cursor)
+            
             conn.commit()
-            logger.info("База данных инициализирована")
+            
+            # Применяем версионные миграции схемы (индексы и ограничения)
+            schema_version = run_migrations(conn)
+            logger.info(f"База данных инициализирована, версия схемы: {schema_version}")
             
             # Очищаем фейковых пользователей при инициализации
             self._cleanup_fake_users()
@@ -102,7 +248,11 @@ class Database:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            # Удаляем фейковых пользователей
+            # Удаляем фейковых пользователей вместе с их записями на события
+            cursor.execute('''
+                DELETE FROM participants
+                WHERE user_id IN (SELECT id FROM users WHERE telegram_id IN (24, 26))
+            ''')
             cursor.execute('DELETE FROM users WHERE telegram_id IN (24, 26)')
             deleted_count = cursor.rowcount
             
@@ -116,7 +266,7 @@ class Database:
                 for event_id in event_ids:
                     self._reorder_participants(event_id)
                 
-                conn.commit()
+                self._roster_changed()
                 logger.info("Позиции участников пересчитаны после удаления фейковых пользователей")
     
     # Методы для работы с событиями
@@ -124,12 +274,11 @@ class Database:
         """Создать новое событие"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
+            result = self.backend.insert(cursor, '''
                 INSERT INTO events (name, date, time, max_participants)
                 VALUES (?, ?, ?, ?)
             ''', (name, event_date, event_time, max_participants))
-            conn.commit()
-            result = cursor.lastrowid
+            self._events_changed()
             if result is None:
                 raise Exception("Не удалось создать событие")
             return result
@@ -168,9 +317,11 @@ class Database:
         """Удалить событие"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM events WHERE id = ?', (event_id,))
             cursor.execute('DELETE FROM participants WHERE event_id = ?', (event_id,))
-            conn.commit()
+            cursor.execute('DELETE FROM roster_messages WHERE event_id = ?', (event_id,))
+            cursor.execute('DELETE FROM events WHERE id = ?', (event_id,))
+            self._roster_changed(event_id)
+            self._events_changed()
     
     def cleanup_past_events(self):
         """Удалить прошедшие события"""
@@ -187,12 +338,20 @@ class Database:
                 )
             ''', (current_date,))
             
+            cursor.execute('''
+                DELETE FROM roster_messages 
+                WHERE event_id IN (
+                    SELECT id FROM events WHERE date < ?
+                )
+            ''', (current_date,))
+            
             # Затем удаляем сами события
             cursor.execute('''
                 DELETE FROM events 
                 WHERE date < ?
             ''', (current_date,))
-            conn.commit()
+            self._roster_changed()
+            self._events_changed()
     
     # Методы для работы с пользователями
     def add_user(self, telegram_id: int, username: Optional[str] = None, first_name: Optional[str] = None, last_name: Optional[str] = None) -> int:
@@ -214,17 +373,20 @@ class Database:
                         first_name = COALESCE(?, first_name),
                         last_name = COALESCE(?, last_name)
                     WHERE telegram_id = ?
-                ''', (username, first_name, last_name, telegram_id))
-                conn.commit()
+                      AND (COALESCE(?, username) IS NOT username
+                           OR COALESCE(?, first_name) IS NOT first_name
+                           OR COALESCE(?, last_name) IS NOT last_name)
+                ''', (username, first_name, last_name, telegram_id, username, first_name, last_name))
+                if cursor.rowcount > 0:
+                    # Имя отображается в списках участников
+                    self._roster_changed()
                 return existing_user[0]
             else:
                 # Пользователь не существует, создаем нового
-                cursor.execute('''
+                result = self.backend.insert(cursor, '''
                     INSERT INTO users (telegram_id, username, first_name, last_name)
                     VALUES (?, ?, ?, ?)
                 ''', (telegram_id, username, first_name, last_name))
-                conn.commit()
-                result = cursor.lastrowid
                 if result is None:
                     raise Exception("Не удалось добавить пользователя")
                 return result
@@ -251,16 +413,46 @@ class Database:
             cursor.execute('SELECT telegram_id FROM users WHERE subscribed = TRUE')
             return [row[0] for row in cursor.fetchall()]
     
-    def update_user_subscription(self, telegram_id: int, subscribed: bool):
-        """Обновить статус подписки пользователя"""
+    def update_user_subscription(self, telegram_id: int, subscribed: bool, reason: Optional[str] = None):
+        """Обновить статус подписки пользователя (при отписке - с причиной и временем)"""
+        self.update_users_subscription({telegram_id: reason}, subscribed)
+    
+    def update_users_subscription(self, reasons: Dict[int, Optional[str]], subscribed: bool):
+        """Обновить статус подписки нескольких пользователей одним запросом: telegram_id -> причина"""
+        unsubscribed_at = None if subscribed else datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
+            cursor.executemany('''
                 UPDATE users 
-                SET subscribed = ? 
+                SET subscribed = ?, unsubscribed_reason = ?, unsubscribed_at = ?
                 WHERE telegram_id = ?
-            ''', (subscribed, telegram_id))
-            conn.commit()
+            ''', [
+                (subscribed, None if subscribed else reason, unsubscribed_at, telegram_id)
+                for telegram_id, reason in reasons.items()
+            ])
+    
+    def restore_pruned_subscription(self, telegram_id: int) -> bool:
+        """Вернуть подписку пользователю, отписанному из-за недоступности чата"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE users 
+                SET subscribed = TRUE, unsubscribed_reason = NULL, unsubscribed_at = NULL
+                WHERE telegram_id = ? AND unsubscribed_reason IS NOT NULL
+            ''', (telegram_id,))
+            return cursor.rowcount > 0
+    
+    def get_pruned_users_stats(self) -> Dict[str, int]:
+        """Число пользователей, отписанных из-за недоступности чата, по причинам"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT unsubscribed_reason, COUNT(*)
+                FROM users
+                WHERE subscribed = FALSE AND unsubscribed_reason IS NOT NULL
+                GROUP BY unsubscribed_reason
+            ''')
+            return dict(cursor.fetchall())
     
     # Методы для работы с участниками
     def add_participant(self, event_id: int, telegram_id: int, status: str = 'confirmed') -> int:
@@ -270,26 +462,109 @@ class Database:
             raise Exception(f"Пользователь с telegram_id {telegram_id} не найден.")
         user_id = user['id']
 
-        with self.get_connection() as conn:
+        with self.transaction() as conn:
             cursor = conn.cursor()
+            self._lock_roster(cursor, event_id)
             
-            # Получить текущую позицию
-            cursor.execute('''
-                SELECT COUNT(*) FROM participants 
-                WHERE event_id = ?
-            ''', (event_id,))
-            position = cursor.fetchone()[0] + 1
-            
-            cursor.execute('''
+            # Позиция - в конец очереди события
+            result = self.backend.insert(cursor, f'''
                 INSERT INTO participants (event_id, user_id, status, position)
-                VALUES (?, ?, ?, ?)
-            ''', (event_id, user_id, status, position))
-            conn.commit()
-            result = cursor.lastrowid
+                SELECT e.id, ?, ?, {self.backend.next_position_sql('e.id')}
+                FROM events e
+                WHERE e.id = ?
+            ''', (user_id, status, event_id))
+            self._roster_changed(event_id)
             if result is None:
                 raise Exception("Не удалось добавить участника")
             return result
     
+    def join_participant(self, event_id: int, telegram_id: int, username: Optional[str] = None,
+                         first_name: Optional[str] = None, last_name: Optional[str] = None,
+                         confirmed_presence: bool = False) -> Optional[Dict]:
+        """Атомарно записать пользователя на событие.
+
+        В одной транзакции добавляет/обновляет пользователя и вставляет участника,
+        выбирая основной состав или резерв по числу подтвержденных в базе.
+        Возвращает None, если события нет, иначе словарь с полями joined, status,
+        position (номер в очереди события, с 1) и event_date (joined=False -
+        пользователь уже был записан).
+        """
+        results = self.join_participants(
+            event_id, [(telegram_id, username, first_name, last_name, confirmed_presence)]
+        )
+        return results[0] if results is not None else None
+
+    def join_participants(self, event_id: int,
+                          users: List[Tuple[int, Optional[str], Optional[str], Optional[str], bool]]) -> Optional[List[Dict]]:
+        """Записать пачку пользователей на событие одной транзакцией.
+
+        ``users`` - кортежи (telegram_id, username, first_name, last_name,
+        confirmed_presence); места выдаются строго в порядке списка. Возвращает
+        None, если события нет, иначе результаты как у ``join_participant``
+        в том же порядке.
+        """
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            self._lock_roster(cursor, event_id)
+            cursor.execute('SELECT date FROM events WHERE id = ?', (event_id,))
+            event = cursor.fetchone()
+            if not event:
+                return None
+            
+            results = []
+            for telegram_id, username, first_name, last_name, confirmed_presence in users:
+                cursor.execute('''
+                    INSERT INTO users (telegram_id, username, first_name, last_name)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (telegram_id) DO UPDATE
+                    SET username = COALESCE(excluded.username, users.username),
+                        first_name = COALESCE(excluded.first_name, users.first_name),
+                        last_name = COALESCE(excluded.last_name, users.last_name)
+                    WHERE COALESCE(excluded.username, users.username) IS NOT users.username
+                       OR COALESCE(excluded.first_name, users.first_name) IS NOT users.first_name
+                       OR COALESCE(excluded.last_name, users.last_name) IS NOT users.last_name
+                ''', (telegram_id, username, first_name, last_name))
+                if cursor.rowcount > 0:
+                    # Новый пользователь или изменилось имя, которое видно в списках
+                    self._roster_changed()
+                
+                # Статус и позиция вычисляются в том же запросе, что и вставка
+                cursor.execute(f'''
+                    INSERT INTO participants (event_id, user_id, status, position, confirmed_presence)
+                    SELECT e.id, u.id,
+                           CASE WHEN (SELECT COUNT(*) FROM participants
+                                      WHERE event_id = e.id AND status = 'confirmed') < e.max_participants
+                                THEN 'confirmed' ELSE 'reserve' END,
+                           {self.backend.next_position_sql('e.id')},
+                           ?
+                    FROM events e, users u
+                    WHERE e.id = ? AND u.telegram_id = ?
+                    ON CONFLICT (event_id, user_id) DO NOTHING
+                ''', (confirmed_presence, event_id, telegram_id))
+                joined = cursor.rowcount > 0
+                if joined:
+                    self._roster_changed(event_id)
+                
+                # Номер в очереди события считается по порядку (position, id): в PostgreSQL
+                # position выдает общая для всех событий последовательность
+                cursor.execute('''
+                    SELECT p.status,
+                           (SELECT COUNT(*) FROM participants q
+                            WHERE q.event_id = p.event_id AND (q.position, q.id) <= (p.position, p.id))
+                    FROM participants p
+                    JOIN users u ON p.user_id = u.id
+                    WHERE p.event_id = ? AND u.telegram_id = ?
+                ''', (event_id, telegram_id))
+                status, position = cursor.fetchone()
+                
+                results.append({
+                    'joined': joined,
+                    'status': status,
+                    'position': position,
+                    'event_date': event[0]
+                })
+            return results
+    
     def get_event_participants(self, event_id: int) -> List[Dict]:
         """Получить всех участников события"""
         with self.get_connection() as conn:
@@ -327,6 +602,18 @@ class Database:
                 return dict(zip(columns, row))
             return None
     
+    def get_joined_telegram_ids(self, event_id: int) -> Set[int]:
+        """Получить telegram_id всех участников события одним запросом"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT u.telegram_id
+                FROM participants p
+                JOIN users u ON p.user_id = u.id
+                WHERE p.event_id = ?
+            ''', (event_id,))
+            return {row[0] for row in cursor.fetchall()}
+    
     def remove_participant(self, event_id: int, telegram_id: int):
         """Удалить участника из события по telegram_id"""
         user = self.get_user_by_telegram_id(telegram_id)
@@ -334,14 +621,15 @@ class Database:
             return
         user_id = user['id']
 
-        with self.get_connection() as conn:
+        with self.transaction() as conn:
             cursor = conn.cursor()
+            self._lock_roster(cursor, event_id)
             cursor.execute('''
                 DELETE FROM participants 
                 WHERE event_id = ? AND user_id = ?
             ''', (event_id, user_id))
-            conn.commit()
             self._reorder_participants(event_id)
+            self._roster_changed(event_id)
     
     def update_participant_status(self, event_id: int, telegram_id: int, status: str):
         """Обновить статус участника"""
@@ -357,7 +645,7 @@ class Database:
                 SET status = ? 
                 WHERE event_id = ? AND user_id = ?
             ''', (status, event_id, user_id))
-            conn.commit()
+            self._roster_changed(event_id)
     
     def confirm_presence(self, event_id: int, telegram_id: int):
         """Подтвердить присутствие участника по telegram_id"""
@@ -373,7 +661,7 @@ class Database:
                 SET confirmed_presence = TRUE 
                 WHERE event_id = ? AND user_id = ?
             ''', (event_id, user_id))
-            conn.commit()
+            self._roster_changed(event_id)
     
     def mark_reminder_sent(self, event_id: int, telegram_id: int, reminder_type: str = 'first'):
         """Отметить, что напоминание отправлено, по telegram_id"""
@@ -396,7 +684,41 @@ class Database:
                     SET reminder_sent = TRUE 
                     WHERE event_id = ? AND user_id = ?
                 ''', (event_id, user_id))
-            conn.commit()
+            self._roster_changed(event_id)
+    
+    def mark_reminders_sent(self, event_id: int, telegram_ids: List[int], reminder_type: str = 'first'):
+        """Отметить отправленные напоминания для списка пользователей одной транзакцией"""
+        if not telegram_ids:
+            return
+        column = 'second_reminder_sent' if reminder_type == 'second' else 'reminder_sent'
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(f'''
+                UPDATE participants 
+                SET {column} = TRUE 
+                WHERE event_id = ? AND user_id = (SELECT id FROM users WHERE telegram_id = ?)
+            ''', [(event_id, telegram_id) for telegram_id in telegram_ids])
+            self._roster_changed(event_id)
+    
+    def get_participants_for_reminder(self, event_id: int, reminder_type: str = 'first') -> List[Dict]:
+        """Получить участников основного состава, которым нужно отправить напоминание"""
+        if reminder_type == 'second':
+            condition = 'p.reminder_sent = TRUE AND p.second_reminder_sent = FALSE'
+        else:
+            condition = 'p.reminder_sent = FALSE'
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT p.id, p.status, p.position, p.confirmed_presence, p.reminder_sent, p.second_reminder_sent,
+                       u.telegram_id, u.username, u.first_name, u.last_name
+                FROM participants p
+                JOIN users u ON p.user_id = u.id
+                WHERE p.event_id = ? AND p.status = 'confirmed' AND p.confirmed_presence = FALSE
+                  AND {condition}
+                ORDER BY p.position
+            ''', (event_id,))
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
     
     def get_unconfirmed_participants(self, event_id: int) -> List[Dict]:
         """Получить участников, не подтвердивших присутствие"""
@@ -414,24 +736,82 @@ class Database:
             return [dict(zip(columns, row)) for row in cursor.fetchall()]
     
     def _reorder_participants(self, event_id: int):
-        """Пересчитать позиции участников после удаления"""
+        """Пересчитать позиции участников после удаления одним запросом"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            if self.backend.supports_update_from:
+                cursor.execute('''
+                    UPDATE participants
+                    SET position = ranked.new_position
+                    FROM (
+                        SELECT id, ROW_NUMBER() OVER (ORDER BY position, id) AS new_position
+                        FROM participants
+                        WHERE event_id = ?
+                    ) AS ranked
+                    WHERE participants.id = ranked.id
+                      AND participants.position IS NOT ranked.new_position
+                ''', (event_id,))
+                changed = cursor.rowcount
+            else:
+                # SQLite старше 3.33 не поддерживает UPDATE ... FROM
+                cursor.execute('''
+                    SELECT id FROM participants 
+                    WHERE event_id = ? 
+                    ORDER BY position, id
+                ''', (event_id,))
+                updates = [(i, participant_id) for i, (participant_id,) in enumerate(cursor.fetchall(), 1)]
+                cursor.executemany('UPDATE participants SET position = ? WHERE id = ?', updates)
+                changed = len(updates)
+            
+            if changed:
+                self._roster_changed(event_id)
+    
+    def remove_unconfirmed_and_promote(self, event_id: int) -> Dict:
+        """Отписать всех неподтвердивших и поднять столько же резервистов одной транзакцией.
+
+        Возвращает {'removed': [...], 'promoted': [...]}: отписанных участников
+        и резервистов, перешедших в основной состав (telegram_id, username).
+        Позиции пересчитываются один раз в конце.
+        """
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            self._lock_roster(cursor, event_id)
             cursor.execute('''
-                SELECT id FROM participants 
-                WHERE event_id = ? 
-                ORDER BY position
+                SELECT p.id, u.telegram_id, u.username, u.first_name, u.last_name
+                FROM participants p
+                JOIN users u ON p.user_id = u.id
+                WHERE p.event_id = ? AND p.status = 'confirmed' AND p.confirmed_presence = FALSE
+                ORDER BY p.position
             ''', (event_id,))
-            participants = cursor.fetchall()
+            columns = [description[0] for description in cursor.description]
+            removed = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            if not removed:
+                return {'removed': [], 'promoted': []}
             
-            for i, (participant_id,) in enumerate(participants, 1):
-                cursor.execute('''
-                    UPDATE participants 
-                    SET position = ? 
-                    WHERE id = ?
-                ''', (i, participant_id))
+            cursor.executemany('DELETE FROM participants WHERE id = ?', [(p['id'],) for p in removed])
             
-            conn.commit()
+            # На каждое освободившееся место - следующий по очереди из резерва
+            cursor.execute('''
+                SELECT p.id, u.telegram_id, u.username
+                FROM participants p
+                JOIN users u ON p.user_id = u.id
+                WHERE p.event_id = ? AND p.status = 'reserve'
+                ORDER BY p.position
+                LIMIT ?
+            ''', (event_id, len(removed)))
+            reserve = cursor.fetchall()
+            cursor.executemany(
+                "UPDATE participants SET status = 'confirmed' WHERE id = ?",
+                [(participant_id,) for participant_id, _, _ in reserve]
+            )
+            
+            self._reorder_participants(event_id)
+            self._roster_changed(event_id)
+        
+        return {
+            'removed': removed,
+            'promoted': [{'telegram_id': telegram_id, 'username': username} for _, telegram_id, username in reserve]
+        }
     
     def get_reserve_participants(self, event_id: int) -> List[Dict]:
         """Получить участников в резерве"""
@@ -450,8 +830,9 @@ class Database:
     
     def move_from_reserve_to_main(self, event_id: int) -> Optional[Dict]:
         """Переместить первого из резерва в основной состав"""
-        with self.get_connection() as conn:
+        with self.transaction() as conn:
             cursor = conn.cursor()
+            self._lock_roster(cursor, event_id)
             
             # Получить первого в резерве
             cursor.execute('''
@@ -475,8 +856,7 @@ class Database:
                 SET status = 'confirmed' 
                 WHERE id = ?
             ''', (participant_id,))
-            
-            conn.commit()
+            self._roster_changed(event_id)
             
             return {
                 'telegram_id': telegram_id,
@@ -514,7 +894,7 @@ class Database:
         """Получить количество активных событий"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(id) FROM events WHERE status = "active"')
+            cursor.execute("SELECT COUNT(id) FROM events WHERE status = 'active'")
             count = cursor.fetchone()[0]
             return count
 
@@ -542,15 +922,246 @@ class Database:
             row = cursor.fetchone()
             return row[0] if row else default
     
+    def get_all_settings(self) -> Dict[str, str]:
+        """Получить все настройки одним запросом"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT setting_key, setting_value FROM bot_settings')
+            return dict(cursor.fetchall())
+    
     def set_setting(self, key: str, value: str):
         """Установить значение настройки"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT OR REPLACE INTO bot_settings (setting_key, setting_value, updated_at)
+                INSERT INTO bot_settings (setting_key, setting_value, updated_at)
                 VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (setting_key) DO UPDATE
+                SET setting_value = excluded.setting_value, updated_at = excluded.updated_at
             ''', (key, value))
-            conn.commit()
+    
+    # Живые сообщения со списком участников
+    def get_roster_messages(self, event_id: int) -> Dict[int, int]:
+        """Получить message_id живых сообщений события: telegram_id -> message_id"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT telegram_id, message_id FROM roster_messages WHERE event_id = ?', (event_id,))
+            return dict(cursor.fetchall())
+    
+    def save_roster_messages(self, event_id: int, message_ids: Dict[int, int]):
+        """Запомнить message_id новых живых сообщений события"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO roster_messages (event_id, telegram_id, message_id, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (event_id, telegram_id) DO UPDATE
+                SET message_id = excluded.message_id, updated_at = excluded.updated_at
+            ''', [(event_id, telegram_id, message_id) for telegram_id, message_id in message_ids.items()])
+    
+    # Очередь исходящих сообщений
+    def enqueue_outbox(self, messages: List[Tuple[int, str, str]]):
+        """Поставить сообщения в очередь: список (chat_id, вид, JSON с аргументами отправки)"""
+        now = time.time()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO outbox (chat_id, kind, payload, created_at, next_attempt_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(chat_id, kind, payload, now, now) for chat_id, kind, payload in messages])
+    
+    def claim_outbox_batch(self, limit: int, lease: float) -> List[Dict]:
+        """Забрать пачку сообщений, которым пора уходить.
+
+        Забранные сообщения откладываются на lease секунд: если отправка не
+        завершится (например, реплика остановится), они вернутся в очередь.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            # В PostgreSQL строки, забранные другой репликой, пропускаются
+            skip_locked = ' FOR UPDATE SKIP LOCKED' if self.backend.row_locks else ''
+            cursor.execute(f'''
+                SELECT id, chat_id, kind, payload, attempts, created_at
+                FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id
+                LIMIT ?{skip_locked}
+            ''', (now, limit))
+            columns = [description[0] for description in cursor.description]
+            messages = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            if messages:
+                cursor.executemany(
+                    'UPDATE outbox SET next_attempt_at = ? WHERE id = ?',
+                    [(now + lease, message['id']) for message in messages]
+                )
+            return messages
+    
+    def complete_outbox_messages(self, message_ids: List[int]):
+        """Удалить отправленные сообщения из очереди"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('DELETE FROM outbox WHERE id = ?', [(message_id,) for message_id in message_ids])
+    
+    def fail_outbox_messages(self, failures: List[Tuple[int, int, Optional[float], str]]):
+        """Записать неудачные попытки: (id, попыток, время следующей попытки, ошибка).
+
+        Без времени следующей попытки сообщение переводится в dead-letter.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                UPDATE outbox
+                SET attempts = ?,
+                    next_attempt_at = COALESCE(?, next_attempt_at),
+                    status = CASE WHEN ? IS NULL THEN 'dead' ELSE 'pending' END,
+                    last_error = ?
+                WHERE id = ?
+            ''', [
+                (attempts, next_attempt_at, next_attempt_at, error, message_id)
+                for message_id, attempts, next_attempt_at, error in failures
+            ])
+    
+    def get_outbox_stats(self) -> Dict:
+        """Глубина очереди, число сообщений в dead-letter и время самого старого ожидающего"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT status, COUNT(*), MIN(created_at)
+                FROM outbox
+                GROUP BY status
+            ''')
+            stats = {'pending': 0, 'dead': 0, 'oldest_pending_at': None}
+            for status, count, oldest in cursor.fetchall():
+                stats[status] = count
+                if status == 'pending':
+                    stats['oldest_pending_at'] = oldest
+            return stats
+    
+    # Общее состояние реплик
+    def get_persistent_data(self, kind: str) -> Dict[int, str]:
+        """Получить все сохраненные данные PTB одного вида ('user', 'chat') как JSON-строки"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT key, data FROM persistence_data WHERE kind = ?', (kind,))
+            return dict(cursor.fetchall())
+    
+    def get_persistent_entry(self, kind: str, key: int) -> Optional[str]:
+        """Получить сохраненные данные PTB одного пользователя или чата"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT data FROM persistence_data WHERE kind = ? AND key = ?', (kind, key))
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
+    def write_persistent_entries(self, entries: List[Tuple[str, int, Optional[str]]]):
+        """Записать пачку данных PTB одной транзакцией.
+
+        entries - список (вид, ключ, JSON-строка); None вместо строки удаляет запись.
+        """
+        saved = [(kind, key, data) for kind, key, data in entries if data is not None]
+        deleted = [(kind, key) for kind, key, data in entries if data is None]
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            if saved:
+                cursor.executemany('''
+                    INSERT INTO persistence_data (kind, key, data, updated_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (kind, key) DO UPDATE
+                    SET data = excluded.data, updated_at = excluded.updated_at
+                ''', saved)
+            if deleted:
+                cursor.executemany('DELETE FROM persistence_data WHERE kind = ? AND key = ?', deleted)
+    
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """Взять или продлить аренду одним запросом, вернуть True, если она у holder.
+
+        Чужая аренда перехватывается только после истечения срока.
+        """
+        now = time.time()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO job_leases (name, holder, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE
+                SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE job_leases.holder = excluded.holder OR job_leases.expires_at < ?
+            ''', (name, holder, now + ttl, now))
+            return cursor.rowcount > 0
+    
+    def release_lease(self, name: str, holder: str):
+        """Отдать аренду, если она у holder"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM job_leases WHERE name = ? AND holder = ?', (name, holder))
+    
+    def get_lease_holder(self, name: str) -> Optional[str]:
+        """Получить текущего держателя неистекшей аренды"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT holder FROM job_leases WHERE name = ? AND expires_at >= ?', (name, time.time())
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
+    def claim_job_run(self, job_name: str, run_key: str, holder: str, ttl: float) -> bool:
+        """Застолбить запуск задачи (job_name, run_key) на ttl секунд или продлить свою заявку.
+
+        Возвращает True, если запуск достался holder. Чужая заявка перехватывается
+        только после истечения срока и только пока запуск не завершен.
+        """
+        now = time.time()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO job_runs (job_name, run_key, holder, expires_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (job_name, run_key) DO UPDATE
+                SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE job_runs.completed_at IS NULL
+                  AND (job_runs.holder = excluded.holder OR job_runs.expires_at < ?)
+            ''', (job_name, run_key, holder, now + ttl, now))
+            return cursor.rowcount > 0
+    
+    def complete_job_run(self, job_name: str, run_key: str, holder: str) -> bool:
+        """Отметить запуск задачи выполненным, вернуть False, если заявка уже не у holder"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE job_runs SET completed_at = ?
+                WHERE job_name = ? AND run_key = ? AND holder = ?
+            ''', (time.time(), job_name, run_key, holder))
+            return cursor.rowcount > 0
+    
+    def release_job_run(self, job_name: str, run_key: str, holder: str):
+        """Снять свою заявку на незавершенный запуск, чтобы его сразу могла взять другая реплика"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE job_runs SET expires_at = 0
+                WHERE job_name = ? AND run_key = ? AND holder = ? AND completed_at IS NULL
+            ''', (job_name, run_key, holder))
+    
+    def is_job_run_completed(self, job_name: str, run_key: str) -> bool:
+        """Выполнен ли уже запуск задачи"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT 1 FROM job_runs
+                WHERE job_name = ? AND run_key = ? AND completed_at IS NOT NULL
+            ''', (job_name, run_key))
+            return cursor.fetchone() is not None
+    
+    def cleanup_job_runs(self, keep_days: int = 7):
+        """Удалить старые записи о запусках задач"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'DELETE FROM job_runs WHERE claimed_at < ?',
+                ((datetime.utcnow() - timedelta(days=keep_days)).strftime('%Y-%m-%d %H:%M:%S'),)
+            )
     
     def get_participant_limit(self) -> int:
         """Получить текущий лимит участников"""
@@ -565,36 +1176,31 @@ class Database:
         self.set_setting('participant_limit', str(limit))
         logger.info(f"Установлен новый лимит участников: {limit}")
     
-    def recalculate_participant_statuses(self, event_id: int):
-        """Пересчитать статусы участников после изменения лимита"""
-        with self.get_connection() as conn:
+    def recalculate_participant_statuses(self, event_id: int, limit: Optional[int] = None):
+        """Пересчитать статусы участников после изменения лимита одним запросом"""
+        with self.transaction() as conn:
             cursor = conn.cursor()
+            self._lock_roster(cursor, event_id)
             
-            # Получаем текущий лимит
-            limit = self.get_participant_limit()
+            # Получаем текущий лимит, если он не передан
+            if limit is None:
+                limit = self.get_participant_limit()
             
-            # Получаем всех участников события, отсортированных по позиции
-            cursor.execute('''
-                SELECT p.id, p.user_id, p.status, p.position
-                FROM participants p
-                WHERE p.event_id = ?
-                ORDER BY p.position
-            ''', (event_id,))
-            
-            participants = cursor.fetchall()
-            
-            # Обновляем статусы
-            for i, (participant_id, user_id, current_status, position) in enumerate(participants):
-                new_status = 'confirmed' if i < limit else 'reserve'
-                
-                if current_status != new_status:
-                    cursor.execute('''
-                        UPDATE participants 
-                        SET status = ? 
-                        WHERE id = ?
-                    ''', (new_status, participant_id))
+            # Первые limit по (position, id) - основной состав, остальные - резерв.
+            # Граница - участник номер limit, ищется по индексу один раз за запрос;
+            # если участников меньше лимита, подзапрос пуст и все попадают в основной состав.
+            threshold = '''(SELECT position, id FROM participants
+                             WHERE event_id = ? ORDER BY position, id LIMIT 1 OFFSET ?)'''
+            cursor.execute(f'''
+                UPDATE participants
+                SET status = CASE WHEN (position, id) > {threshold} THEN 'reserve' ELSE 'confirmed' END
+                WHERE event_id = ?
+                  AND status IS NOT (CASE WHEN (position, id) > {threshold} THEN 'reserve' ELSE 'confirmed' END)
+            ''', (event_id, limit - 1, event_id, event_id, limit - 1))
+            changed = cursor.rowcount
             
-            conn.commit()
+            if changed:
+                self._roster_changed(event_id)
             logger.info(f"Пересчитаны статусы участников для события {event_id} с лимитом {limit}")
     
     def update_event_max_participants(self, event_id: int, max_participants: int):
@@ -606,5 +1212,5 @@ class Database:
                 SET max_participants = ? 
                 WHERE id = ?
             ''', (max_participants, event_id))
-            conn.commit()
+            self._events_changed()
             logger.info(f"Обновлен лимит участников для события {event_id}: {max_participants}") 
\ No newline at end of file
@@ -0,0 +1,163 @@
+import logging
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _add_roster_indexes(cursor):
+    """Индексы для выборок участников и активных событий, уникальность записи"""
+    # Удаляем дубликаты записей, оставляя самую раннюю, иначе уникальный индекс не создастся
+    cursor.execute('''
+        DELETE FROM participants
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM participants GROUP BY event_id, user_id
+        )
+    ''')
+    if cursor.rowcount > 0:
+        logger.warning(f"Удалено {cursor.rowcount} повторных записей участников")
+
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_participants_event_user
+        ON participants (event_id, user_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_participants_event_status_position
+        ON participants (event_id, status, position)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_participants_event_position
+        ON participants (event_id, position)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_events_status_date_time
+        ON events (status, date, time)
+    ''')
+
+
+def _add_replica_tables(cursor):
+    """Общее состояние реплик: данные пользователей и чатов PTB, аренда планировщика, запуски задач"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS persistence_data (
+            kind TEXT NOT NULL,
+            key BIGINT NOT NULL,
+            data TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, key)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at DOUBLE PRECISION NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job_name TEXT NOT NULL,
+            run_key TEXT NOT NULL,
+            holder TEXT NOT NULL,
+            claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_name, run_key)
+        )
+    ''')
+
+
+def _add_roster_messages(cursor):
+    """Живые сообщения со списком участников: одно на событие у каждого подписчика"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS roster_messages (
+            event_id INTEGER NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (event_id, telegram_id)
+        )
+    ''')
+
+
+def _add_outbox(cursor):
+    """Очередь исходящих сообщений с повторами и dead-letter"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id BIGINT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at DOUBLE PRECISION NOT NULL,
+            next_attempt_at DOUBLE PRECISION NOT NULL,
+            last_error TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_outbox_status_next_attempt
+        ON outbox (status, next_attempt_at)
+    ''')
+
+
+def _add_unsubscribe_reason(cursor):
+    """Причина и время отписки: бот заблокирован, аккаунт удален и т. п."""
+    cursor.execute('ALTER TABLE users ADD COLUMN unsubscribed_reason TEXT')
+    cursor.execute('ALTER TABLE users ADD COLUMN unsubscribed_at TIMESTAMP')
+
+
+def _add_job_run_leases(cursor):
+    """Срок заявки на запуск задачи и отметка о завершении: запуск упавшей реплики перехватывается"""
+    cursor.execute('ALTER TABLE job_runs ADD COLUMN expires_at DOUBLE PRECISION')
+    cursor.execute('ALTER TABLE job_runs ADD COLUMN completed_at DOUBLE PRECISION')
+    # Запуски, застолбленные до миграции, считаются выполненными
+    cursor.execute('UPDATE job_runs SET expires_at = 0, completed_at = 0')
+
+
+# Миграции применяются строго по возрастанию версии, каждая ровно один раз.
+# Новые миграции добавляются только в конец списка.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "Индексы участников и событий, уникальная запись на событие", _add_roster_indexes),
+    (2, "Таблицы общего состояния реплик и аренды планировщика", _add_replica_tables),
+    (3, "Живые сообщения со списком участников", _add_roster_messages),
+    (4, "Очередь исходящих сообщений", _add_outbox),
+    (5, "Причина и время отписки пользователя", _add_unsubscribe_reason),
+    (6, "Срок заявки и завершение запусков задач по расписанию", _add_job_run_leases),
+]
+
+
+def get_schema_version(cursor) -> int:
+    """Получить текущую версию схемы"""
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else 0
+
+
+def run_migrations(conn) -> int:
+    """Применить недостающие миграции, вернуть итоговую версию схемы"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    current_version = get_schema_version(cursor)
+    for version, description, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+        try:
+            migration(cursor)
+            cursor.execute('''
+                INSERT INTO schema_version (version, description)
+                VALUES (?, ?)
+            ''', (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Ошибка при применении миграции {version}: {description}")
+            raise
+        current_version = version
+        logger.info(f"Применена миграция {version}: {description}")
+
+    return current_version
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from data.async_database import AsyncDatabase
+from data.database import Database
+from data.query_stats import query_label
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user'
+CHAT_DATA = 'chat'
+
+
+def _dumps(data: Dict) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def _loads(raw: Optional[str]) -> Dict:
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logger.warning("Повреждены сохраненные данные PTB, используется пустой словарь")
+        return {}
+
+
+class DatabasePersistence(BasePersistence):
+    """Хранение ``user_data`` и ``chat_data`` PTB в базе данных бота.
+
+    Состояние админ-панели (``admin_state``) и ожидание подтверждения отписки
+    (``pending_leave_confirmation``) переживают перезапуск и редеплой.
+    Данные хранятся в JSON в таблице ``persistence_data``; ``bot_data``,
+    ``callback_data`` и диалоги не сохраняются.
+
+    Запись идет пачками: PTB раз в ``update_interval`` секунд передает все
+    измененные записи, они копятся в памяти и записываются одной
+    транзакцией. ``flush`` записывает накопленное сразу (PTB вызывает его при
+    остановке). Пустые словари не хранятся - запись удаляется.
+
+    С ``refresh=True`` (несколько реплик) данные перечитываются из базы перед
+    каждым обновлением, поэтому состояние, записанное одной репликой, видно
+    остальным.
+    """
+
+    def __init__(self, database: Database, update_interval: float = 60, refresh: bool = False):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.db = database
+        self.async_db = AsyncDatabase.shared(database)
+        self.refresh = refresh
+        # (вид, ключ) -> JSON-строка или None (удалить); еще не записаны в базу
+        self._dirty: Dict[Tuple[str, int], Optional[str]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._stats = {
+            'flushes': 0,
+            'entries_written': 0,
+            'errors': 0,
+            'last_batch': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    async def _load_all(self, kind: str) -> Dict[int, Dict]:
+        rows = await self.async_db.get_persistent_data(kind)
+        return {int(key): _loads(raw) for key, raw in rows.items()}
+
+    async def _refresh(self, kind: str, key: int, data: Dict):
+        # Несохраненные изменения новее базы
+        if not self.refresh or (kind, key) in self._dirty:
+            return
+        fresh = _loads(await self.async_db.get_persistent_entry(kind, key))
+        data.clear()
+        data.update(fresh)
+
+    def _mark(self, kind: str, key: int, data: Optional[Dict]):
+        self._dirty[(kind, key)] = _dumps(data) if data else None
+        # Все записи одного прохода PTB приходят в одной итерации цикла событий,
+        # поэтому запись, запланированная сразу после них, забирает всю пачку
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        await asyncio.sleep(0)
+        await self.flush()
+
+    # Загрузка при старте
+    async def get_user_data(self) -> Dict[int, Dict]:
+        return await self._load_all(USER_DATA)
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return await self._load_all(CHAT_DATA)
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    # Запись
+    async def update_user_data(self, user_id: int, data: Dict):
+        self._mark(USER_DATA, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict):
+        self._mark(CHAT_DATA, chat_id, data)
+
+    async def update_bot_data(self, data: Dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name: str, key, new_state):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        self._mark(USER_DATA, user_id, None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._mark(CHAT_DATA, chat_id, None)
+
+    # Перечитывание перед обработкой обновления
+    async def refresh_user_data(self, user_id: int, user_data: Dict):
+        await self._refresh(USER_DATA, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict):
+        await self._refresh(CHAT_DATA, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict):
+        pass
+
+    async def flush(self):
+        """Записать все накопленные изменения одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch = self._dirty
+            self._dirty = {}
+            started = time.perf_counter()
+            try:
+                with query_label('persistence'):
+                    await self.async_db.write_persistent_entries(
+                        [(kind, key, data) for (kind, key), data in batch.items()]
+                    )
+            except Exception as e:
+                # Вернуть пачку в очередь, не затирая более новые изменения
+                for entry, data in batch.items():
+                    self._dirty.setdefault(entry, data)
+                self._stats['errors'] += 1
+                logger.error(f"Ошибка при сохранении данных PTB ({len(batch)} записей): {e}")
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['entries_written'] += len(batch)
+            stats['last_batch'] = len(batch)
+            stats['last_flush_ms'] = elapsed_ms
+            stats['max_flush_ms'] = max(stats['max_flush_ms'], elapsed_ms)
+            stats['total_flush_ms'] += elapsed_ms
+            logger.debug(f"Данные PTB сохранены: {len(batch)} записей за {elapsed_ms:.1f} мс")
+
+    def get_stats(self) -> Dict:
+        """Счетчики записи: ожидающие записи, размер пачек и время записи"""
+        stats = dict(self._stats)
+        total_ms = stats.pop('total_flush_ms')
+        stats['dirty'] = len(self._dirty)
+        stats['avg_flush_ms'] = total_ms / stats['flushes'] if stats['flushes'] else 0.0
+        return stats
@@ -0,0 +1,249 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+from weakref import WeakSet
+
+from utils.metrics import DB_QUERY_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Обработчик или задача планировщика, от имени которых сейчас выполняются запросы
+_query_label: ContextVar[str] = ContextVar('query_label', default='other')
+
+# Живые экземпляры QueryStats: каждый считает запуски обработчиков в своих счетчиках
+_instances: 'WeakSet[QueryStats]' = WeakSet()
+_instances_lock = threading.Lock()
+
+# Больше разных меток не заводим: произвольный текст сообщений не должен раздувать статистику
+MAX_LABELS = 100
+OVERFLOW_LABEL = 'other'
+
+# Запросы, для которых имеет смысл план выполнения
+_EXPLAINABLE_RE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def set_query_label(label: str):
+    """Учитывать запросы текущей задачи (обновления, задачи планировщика) под меткой ``label``.
+
+    Каждое обновление и каждая задача выполняются в своей asyncio-задаче,
+    поэтому метка действует до конца обработки и не переходит к другим.
+    """
+    _query_label.set(label)
+    _count_run(label)
+
+
+@contextmanager
+def query_label(label: str):
+    """Учитывать запросы внутри блока под меткой ``label``, затем вернуть прежнюю"""
+    token = _query_label.set(label)
+    _count_run(label)
+    try:
+        yield
+    finally:
+        _query_label.reset(token)
+
+
+def _count_run(label: str):
+    with _instances_lock:
+        instances = list(_instances)
+    for stats in instances:
+        stats.record_run(label)
+
+
+def get_query_label() -> str:
+    return _query_label.get()
+
+
+def normalize_sql(sql: str, limit: int = 300) -> str:
+    """Запрос в одну строку для логов и статистики"""
+    sql = _WHITESPACE_RE.sub(' ', sql).strip()
+    return sql if len(sql) <= limit else sql[:limit] + '...'
+
+
+class QueryStats:
+    """Счетчики запросов к базе по меткам обработчиков.
+
+    На каждую метку (см. ``set_query_label``) считаются запросы, их суммарное
+    время, строки (прочитанные и измененные) и захваты соединений из пула.
+    Запросы дольше ``slow_query_ms`` попадают в журнал медленных запросов
+    вместе с планом выполнения (``EXPLAIN QUERY PLAN`` в SQLite).
+
+    Запуски меток считаются с момента создания экземпляра: каждый
+    ``set_query_label`` в процессе увеличивает счетчик метки у всех живых
+    экземпляров, в том числе запуски, обошедшиеся без запросов (ответ из кэша).
+    """
+
+    def __init__(self, slow_query_ms: float = 100.0, slow_log_size: int = 20):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._labels: Dict[str, Dict] = {}
+        self._slow_queries = deque(maxlen=slow_log_size)
+        with _instances_lock:
+            _instances.add(self)
+
+    def _entry(self, label: str) -> Dict:
+        entry = self._labels.get(label)
+        if entry is None:
+            if len(self._labels) >= MAX_LABELS:
+                label = OVERFLOW_LABEL
+                entry = self._labels.get(label)
+            if entry is None:
+                entry = self._labels[label] = {
+                    'runs': 0, 'statements': 0, 'time': 0.0, 'max_time': 0.0, 'rows': 0, 'connections': 0, 'slow': 0
+                }
+        return entry
+
+    def record_statement(self, sql: str, elapsed: float, rows: int,
+                         explain: Optional[Callable[[], str]] = None):
+        label = _query_label.get()
+        slow = elapsed * 1000 >= self.slow_query_ms
+        with self._lock:
+            entry = self._entry(label)
+            metric_label = label if label in self._labels else OVERFLOW_LABEL
+            entry['statements'] += 1
+            entry['time'] += elapsed
+            entry['max_time'] = max(entry['max_time'], elapsed)
+            entry['rows'] += rows
+            if slow:
+                entry['slow'] += 1
+        DB_QUERY_DURATION.observe(elapsed, metric_label)
+        if slow:
+            self._record_slow(label, sql, elapsed, explain)
+
+    def record_run(self, label: str):
+        with self._lock:
+            self._entry(label)['runs'] += 1
+
+    def record_rows(self, rows: int):
+        with self._lock:
+            self._entry(_query_label.get())['rows'] += rows
+
+    def record_connection(self):
+        with self._lock:
+            self._entry(_query_label.get())['connections'] += 1
+
+    def _record_slow(self, label: str, sql: str, elapsed: float, explain: Optional[Callable[[], str]]):
+        plan = None
+        if explain is not None and _EXPLAINABLE_RE.match(sql):
+            try:
+                plan = explain()
+            except Exception as e:
+                plan = f"не удалось получить план: {e}"
+        text = normalize_sql(sql)
+        logger.warning(f"Медленный запрос ({elapsed * 1000:.0f} мс, {label}): {text}" + (f"\nПлан: {plan}" if plan else ""))
+        with self._lock:
+            self._slow_queries.append({
+                'label': label, 'sql': text, 'ms': elapsed * 1000, 'plan': plan, 'at': time.time()
+            })
+
+    def snapshot(self) -> Dict:
+        """Счетчики по меткам (по убыванию суммарного времени) и последние медленные запросы"""
+        with self._lock:
+            labels = {label: dict(entry) for label, entry in self._labels.items()}
+            slow_queries = list(self._slow_queries)
+        result = []
+        for label, entry in labels.items():
+            label_runs = entry['runs']
+            result.append({
+                'label': label,
+                'runs': label_runs,
+                'statements': entry['statements'],
+                'rows': entry['rows'],
+                'connections': entry['connections'],
+                'time_ms': entry['time'] * 1000,
+                'max_ms': entry['max_time'] * 1000,
+                'slow': entry['slow'],
+                # Стоимость одного нажатия кнопки или запуска задачи
+                'statements_per_run': entry['statements'] / label_runs if label_runs else None,
+                'ms_per_run': entry['time'] * 1000 / label_runs if label_runs else None,
+            })
+        result.sort(key=lambda item: item['time_ms'], reverse=True)
+        return {
+            'labels': result,
+            'statements': sum(item['statements'] for item in result),
+            'time_ms': sum(item['time_ms'] for item in result),
+            'slow_queries': slow_queries,
+            'slow_query_ms': self.slow_query_ms,
+        }
+
+    def summary(self, top: int = 5) -> str:
+        """Краткая сводка для периодического журнала"""
+        snapshot = self.snapshot()
+        lines = [f"Запросы к базе: {snapshot['statements']} за {snapshot['time_ms']:.0f} мс, "
+                 f"медленных {len(snapshot['slow_queries'])}"]
+        for item in snapshot['labels'][:top]:
+            per_run = f", {item['statements_per_run']:.1f} на запуск" if item['statements_per_run'] is not None else ""
+            lines.append(f"  {item['label']}: {item['statements']} запросов, {item['time_ms']:.0f} мс, "
+                         f"строк {item['rows']}, соединений {item['connections']}{per_run}")
+        return "\n".join(lines)
+
+
+class InstrumentedCursor:
+    """Курсор, замеряющий каждый запрос; остальное - как у исходного курсора"""
+
+    def __init__(self, cursor, connection: 'InstrumentedConnection'):
+        self._cursor = cursor
+        self._connection = connection
+
+    def execute(self, sql: str, params=()):
+        started = time.perf_counter()
+        self._cursor.execute(sql, params)
+        self._connection.record(sql, params, time.perf_counter() - started, self._affected_rows())
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        started = time.perf_counter()
+        self._cursor.executemany(sql, seq_of_params)
+        self._connection.record(sql, None, time.perf_counter() - started, self._affected_rows())
+        return self
+
+    def _affected_rows(self) -> int:
+        # Для SELECT строки считаются при чтении, здесь - только измененные
+        if self._cursor.description is None and self._cursor.rowcount > 0:
+            return self._cursor.rowcount
+        return 0
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._connection.stats.record_rows(1)
+        return row
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if rows:
+            self._connection.stats.record_rows(len(rows))
+        return rows
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Соединение из пула, курсоры которого учитываются в ``QueryStats``"""
+
+    def __init__(self, conn, stats: QueryStats, explain: Callable):
+        self._conn = conn
+        self.stats = stats
+        self._explain = explain
+
+    def cursor(self) -> InstrumentedCursor:
+        return InstrumentedCursor(self._conn.cursor(), self)
+
+    def execute(self, sql: str, params=()) -> InstrumentedCursor:
+        return self.cursor().execute(sql, params)
+
+    def record(self, sql: str, params, elapsed: float, rows: int):
+        explain = None
+        if params is not None:
+            explain = lambda: self._explain(self._conn.cursor(), sql, params)
+        self.stats.record_statement(sql, elapsed, rows, explain)
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
@@ -0,0 +1,158 @@
+import logging
+import threading
+import weakref
+from datetime import datetime, time
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+from config.settings import BOT_SETTINGS
+from data.database import Database
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def _parse_int(value: str) -> int:
+    return int(value)
+
+
+def _parse_time(value: str) -> time:
+    return datetime.strptime(value.strip(), '%H:%M').time()
+
+
+def _format_time(value: Union[time, str]) -> str:
+    if isinstance(value, str):
+        value = _parse_time(value)
+    return value.strftime('%H:%M')
+
+
+def _parse_weekdays(value: str) -> List[str]:
+    days = [day.strip().lower() for day in value.split(',') if day.strip()]
+    unknown = [day for day in days if day not in WEEKDAYS]
+    if unknown or not days:
+        raise ValueError(f"Неизвестные дни недели: {value}")
+    return days
+
+
+def _format_weekdays(value: Union[List[str], str]) -> str:
+    if isinstance(value, str):
+        value = _parse_weekdays(value)
+    return ','.join(_parse_weekdays(','.join(value)))
+
+
+# Ключ -> (разбор строки из базы, запись в строку, значение по умолчанию)
+SETTINGS_SCHEMA: Dict[str, Tuple[Callable, Callable, str]] = {
+    'participant_limit': (_parse_int, lambda value: str(int(value)), str(BOT_SETTINGS['MAX_PARTICIPANTS'])),
+    'training_days': (_parse_weekdays, _format_weekdays, ','.join(BOT_SETTINGS['TRAINING_DAYS'])),
+    'training_time': (_parse_time, _format_time, BOT_SETTINGS['TRAINING_TIME']),
+    'event_creation_time': (_parse_time, _format_time, BOT_SETTINGS['EVENT_CREATION_TIME']),
+    'reminder_time': (_parse_time, _format_time, BOT_SETTINGS['REMINDER_TIME']),
+    'second_reminder_time': (_parse_time, _format_time, BOT_SETTINGS['SECOND_REMINDER_TIME']),
+    'auto_leave_time': (_parse_time, _format_time, BOT_SETTINGS['AUTO_LEAVE_TIME']),
+    'event_cleanup_time': (_parse_time, _format_time, BOT_SETTINGS['EVENT_CLEANUP_TIME']),
+}
+
+# Настройки, от которых зависит расписание задач
+SCHEDULE_SETTINGS = (
+    'training_days', 'event_creation_time', 'reminder_time',
+    'second_reminder_time', 'auto_leave_time', 'event_cleanup_time',
+)
+
+_shared = weakref.WeakKeyDictionary()
+
+
+class SettingsStore:
+    """Типизированные настройки бота из таблицы ``bot_settings``.
+
+    Все строки загружаются один раз, чтение идет из памяти. ``set`` сначала
+    записывает значение в базу, затем обновляет память и вызывает
+    подписчиков ``callback(key, old_value, new_value)`` в том же потоке;
+    ошибка подписчика передается вызвавшему ``set``.
+    Значения по умолчанию берутся из ``BOT_SETTINGS``.
+    """
+
+    def __init__(self, database: Database):
+        self.db = database
+        self._lock = threading.Lock()
+        self._values: Dict[str, Any] = {}
+        self._subscribers: Dict[str, List[Callable]] = {}
+        self.reload()
+
+    @classmethod
+    def shared(cls, database: Database) -> 'SettingsStore':
+        """Получить общее хранилище настроек для данного экземпляра ``Database``"""
+        store = _shared.get(database)
+        if store is None:
+            store = cls(database)
+            _shared[database] = store
+        return store
+
+    def reload(self, notify: bool = False):
+        """Перечитать все настройки из базы.
+
+        С ``notify=True`` подписчики узнают об изменениях, сделанных в обход
+        этого экземпляра (например, другой репликой).
+        """
+        rows = self.db.get_all_settings()
+        values = {}
+        for key, (parse, _, default) in SETTINGS_SCHEMA.items():
+            raw = rows.get(key, default)
+            try:
+                values[key] = parse(raw)
+            except ValueError:
+                logger.warning(f"Некорректное значение настройки {key}: {raw}, используется {default}")
+                values[key] = parse(default)
+        with self._lock:
+            old_values = self._values
+            self._values = values
+        if notify:
+            for key, value in values.items():
+                if key in old_values and old_values[key] != value:
+                    self._notify(key, old_values[key], value)
+
+    def get(self, key: str) -> Any:
+        """Получить значение настройки"""
+        return self._values[key]
+
+    def set(self, key: str, value: Any, force: bool = False):
+        """Сохранить значение настройки и уведомить подписчиков.
+
+        С ``force=True`` подписчики вызываются, даже если значение не изменилось.
+        Если подписчик упал, остальные все равно вызываются, а первая ошибка
+        пробрасывается после них: значение к этому моменту уже сохранено.
+        """
+        if key not in SETTINGS_SCHEMA:
+            raise KeyError(f"Неизвестная настройка: {key}")
+        parse, format_value, _ = SETTINGS_SCHEMA[key]
+        raw = format_value(value)
+        new_value = parse(raw)
+        with self._lock:
+            old_value = self._values.get(key)
+            self.db.set_setting(key, raw)
+            self._values[key] = new_value
+        logger.info(f"Настройка {key} изменена: {raw}")
+        if force or old_value != new_value:
+            errors = self._notify(key, old_value, new_value)
+            if errors:
+                raise errors[0]
+
+    def _notify(self, key: str, old_value: Any, new_value: Any) -> List[Exception]:
+        errors = []
+        for callback in list(self._subscribers.get(key, ())):
+            try:
+                callback(key, old_value, new_value)
+            except Exception as e:
+                logger.error(f"Ошибка в подписчике настройки {key}: {e}")
+                errors.append(e)
+        return errors
+
+    def subscribe(self, keys: Union[str, Iterable[str]], callback: Callable):
+        """Подписаться на изменение одной или нескольких настроек"""
+        if isinstance(keys, str):
+            keys = [keys]
+        for key in keys:
+            self._subscribers.setdefault(key, []).append(callback)
+
+    def get_training_weekdays(self) -> List[int]:
+        """Дни тренировок как номера дней недели (0 - понедельник)"""
+        return [WEEKDAYS.index(day) for day in self.get('training_days')]
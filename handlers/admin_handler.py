@@ -5,12 +5,26 @@ from telegram.ext import ContextTypes
 from services.event_service import EventService
 from services.notification_service import NotificationService
 from data.database import Database
-from utils.keyboard import create_admin_keyboard, create_event_creation_keyboard, create_settings_keyboard, create_main_keyboard, get_is_joined, create_participant_limit_keyboard
+from data.persistence import DatabasePersistence
+from utils.keyboard import create_admin_keyboard, create_event_creation_keyboard, create_settings_keyboard, create_main_keyboard, get_is_joined_async, create_participant_limit_keyboard, create_statistics_keyboard
 from utils.timezone_utils import get_now_with_timezone
 from config.settings import ADMIN_IDS
 
 logger = logging.getLogger(__name__)
 
+# Сколько обработчиков и медленных запросов показывать в нагрузке на базу
+DB_LOAD_TOP = 10
+DB_LOAD_SLOW = 5
+
+# Причины автоматической отписки для статистики
+PRUNE_REASONS = {
+    'blocked': "заблокировали бота",
+    'deactivated': "удалили аккаунт",
+    'kicked': "удалили бота из чата",
+    'chat_not_found': "чат не найден",
+    'forbidden': "нет доступа"
+}
+
 
 async def handle_admin_commands(update: Update, context: ContextTypes.DEFAULT_TYPE, 
                                event_service: EventService, notification_service: NotificationService, db: Database):
@@ -42,7 +56,7 @@ async def handle_admin_commands(update: Update, context: ContextTypes.DEFAULT_TY
         if not update.effective_user:
             is_joined = False
         else:
-            is_joined = get_is_joined(db, event_service, update.effective_user.id)
+            is_joined = await get_is_joined_async(db, event_service, update.effective_user.id)
         
         await update.message.reply_text(
             "Вы вышли из админского режима.",
@@ -51,7 +65,7 @@ async def handle_admin_commands(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
     if admin_state == 'main':
-        await handle_main_admin_menu(update, context, text, event_service, db)
+        await handle_main_admin_menu(update, context, text, event_service, notification_service, db)
     elif admin_state == 'create_event':
         await handle_create_event(update, context, text, event_service, notification_service)
     elif admin_state == 'settings':
@@ -69,7 +83,7 @@ async def handle_admin_commands(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 async def handle_main_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, 
-                                 event_service: EventService, db: Database):
+                                 event_service: EventService, notification_service: NotificationService, db: Database):
     """Обработка главного админского меню."""
     if not update.message:
         return
@@ -85,9 +99,9 @@ async def handle_main_admin_menu(update: Update, context: ContextTypes.DEFAULT_T
     elif text == "❌ Отменить событие":
         await show_active_events_for_deletion(update, context, event_service)
     elif text == "👥 Список пользователей":
-        await show_users_list(update, context, db)
+        await show_users_list(update, context, event_service)
     elif text == "📊 Статистика":
-        await show_statistics(update, context, db)
+        await show_statistics(update, context, event_service, notification_service)
     elif text == "⚙️ Настройки":
         user_data['admin_state'] = 'settings'
         await update.message.reply_text(
@@ -129,8 +143,8 @@ async def handle_create_event(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         if event_name_part:
             target_date = get_now_with_timezone().date() + timedelta(days=days_offset)
-            event_id = event_service.create_event_on_date(target_date)
-            event = event_service.get_event_by_id(event_id)
+            event_id = await event_service.create_event_on_date_async(target_date)
+            event = await event_service.get_event_by_id_async(event_id)
             if event:
                 await notification_service.send_event_notification(event_id, event['name'])
                 await update.message.reply_text(f"✅ Событие создано: {event['name']}")
@@ -158,7 +172,7 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE, te
         await update.message.reply_text("Админское меню:", reply_markup=create_admin_keyboard())
         return
     elif text == "👥 Лимит участников":
-        current_limit = event_service.get_participant_limit()
+        current_limit = await event_service.get_participant_limit_async()
         user_data['admin_state'] = 'participant_limit'
         await update.message.reply_text(
             f"Текущий лимит участников: {current_limit}\n\nВыберите новый лимит:",
@@ -191,49 +205,33 @@ async def handle_participant_limit(update: Update, context: ContextTypes.DEFAULT
     
     if text in limit_map:
         new_limit = limit_map[text]
-        old_limit = event_service.get_participant_limit()
+        old_limit = await event_service.get_participant_limit_async()
         
         # Устанавливаем новый лимит и получаем перемещенных участников
-        moved_participants = event_service.set_participant_limit(new_limit)
-        
-        # Отправляем уведомления перемещенным участникам
-        for moved_participant in moved_participants:
-            await notification_service.send_moved_to_main_notification(
-                moved_participant['telegram_id'], 
-                moved_participant['username']
+        try:
+            moved_participants = await event_service.set_participant_limit_async(new_limit)
+        except Exception as e:
+            logger.error(f"Ошибка при пересчете статусов после изменения лимита: {e}")
+            await update.message.reply_text(
+                f"❌ Лимит сохранен ({new_limit}), но статусы участников пересчитать не удалось: {e}\n\n"
+                f"Уведомления участникам не отправлены, попробуйте выбрать лимит еще раз."
             )
-            
-            # Отправляем обновленный список участников перемещенным пользователям
-            try:
-                # Получаем информацию о событии
-                active_events = event_service.get_active_events()
-                if active_events:
-                    event_info = event_service.get_event_by_id(active_events[0]['id'])
-                    participants_list = event_service.get_participants_list(active_events[0]['id'], event_info)
-                    
-                    await notification_service.bot.send_message(
-                        chat_id=moved_participant['telegram_id'],
-                        text=f"📋 Обновленный список участников:\n\n{participants_list}"
-                    )
-            except Exception as e:
-                logger.error(f"Ошибка при отправке списка участников пользователю {moved_participant['telegram_id']}: {e}")
+            return
         
-        # Отправляем уведомление всем пользователям об изменении лимита
-        subscribed_users = db.get_subscribed_users()
-        for telegram_id in subscribed_users:
-            try:
-                # Обновляем клавиатуру для каждого пользователя
-                is_joined = get_is_joined(db, event_service, telegram_id)
-                from utils.keyboard import create_main_keyboard
-                keyboard = create_main_keyboard(is_joined=is_joined)
-                
-                await notification_service.bot.send_message(
-                    chat_id=telegram_id,
-                    text=f"🔄 Лимит участников изменен с {old_limit} на {new_limit}",
-                    reply_markup=keyboard
+        # Перемещенным участникам - одно сообщение с уведомлением и обновленным списком,
+        # список рендерится один раз на всю рассылку
+        if moved_participants:
+            active_events = await event_service.get_active_events_async()
+            if active_events:
+                event_info = await event_service.get_event_by_id_async(active_events[0]['id'])
+                participants_list = await event_service.get_participants_list_async(active_events[0]['id'], event_info)
+                await notification_service.send_moved_to_main_notifications(
+                    [moved_participant['telegram_id'] for moved_participant in moved_participants],
+                    participants_list
                 )
-            except Exception as e:
-                logger.error(f"Ошибка при обновлении клавиатуры пользователя {telegram_id}: {e}")
+        
+        # Отправляем уведомление всем пользователям об изменении лимита
+        await notification_service.send_limit_changed_notification(old_limit, new_limit)
         
         await update.message.reply_text(
             f"✅ Лимит участников изменен с {old_limit} на {new_limit}.\n\n"
@@ -257,7 +255,7 @@ async def show_active_events_for_deletion(update: Update, context: ContextTypes.
     if not update.message:
         return
     
-    active_events = event_service.get_active_events()
+    active_events = await event_service.get_active_events_async()
     
     if not active_events:
         await update.message.reply_text("Нет активных событий для удаления.")
@@ -286,23 +284,14 @@ async def handle_confirm_delete(update: Update, context: ContextTypes.DEFAULT_TY
         event_to_delete = next((event for event in active_events if event['id'] == event_id), None)
         if event_to_delete:
             # Получаем участников до удаления
-            participants = event_service.db.get_event_participants(event_id)
+            participants = await event_service.async_db.get_event_participants(event_id)
             # Удаляем событие
-            event_service.delete_event(event_to_delete['id'])
+            await event_service.delete_event_async(event_to_delete['id'])
             await update.message.reply_text(f"✅ Событие '{event_to_delete['name']}' удалено.")
             # Обновляем клавиатуру для всех участников
-            from utils.keyboard import create_main_keyboard
-            for participant in participants:
-                telegram_id = participant['telegram_id']
-                keyboard = create_main_keyboard(is_joined=False)
-                try:
-                    await notification_service.bot.send_message(
-                        chat_id=telegram_id,
-                        text="❌ Событие отменено. Вы можете записаться на следующее!",
-                        reply_markup=keyboard
-                    )
-                except Exception as e:
-                    logger.error(f'Ошибка при отправке клавиатуры после удаления события для {telegram_id}: {e}')
+            await notification_service.send_event_cancelled_notification(
+                [participant['telegram_id'] for participant in participants]
+            )
         else:
             events_text = "❌ Неверный ID события.\n\nДоступные события:\n" + "\n".join(
                 [f"{event['name']} (ID: {event['id']})" for event in active_events]
@@ -315,12 +304,12 @@ async def handle_confirm_delete(update: Update, context: ContextTypes.DEFAULT_TY
     await update.message.reply_text("Админское меню:", reply_markup=create_admin_keyboard())
 
 
-async def show_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE, db: Database):
+async def show_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE, event_service: EventService):
     """Показать список пользователей."""
     if not update.message:
         return
     
-    users = db.get_all_users()
+    users = await event_service.async_db.get_all_users()
     
     if not users:
         await update.message.reply_text("В базе данных нет пользователей.")
@@ -340,21 +329,93 @@ async def show_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE, db
     await update.message.reply_text(users_text)
 
 
-async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE, db: Database):
+async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE, event_service: EventService,
+                          notification_service: NotificationService):
     """Показать статистику пользователей и событий, а также количество участников на ближайшее событие."""
     if not update.message:
         return
-    total_users = db.get_total_users_count()
-    active_events = db.get_active_events()
+    async_db = event_service.async_db
+    total_users = await async_db.get_total_users_count()
+    active_events = await event_service.get_active_events_async()
     total_active_events = len(active_events)
     participants_count = 0
     if active_events:
         event_id = active_events[0]['id']
-        participants = db.get_event_participants(event_id)
-        participants_count = len(participants)
+        counts = await async_db.run(event_service.get_participant_counts, event_id)
+        participants_count = counts['total']
+    roster_cache = event_service.get_roster_cache_stats()
+    state_cache = event_service.get_state_cache_stats()
     stat_text = (
         f"Всего пользователей: {total_users}\n"
         f"Активных событий: {total_active_events}\n"
-        f"Записано на ближайшее событие: {participants_count} спортсменов"
+        f"Записано на ближайшее событие: {participants_count} спортсменов\n"
+        f"Кэш списка участников: {roster_cache['hit_rate']:.0%} попаданий "
+        f"({roster_cache['hits']} из {roster_cache['hits'] + roster_cache['misses']})\n"
+        f"Кэш состояния событий: {state_cache['hit_rate']:.0%} попаданий "
+        f"({state_cache['hits']} из {state_cache['hits'] + state_cache['misses']})"
+    )
+    pool = event_service.db.get_pool_stats()
+    stat_text += (
+        f"\nПул соединений с базой: открыто {pool['size']} из {pool['max_size']} (свободно {pool['idle']}), "
+        f"повторных выдач {pool['hits']}, новых {pool['misses']}, ожиданий {pool['waits']} ({pool['wait_time']:.2f} с)"
+    )
+    pruned = await async_db.get_pruned_users_stats()
+    if pruned:
+        reasons = ", ".join(
+            f"{PRUNE_REASONS.get(reason, reason)}: {count}" for reason, count in sorted(pruned.items())
+        )
+        stat_text += f"\nОтписано недоступных чатов: {sum(pruned.values())} ({reasons})"
+    outbox = await notification_service.outbox.get_stats()
+    stat_text += (
+        f"\nОчередь сообщений: {outbox['pending']} ожидают (задержка {outbox['lag']:.0f} с), "
+        f"в dead-letter {outbox['dead']}; доставлено {outbox['sent']}, повторов {outbox['retried']}"
     )
-    await update.message.reply_text(stat_text) 
\ No newline at end of file
+    persistence = context.application.persistence
+    if isinstance(persistence, DatabasePersistence):
+        flush = persistence.get_stats()
+        stat_text += (
+            f"\nСохранение состояния: ожидают записи {flush['dirty']}, "
+            f"последняя пачка {flush['last_batch']} за {flush['last_flush_ms']:.0f} мс "
+            f"(в среднем {flush['avg_flush_ms']:.0f} мс, макс. {flush['max_flush_ms']:.0f} мс, ошибок {flush['errors']})"
+        )
+    query_stats = event_service.db.get_query_stats()
+    if query_stats is None:
+        await update.message.reply_text(stat_text)
+        return
+    stat_text += (
+        f"\nЗапросов к базе: {query_stats['statements']} за {query_stats['time_ms']:.0f} мс, "
+        f"медленных: {len(query_stats['slow_queries'])}"
+    )
+    await update.message.reply_text(stat_text, reply_markup=create_statistics_keyboard())
+
+
+async def show_db_load(update: Update, context: ContextTypes.DEFAULT_TYPE, db: Database):
+    """Показать нагрузку на базу по обработчикам и последние медленные запросы."""
+    query = update.callback_query
+    if not query:
+        return
+    query_stats = db.get_query_stats()
+    if query_stats is None:
+        await query.edit_message_text("Статистика запросов выключена (DATABASE_QUERY_STATS=0).")
+        return
+    lines = [f"🗄 Нагрузка на базу: {query_stats['statements']} запросов за {query_stats['time_ms']:.0f} мс", ""]
+    for item in query_stats['labels'][:DB_LOAD_TOP]:
+        per_run = ""
+        if item['runs']:
+            per_run = f", на запуск: {item['statements_per_run']:.1f} запросов, {item['ms_per_run']:.1f} мс"
+        lines.append(
+            f"• {item['label']}: запусков {item['runs']}{per_run}; всего {item['statements']} запросов, "
+            f"{item['time_ms']:.0f} мс, строк {item['rows']}, соединений {item['connections']}"
+        )
+    slow_queries = query_stats['slow_queries'][-DB_LOAD_SLOW:]
+    lines.append("")
+    if slow_queries:
+        lines.append(f"Медленные запросы (от {query_stats['slow_query_ms']:.0f} мс):")
+        for slow in reversed(slow_queries):
+            lines.append(f"• {slow['ms']:.0f} мс, {slow['label']}: {slow['sql'][:150]}")
+            if slow['plan']:
+                lines.append(f"  План: {slow['plan'][:200]}")
+    else:
+        lines.append(f"Медленных запросов (от {query_stats['slow_query_ms']:.0f} мс) нет")
+    # Ограничение Telegram на длину сообщения
+    await query.edit_message_text("\n".join(lines)[:4000])
\ No newline at end of file
@@ -3,8 +3,9 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from services.event_service import EventService
 from services.notification_service import NotificationService
+from services.update_processor import ROSTER_KEY, release_update_key
 from data.database import Database
-from utils.keyboard import create_main_keyboard, create_leave_confirmation_keyboard, get_is_joined
+from utils.keyboard import create_main_keyboard, create_leave_confirmation_keyboard, get_is_joined_async
 from config.settings import MESSAGES
 
 logger = logging.getLogger(__name__)
@@ -22,7 +23,7 @@ async def handle_event_actions(update: Update, context: ContextTypes.DEFAULT_TYP
     text = text.strip()
     
     # Получаем активное событие
-    active_events = event_service.get_active_events()
+    active_events = await event_service.get_active_events_async()
     if not active_events:
         await update.message.reply_text("В данный момент нет активных событий.")
         return
@@ -34,7 +35,7 @@ async def handle_event_actions(update: Update, context: ContextTypes.DEFAULT_TYP
     # Удаляю все старые проверки статуса пользователя, оставляю только get_is_joined
     
     if text == "Иду на тренировку!":
-        is_joined = get_is_joined(db, event_service, user.id)
+        is_joined = await get_is_joined_async(db, event_service, user.id)
         if is_joined:
             await update.message.reply_text(
                 "Вы уже записаны на это событие.",
@@ -44,7 +45,7 @@ async def handle_event_actions(update: Update, context: ContextTypes.DEFAULT_TYP
         await handle_join_event(update, context, event_service, notification_service, db, event_id, user)
     
     elif text == "Передумал! Отписываюсь(":
-        is_joined = get_is_joined(db, event_service, user.id)
+        is_joined = await get_is_joined_async(db, event_service, user.id)
         if not is_joined:
             await update.message.reply_text(
                 "Вы не записаны на это событие.",
@@ -66,27 +67,31 @@ async def handle_join_event(update: Update, context: ContextTypes.DEFAULT_TYPE,
     """Обработка записи на событие"""
     if not update.message:
         return
+    
+    if event_service.join_queue.is_rush(event_id):
+        await handle_join_rush(update, event_service, notification_service, db, event_id, user)
+        return
         
     try:
-        result = event_service.join_event(
+        result = await event_service.join_event_async(
             event_id, 
             user.id, 
             user.username, 
             user.first_name, 
-            user.last_name
+            user.last_name,
+            confirm_presence=True  # Сразу подтверждаем присутствие
         )
+        # Место в списке уже определено - следующие записи можно обрабатывать параллельно с ответами
+        release_update_key(ROSTER_KEY)
         
         if result['success']:
-            # Сразу подтверждаем присутствие
-            event_service.confirm_presence(event_id, user.id)
-            
             await update.message.reply_text(result['message'] + "\n\n✅ Ваше присутствие подтверждено!")
             
             # Получаем информацию о событии
-            event_info = event_service.get_event_by_id(event_id)
+            event_info = await event_service.get_event_by_id_async(event_id)
             
             # Показываем список участников
-            participants_list = event_service.get_participants_list(event_id, event_info)
+            participants_list = await event_service.get_participants_list_async(event_id, event_info)
             await update.message.reply_text(participants_list)
             
             # Уведомляем всех об изменении
@@ -95,7 +100,7 @@ async def handle_join_event(update: Update, context: ContextTypes.DEFAULT_TYPE,
             )
             
             # Проверяем актуальное состояние пользователя и обновляем клавиатуру
-            is_joined = get_is_joined(db, event_service, user.id)
+            is_joined = await get_is_joined_async(db, event_service, user.id)
             
             await update.message.reply_text(
                 "Обновлено", 
@@ -103,7 +108,7 @@ async def handle_join_event(update: Update, context: ContextTypes.DEFAULT_TYPE,
             )
         else:
             # Проверяем актуальное состояние пользователя
-            is_joined = get_is_joined(db, event_service, user.id)
+            is_joined = await get_is_joined_async(db, event_service, user.id)
             
             await update.message.reply_text(
                 result['message'],
@@ -114,6 +119,40 @@ async def handle_join_event(update: Update, context: ContextTypes.DEFAULT_TYPE,
         logger.error(f"Ошибка при записи на событие: {e}", exc_info=True)
         await notification_service.send_error_notification(user.id, "Ошибка при записи на событие")
 
+async def handle_join_rush(update: Update, event_service: EventService,
+                           notification_service: NotificationService, db: Database, event_id: int, user):
+    """Запись в режиме наплыва после анонса: очередь, пачки и один ответ.
+
+    Место определяется порядком постановки в очередь, а не порядком записи
+    в базу; вместо списка участников и отдельного обновления клавиатуры
+    пользователь сразу получает один ответ со своим номером.
+    """
+    if not update.message:
+        return
+    
+    try:
+        pending = event_service.join_queue.submit(event_id, user.id, user.username, user.first_name, user.last_name)
+        # Место в очереди занято - следующие нажатия принимаются, пока пачка записывается
+        release_update_key(ROSTER_KEY)
+        result = await pending
+        
+        if not result['success']:
+            is_joined = await get_is_joined_async(db, event_service, user.id)
+            await update.message.reply_text(result['message'], reply_markup=create_main_keyboard(is_joined=is_joined))
+            return
+        
+        await update.message.reply_text(
+            f"{result['message']}\n\n✅ Ваше присутствие подтверждено!\nВаш номер в списке: {result['number']}",
+            reply_markup=create_main_keyboard(is_joined=True)
+        )
+        await notification_service.send_participants_update(
+            event_id, user.id, user.username or f"Пользователь {user.id}", "записался"
+        )
+    
+    except Exception as e:
+        logger.error(f"Ошибка при записи на событие: {e}", exc_info=True)
+        await notification_service.send_error_notification(user.id, "Ошибка при записи на событие")
+
 async def handle_leave_event(update: Update, context: ContextTypes.DEFAULT_TYPE, 
                             event_service: EventService, notification_service: NotificationService, 
                             event_id: int, user):
@@ -142,9 +181,9 @@ async def handle_show_participants(update: Update, context: ContextTypes.DEFAULT
         
     try:
         # Получаем информацию о событии
-        event_info = event_service.get_event_by_id(event_id)
+        event_info = await event_service.get_event_by_id_async(event_id)
         
-        participants_list = event_service.get_participants_list(event_id, event_info)
+        participants_list = await event_service.get_participants_list_async(event_id, event_info)
         await update.message.reply_text(participants_list)
     
     except Exception as e:
@@ -158,7 +197,7 @@ async def update_main_keyboard(update: Update, db: Database, event_service: Even
         
     try:
         # Проверяем актуальное состояние пользователя
-        is_joined = get_is_joined(db, event_service, user.id)
+        is_joined = await get_is_joined_async(db, event_service, user.id)
         # Обновляем клавиатуру
         await update.message.reply_text(
             "Клавиатура обновлена", 
@@ -4,7 +4,7 @@ from telegram.ext import ContextTypes
 from services.event_service import EventService
 from services.notification_service import NotificationService
 from data.database import Database
-from utils.keyboard import create_main_keyboard, get_is_joined
+from utils.keyboard import create_main_keyboard, get_is_joined_async
 from config.settings import MESSAGES
 
 logger = logging.getLogger(__name__)
@@ -21,18 +21,20 @@ async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE,
         
     try:
         # Добавляем пользователя в базу данных
-        db.add_user(user.id, user.username, user.first_name, user.last_name)
+        await event_service.async_db.add_user(user.id, user.username, user.first_name, user.last_name)
+        # Пользователь, отписанный из-за блокировки бота, снова пишет боту - возвращаем рассылки
+        if await event_service.async_db.restore_pruned_subscription(user.id):
+            logger.info(f"Пользователю {user.id} возвращена подписка после разблокировки бота")
         
         # Получаем активные события
-        active_events = event_service.get_active_events()
+        active_events = await event_service.get_active_events_async()
         
         if active_events:
             # Берем первое активное событие
             current_event = active_events[0]
-            event_id = current_event['id']
-            
+
             # Проверяем, записан ли пользователь
-            is_joined = get_is_joined(db, event_service, user.id)
+            is_joined = await get_is_joined_async(db, event_service, user.id)
             logger.info(f"DEBUG: /start user.id={user.id}, is_joined={is_joined}")
             
             # Создаем клавиатуру
@@ -1,20 +1,30 @@
 import logging
 import locale
 import os
-from datetime import datetime, time
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+from datetime import time, timedelta
+from time import perf_counter
+from typing import Dict, List, Optional
+from telegram import Bot, Update
+from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, TypeHandler, filters
 from pytz import timezone
 
 from config.secure import secrets
-from config.settings import BOT_SETTINGS, MESSAGES, ADMIN_IDS
+from config.settings import BROADCAST_SETTINGS, MESSAGES, ADMIN_IDS
 from data.database import Database
+from data.async_database import AsyncDatabase
+from data.persistence import DatabasePersistence
+from data.query_stats import set_query_label
+from data.settings_store import SCHEDULE_SETTINGS
 from services.event_service import EventService
+from services.job_leader import JobLeader
 from services.notification_service import NotificationService
-from utils.keyboard import create_main_keyboard, get_is_joined
+from services.update_processor import ROSTER_KEY, KeyedUpdateProcessor, release_update_key
+from utils.keyboard import create_main_keyboard, create_roster_keyboard, get_is_joined_async, get_keyboard_texts
+from utils.metrics import HANDLER_ERRORS, JOB_DURATION, InstrumentedHTTPXRequest, MetricsServer, bind_pool_stats
+from utils.timezone_utils import get_now_with_timezone
 from handlers.start_handler import handle_start
 from handlers.event_handler import handle_event_actions
-from handlers.admin_handler import handle_admin_commands
+from handlers.admin_handler import handle_admin_commands, show_db_load
 
 # Устанавливаем локаль на русский язык для вывода даты
 locale.setlocale(locale.LC_TIME, 'C')
@@ -43,17 +53,55 @@ if not TOKEN:
 # Убеждаемся, что TOKEN не None для типизации
 assert TOKEN is not None, "BOT_API_TOKEN не может быть None"
 
-db = Database()
-event_service = EventService(db)
+# Несколько реплик бота с общей базой: общее состояние пользователей в БД,
+# задачи по расписанию выполняет только ведущая реплика
+MULTI_REPLICA = os.getenv('MULTI_REPLICA', '0') == '1'
+
+# Кнопки клавиатур - метки статистики запросов к базе
+KEYBOARD_TEXTS = get_keyboard_texts()
 
 class VolleyballBot:
-    def __init__(self):
+    def __init__(self, bot: Optional[Bot] = None, db: Optional[Database] = None):
+        # bot и db передаются бенчмарками (Bot с подменным сетевым слоем, база
+        # со счетчиком запросов), иначе - по TOKEN и настройкам окружения
         # TOKEN уже проверен выше, поэтому здесь он точно не None
         # assert выше гарантирует что TOKEN не None
-        self.application = ApplicationBuilder().token(TOKEN).build()
-        self.db = Database()
-        self.event_service = EventService(self.db)
-        self.notification_service = NotificationService(self.application.bot, self.db)
+        self.db = db or Database()
+        self.async_db = AsyncDatabase.shared(self.db)
+        # user_data (состояние админ-панели, подтверждение отписки) хранится в базе
+        # и переживает перезапуск; запись пачками раз в PERSISTENCE_FLUSH_INTERVAL секунд
+        self.persistence = DatabasePersistence(
+            self.db,
+            update_interval=float(os.getenv('PERSISTENCE_FLUSH_INTERVAL', '10')),
+            refresh=MULTI_REPLICA
+        )
+        # Обновления разных пользователей обрабатываются параллельно, одного
+        # пользователя и изменения состава - по очереди
+        builder = (
+            # Запросы к Bot API (кроме getUpdates) замеряются для метрик
+            (ApplicationBuilder().bot(bot) if bot else
+             ApplicationBuilder().token(TOKEN).request(InstrumentedHTTPXRequest(connection_pool_size=256)))
+            .persistence(self.persistence)
+            .concurrent_updates(KeyedUpdateProcessor(int(os.getenv('UPDATE_CONCURRENCY', '256'))))
+            .post_init(self.on_startup).post_stop(self.on_stop)
+        )
+        self.leader = None
+        if MULTI_REPLICA:
+            if self.db.backend.name == 'sqlite':
+                logger.warning("MULTI_REPLICA с SQLite: реплики должны работать с одним файлом базы на одном хосте")
+            self.leader = JobLeader(self.db)
+            builder = builder.post_shutdown(self.on_shutdown)
+            logger.info(f"Режим нескольких реплик, ID реплики: {self.leader.replica_id}")
+        self.application = builder.build()
+        self.event_service = EventService(self.db, self.async_db, cache_enabled=not MULTI_REPLICA)
+        self.notification_service = NotificationService(self.application.bot, self.db, self.event_service)
+        self._daily_jobs = []
+        # Метрики Prometheus на отдельном порту (рядом с портом webhook), 0 - выключены
+        metrics_port = int(os.getenv('METRICS_PORT', '0'))
+        bind_pool_stats(self.db.get_pool_stats)
+        self.metrics_server = (
+            MetricsServer(host=os.getenv('METRICS_HOST', '0.0.0.0'), port=metrics_port) if metrics_port else None
+        )
         
     def setup_handlers(self):
         """Настройка обработчиков"""
@@ -66,6 +114,14 @@ class VolleyballBot:
         
         # Обработка текстовых сообщений
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.message_handler))
+        
+        # Сохранение состояния пользователя сразу после обработки: следующее
+        # обновление того же пользователя может попасть на другую реплику
+        if MULTI_REPLICA:
+            self.application.add_handler(TypeHandler(Update, self.persist_user_state), group=1)
+        
+        # Необработанные исключения обработчиков и задач
+        self.application.add_error_handler(self.error_handler)
 
     def setup_jobs(self):
         """Настройка планировщика задач"""
@@ -73,27 +129,156 @@ class VolleyballBot:
         if not job_queue:
             logger.warning("Job queue недоступен")
             return
-        from pytz import timezone
-        tz = timezone('Asia/Yekaterinburg')
-        # Создание событий по расписанию (вторник и пятница в 17:00)
-        job_queue.run_daily(self.create_scheduled_events, time(hour=17, minute=0, tzinfo=tz), days=(1, 4))  # 1=вторник, 4=пятница
-        # Напоминания за 2 часа до тренировки
-        job_queue.run_daily(self.send_presence_reminders, time(hour=18, minute=0, tzinfo=tz), days=(3, 6))  # 3=четверг, 6=воскресенье
-        # Повторные напоминания за 1:05 до тренировки
-        job_queue.run_daily(self.send_second_reminders, time(hour=18, minute=55, tzinfo=tz), days=(3, 6))
-        # Автоматическая отписка через 5 минуты после второго напоминания
-        job_queue.run_daily(self.auto_leave_unconfirmed, time(hour=19, minute=0, tzinfo=tz), days=(3, 6))
-        # Очистка прошедших событий каждый день в 21:59
-        job_queue.run_daily(self.cleanup_past_events, time(hour=21, minute=59, tzinfo=tz))
+        self.schedule_daily_jobs()
+        # Расписание перестраивается при изменении времени или дней тренировок
+        self.event_service.settings.subscribe(SCHEDULE_SETTINGS, self._on_schedule_changed)
+        # Периодический перенос WAL в основной файл базы
+        job_queue.run_repeating(self._labeled(self.checkpoint_database), interval=int(os.getenv('DATABASE_CHECKPOINT_INTERVAL', 600)), first=60)
+        # Периодическая сводка нагрузки на базу в журнал
+        if self.db.query_stats is not None:
+            interval = int(os.getenv('DATABASE_STATS_LOG_INTERVAL', 3600))
+            job_queue.run_repeating(self._labeled(self.log_query_stats), interval=interval, first=interval)
+        if self.leader:
+            # Продление аренды планировщика и подхват настроек, измененных другими репликами
+            job_queue.run_repeating(self._labeled(self.renew_leadership), interval=self.leader.lease_seconds / 3, first=0)
+            job_queue.run_repeating(self._labeled(self.refresh_settings), interval=30, first=30)
         # Создание первого события при запуске
-        job_queue.run_once(self.create_initial_event, 0)
+        job_queue.run_once(self._exclusive(self.create_initial_event), 0)
+    
+    def schedule_daily_jobs(self):
+        """Запланировать ежедневные задачи по настройкам из БД (старые задачи снимаются)"""
+        job_queue = self.application.job_queue
+        if not job_queue:
+            return
+        for job in self._daily_jobs:
+            job.schedule_removal()
+        
+        settings = self.event_service.settings
+        tz = timezone('Asia/Yekaterinburg')
+        # В JobQueue дни нумеруются с воскресенья (0 - воскресенье, 4 - четверг)
+        training_days = tuple((day + 1) % 7 for day in settings.get_training_weekdays())
+        # События создаются за 2 дня до тренировки (вторник и пятница)
+        creation_days = tuple((day - 2) % 7 for day in training_days)
+        
+        def at(key: str) -> time:
+            return settings.get(key).replace(tzinfo=tz)
+        
+        self._daily_jobs = [
+            # Создание событий по расписанию
+            job_queue.run_daily(self._exclusive(self.create_scheduled_events, 'event_creation_time'), at('event_creation_time'), days=creation_days),
+            # Напоминания за 2 часа до тренировки
+            job_queue.run_daily(self._exclusive(self.send_presence_reminders, 'reminder_time'), at('reminder_time'), days=training_days),
+            # Повторные напоминания за 1:05 до тренировки
+            job_queue.run_daily(self._exclusive(self.send_second_reminders, 'second_reminder_time'), at('second_reminder_time'), days=training_days),
+            # Автоматическая отписка через 5 минуты после второго напоминания
+            job_queue.run_daily(self._exclusive(self.auto_leave_unconfirmed, 'auto_leave_time'), at('auto_leave_time'), days=training_days),
+            # Очистка прошедших событий каждый день
+            job_queue.run_daily(self._exclusive(self.cleanup_past_events, 'event_cleanup_time'), at('event_cleanup_time')),
+        ]
+        logger.info(f"Расписание задач: дни тренировок {training_days}, создание событий {creation_days}")
+    
+    def _exclusive(self, callback, time_setting: Optional[str] = None):
+        """Задача по расписанию, которая при нескольких репликах выполняется один раз.
+
+        ``time_setting`` - настройка со временем ежедневного запуска; без нее
+        (задача при старте) запуск один на день.
+        """
+        if self.leader is None:
+            return self._labeled(callback)
+        
+        async def job(context: ContextTypes.DEFAULT_TYPE):
+            run_key = self._scheduled_run_key(time_setting)
+            await self.leader.run_exclusive(callback.__name__, lambda: callback(context), run_key)
+        
+        job.__name__ = callback.__name__
+        return self._labeled(job)
+    
+    def _scheduled_run_key(self, time_setting: Optional[str]) -> str:
+        """Ключ запуска - время по расписанию, а не момент срабатывания таймера.
+
+        Берется ближайшее к текущему моменту время из настройки (вчера, сегодня
+        или завтра), поэтому расхождение часов реплик и поздний старт не
+        меняют ключ.
+        """
+        now = get_now_with_timezone()
+        if time_setting is None:
+            return now.strftime('%Y-%m-%d')
+        scheduled = self.event_service.settings.get(time_setting)
+        today = now.replace(hour=scheduled.hour, minute=scheduled.minute, second=0, microsecond=0)
+        fire_time = min((today + timedelta(days=offset) for offset in (-1, 0, 1)), key=lambda t: abs(t - now))
+        return fire_time.strftime('%Y-%m-%d %H:%M')
+    
+    def _labeled(self, callback):
+        """Задача планировщика, запросы и длительность которой учитываются под ее именем"""
+        async def job(context: ContextTypes.DEFAULT_TYPE):
+            set_query_label(f"job:{callback.__name__}")
+            started = perf_counter()
+            try:
+                await callback(context)
+            finally:
+                JOB_DURATION.observe(perf_counter() - started, callback.__name__)
+        
+        job.__name__ = callback.__name__
+        return job
+    
+    async def renew_leadership(self, context: ContextTypes.DEFAULT_TYPE):
+        """Продлить аренду планировщика (или перехватить истекшую)"""
+        try:
+            await self.leader.renew()
+        except Exception as e:
+            logger.error(f"Ошибка при продлении аренды планировщика: {e}")
+    
+    async def refresh_settings(self, context: ContextTypes.DEFAULT_TYPE):
+        """Перечитать настройки, которые могла изменить другая реплика"""
+        try:
+            await self.async_db.run(self.event_service.settings.reload, True)
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении настроек: {e}")
+    
+    async def persist_user_state(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Записать user_data в общую базу сразу после обработки обновления"""
+        if update.effective_user and context.user_data is not None:
+            await self.persistence.update_user_data(update.effective_user.id, context.user_data)
+            await self.persistence.flush()
+    
+    async def on_startup(self, application):
+        """Запустить отправку сообщений из очереди и сервер метрик"""
+        self.notification_service.outbox.start()
+        if self.metrics_server:
+            await self.metrics_server.start()
+    
+    async def on_stop(self, application):
+        """Остановить отправку из очереди до закрытия соединений бота; неотправленное останется в базе"""
+        await self.notification_service.outbox.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+    
+    async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Учесть необработанное исключение в метриках и записать его в журнал"""
+        HANDLER_ERRORS.inc(type(context.error).__name__)
+        if update is None and context.job is not None:
+            logger.error(f"Ошибка в задаче {context.job.name}: {context.error}", exc_info=context.error)
+            return
+        logger.error(f"Необработанная ошибка при обработке {update}: {context.error}", exc_info=context.error)
+    
+    async def on_shutdown(self, application):
+        """Отдать аренду планировщика при остановке реплики"""
+        if self.leader:
+            await self.leader.release()
+    
+    def _on_schedule_changed(self, key: str, old_value, new_value):
+        """Перестроить расписание после изменения настройки"""
+        logger.info(f"Изменена настройка расписания {key}: {old_value} -> {new_value}")
+        self.schedule_daily_jobs()
 
     async def start_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
+        set_query_label("command:start")
         await handle_start(update, context, self.event_service, self.notification_service, self.db)
 
     async def admin_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик админских команд"""
+        set_query_label("command:admin")
         if not update.effective_user:
             logger.warning("admin_handler: нет effective_user")
             return
@@ -120,6 +305,7 @@ class VolleyballBot:
             return
         data = query.data.split('_')
         action = data[0]
+        set_query_label(f"callback:{action}")
         
         if action in ['confirm', 'cancel']:
             await self.handle_leave_confirmation_callback(update, context, data)
@@ -128,6 +314,10 @@ class VolleyballBot:
         elif action == 'confirm_leave':
             # Обработка отписки из клавиатуры выбора действий
             await self.handle_leave_confirmation_callback(update, context, ['confirm'] + data[1:])
+        elif action == 'roster':
+            await self.handle_show_roster_callback(update, context, data)
+        elif action == 'dbload' and update.effective_user and update.effective_user.id in ADMIN_IDS:
+            await show_db_load(update, context, self.db)
 
     async def message_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик текстовых сообщений"""
@@ -137,6 +327,8 @@ class VolleyballBot:
         if not update.effective_user:
             return
         user = update.effective_user
+        # Кнопки клавиатур учитываются по отдельности, произвольный текст - под общей меткой
+        set_query_label(f"message:{text}" if text in KEYBOARD_TEXTS else "message:text")
         
         # Инициализируем user_data если его нет
         if context.user_data is None:
@@ -150,6 +342,22 @@ class VolleyballBot:
         # Обрабатываем обычные сообщения
         await handle_event_actions(update, context, text, self.event_service, self.notification_service, self.db)
 
+    async def handle_show_roster_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, data: list):
+        """Показать в живом сообщении полный список участников по кнопке.
+
+        Следующее изменение состава снова заменит его журналом изменений.
+        """
+        query = update.callback_query
+        if not query:
+            return
+        event_id = int(data[1])
+        event_info = await self.event_service.get_event_by_id_async(event_id)
+        if not event_info:
+            await query.edit_message_text("Событие уже прошло или отменено.")
+            return
+        roster = await self.notification_service.render_full_roster(event_info)
+        await query.edit_message_text(roster, reply_markup=create_roster_keyboard(event_id))
+
     async def handle_leave_confirmation_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, data: list):
         """Обработка подтверждения отписки через инлайн-кнопки"""
         query = update.callback_query
@@ -162,27 +370,28 @@ class VolleyballBot:
         
         if action == "cancel":
             # Пользователь передумал
-            event_info = self.event_service.get_event_by_id(event_id)
-            participants_list = self.event_service.get_participants_list(event_id, event_info)
+            event_info = await self.event_service.get_event_by_id_async(event_id)
+            participants_list = await self.event_service.get_participants_list_async(event_id, event_info)
             await query.edit_message_text(f"Вы передумали!🥳\n\n{participants_list}")
             return
         
         elif action == "confirm_presence":
             # Пользователь подтвердил присутствие
-            success = self.event_service.confirm_presence(event_id, telegram_id)
+            success = await self.event_service.confirm_presence_async(event_id, telegram_id)
+            release_update_key(ROSTER_KEY)
             if success:
                 await query.edit_message_text("✅ Присутствие подтверждено! Увидимся на тренировке!")
                 
                 # Показываем обновленный список участников
-                event_info = self.event_service.get_event_by_id(event_id)
-                participants_list = self.event_service.get_participants_list(event_id, event_info)
+                event_info = await self.event_service.get_event_by_id_async(event_id)
+                participants_list = await self.event_service.get_participants_list_async(event_id, event_info)
                 await self.application.bot.send_message(
                     chat_id=telegram_id,
                     text=participants_list
                 )
                 
                 # Обновляем клавиатуру
-                is_joined = get_is_joined(self.db, self.event_service, telegram_id)
+                is_joined = await get_is_joined_async(self.db, self.event_service, telegram_id)
                 await self.application.bot.send_message(
                     chat_id=telegram_id,
                     text="Клавиатура обновлена",
@@ -197,12 +406,14 @@ class VolleyballBot:
             user = update.effective_user
             if not user:
                 return
-            result = self.event_service.leave_event(event_id, telegram_id)
+            result = await self.event_service.leave_event_async(event_id, telegram_id)
+            release_update_key(ROSTER_KEY)
             if result['success']:
                 await query.edit_message_text(result['message'])
                 # Уведомляем всех об изменении
                 await self.notification_service.send_participants_update(
-                    event_id, telegram_id, user.username or f"Пользователь {telegram_id}", "отписался"
+                    event_id, telegram_id, user.username or f"Пользователь {telegram_id}", "отписался",
+                    moved_participant=result.get('moved_participant')
                 )
                 # Если кто-то переместился из резерва, уведомляем его
                 if result.get('moved_participant'):
@@ -211,7 +422,7 @@ class VolleyballBot:
                         moved_user['telegram_id'], moved_user['username']
                     )
                 # Отправляем новое сообщение с актуальной клавиатурой после отписки
-                is_joined = get_is_joined(self.db, self.event_service, telegram_id)
+                is_joined = await get_is_joined_async(self.db, self.event_service, telegram_id)
                 await self.application.bot.send_message(
                     chat_id=telegram_id,
                     text="Вы можете снова записаться на тренировку!",
@@ -220,7 +431,7 @@ class VolleyballBot:
             else:
                 await query.edit_message_text(result['message'])
                 # Если пользователь не записан, обновляем клавиатуру
-                is_joined = get_is_joined(self.db, self.event_service, telegram_id)
+                is_joined = await get_is_joined_async(self.db, self.event_service, telegram_id)
                 await self.application.bot.send_message(
                     chat_id=telegram_id,
                     text="Ваша клавиатура обновлена.",
@@ -243,20 +454,21 @@ class VolleyballBot:
         
         if action == "confirm_presence":
             # Пользователь подтвердил присутствие
-            success = self.event_service.confirm_presence(event_id, telegram_id)
+            success = await self.event_service.confirm_presence_async(event_id, telegram_id)
+            release_update_key(ROSTER_KEY)
             if success:
                 await query.edit_message_text("✅ Присутствие подтверждено! Увидимся на тренировке!")
                 
                 # Показываем обновленный список участников
-                event_info = self.event_service.get_event_by_id(event_id)
-                participants_list = self.event_service.get_participants_list(event_id, event_info)
+                event_info = await self.event_service.get_event_by_id_async(event_id)
+                participants_list = await self.event_service.get_participants_list_async(event_id, event_info)
                 await self.application.bot.send_message(
                     chat_id=telegram_id,
                     text=participants_list
                 )
                 
                 # Обновляем клавиатуру
-                is_joined = get_is_joined(self.db, self.event_service, telegram_id)
+                is_joined = await get_is_joined_async(self.db, self.event_service, telegram_id)
                 await self.application.bot.send_message(
                     chat_id=telegram_id,
                     text="Клавиатура обновлена",
@@ -273,117 +485,122 @@ class VolleyballBot:
                 'telegram_id': telegram_id
             }
     
-    # Методы для планировщика задач
+    # Методы для планировщика задач. Ошибки не перехватываются: неудачный запуск
+    # не отмечается выполненным, и его повторяет другая реплика; в журнал их пишет error_handler
     async def create_scheduled_events(self, context: ContextTypes.DEFAULT_TYPE):
         """Создание событий по расписанию"""
-        try:
-            event_ids = self.event_service.create_scheduled_events()
-            
-            for event_id in event_ids:
-                event = self.event_service.get_event_by_id(event_id)
-                if event:
-                    await self.notification_service.send_event_notification(event_id, event['name'])
-                    logger.info(f"Создано и анонсировано событие {event_id}")
+        event_ids = await self.event_service.create_scheduled_events_async()
         
-        except Exception as e:
-            logger.error(f"Ошибка при создании событий по расписанию: {e}")
+        for event_id in event_ids:
+            event = await self.event_service.get_event_by_id_async(event_id)
+            if event:
+                await self.notification_service.send_event_notification(event_id, event['name'])
+                logger.info(f"Создано и анонсировано событие {event_id}")
     
     async def create_initial_event(self, context: ContextTypes.DEFAULT_TYPE):
         """Создание первого события при запуске бота"""
-        try:
-            event_ids = self.event_service.create_scheduled_events()
+        event_ids = await self.event_service.create_scheduled_events_async()
+        
+        for event_id in event_ids:
+            event = await self.event_service.get_event_by_id_async(event_id)
+            if event:
+                await self.notification_service.send_event_notification(event_id, event['name'])
+                logger.info(f"Создано и анонсировано начальное событие {event_id}")
+    
+    async def _dispatch_reminders(self, context: ContextTypes.DEFAULT_TYPE, reminder_type: str,
+                                  only_ids: Optional[Dict[int, List[int]]] = None):
+        """Разослать напоминания по всем активным событиям.
+
+        Успешные отправки отмечаются одной транзакцией на событие. Неудачные
+        остаются неотмеченными и один раз повторяются через
+        REMINDER_RETRY_DELAY секунд; ``only_ids`` ограничивает повтор ими.
+        """
+        failed: Dict[int, List[int]] = {}
+        active_events = await self.event_service.get_active_events_async()
+        
+        for event in active_events:
+            if only_ids is not None and event['id'] not in only_ids:
+                continue
+            participants = await self.event_service.get_participants_for_reminder_async(event['id'], reminder_type)
+            telegram_ids = [participant['telegram_id'] for participant in participants]
+            if only_ids is not None:
+                retry_ids = set(only_ids[event['id']])
+                telegram_ids = [telegram_id for telegram_id in telegram_ids if telegram_id in retry_ids]
+            if not telegram_ids:
+                continue
             
-            for event_id in event_ids:
-                event = self.event_service.get_event_by_id(event_id)
-                if event:
-                    await self.notification_service.send_event_notification(event_id, event['name'])
-                    logger.info(f"Создано и анонсировано начальное событие {event_id}")
+            result = await self.notification_service.send_presence_reminders(
+                event['id'], telegram_ids, event['name'], reminder_type
+            )
+            await self.event_service.mark_reminders_sent_async(event['id'], result['sent_ids'], reminder_type)
+            if result['failed_ids']:
+                failed[event['id']] = result['failed_ids']
         
-        except Exception as e:
-            logger.error(f"Ошибка при создании начального события: {e}")
+        if failed and only_ids is None:
+            logger.warning(f"Не доставлено напоминаний: {sum(len(ids) for ids in failed.values())}, повтор запланирован")
+            context.job_queue.run_once(
+                self._labeled(self.retry_reminders),
+                when=BROADCAST_SETTINGS['REMINDER_RETRY_DELAY'],
+                data={'reminder_type': reminder_type, 'failed': failed}
+            )
     
     async def send_presence_reminders(self, context: ContextTypes.DEFAULT_TYPE):
         """Отправка напоминаний о подтверждении присутствия"""
-        try:
-            active_events = self.event_service.get_active_events()
-            
-            for event in active_events:
-                participants = self.event_service.get_participants_for_reminder(event['id'], 'first')
-                
-                for participant in participants:
-                    await self.notification_service.send_presence_reminder(
-                        event['id'], participant['telegram_id'], event['name'], 'first'
-                    )
-                    self.event_service.mark_reminder_sent(event['id'], participant['telegram_id'], 'first')
-        
-        except Exception as e:
-            logger.error(f"Ошибка при отправке напоминаний: {e}")
+        await self._dispatch_reminders(context, 'first')
     
     async def send_second_reminders(self, context: ContextTypes.DEFAULT_TYPE):
         """Отправка повторных напоминаний"""
-        try:
-            active_events = self.event_service.get_active_events()
-            
-            for event in active_events:
-                participants = self.event_service.get_participants_for_reminder(event['id'], 'second')
-                
-                for participant in participants:
-                    await self.notification_service.send_presence_reminder(
-                        event['id'], participant['telegram_id'], event['name'], 'second'
-                    )
-                    self.event_service.mark_reminder_sent(event['id'], participant['telegram_id'], 'second')
-        
-        except Exception as e:
-            logger.error(f"Ошибка при отправке повторных напоминаний: {e}")
+        await self._dispatch_reminders(context, 'second')
+    
+    async def retry_reminders(self, context: ContextTypes.DEFAULT_TYPE):
+        """Повторная отправка напоминаний, не доставленных в основной рассылке"""
+        data = context.job.data
+        await self._dispatch_reminders(context, data['reminder_type'], only_ids=data['failed'])
     
     async def auto_leave_unconfirmed(self, context: ContextTypes.DEFAULT_TYPE):
         """Автоматическая отписка неподтвердивших участников"""
-        try:
-            active_events = self.event_service.get_active_events()
-            
-            for event in active_events:
-                # Получаем участников для автоматической отписки
-                unconfirmed = self.event_service.get_unconfirmed_participants(event['id'])
-                
-                # Сначала отправляем уведомления об автоматической отписке
-                for participant in unconfirmed:
-                    await self.notification_service.send_auto_leave_notification(
-                        participant['telegram_id'], event['name']
-                    )
-                
-                # Автоматически отписываем и перемещаем из резерва
-                moved_participants = self.event_service.auto_leave_unconfirmed(event['id'])
-                
-                # После удаления из базы отправляем обновлённую клавиатуру
-                for participant in unconfirmed:
-                    from utils.keyboard import create_main_keyboard, get_is_joined
-                    is_joined = get_is_joined(self.db, self.event_service, participant['telegram_id'])
-                    await self.application.bot.send_message(
-                        chat_id=participant['telegram_id'],
-                        text="Вы можете снова записаться на тренировку!",
-                        reply_markup=create_main_keyboard(is_joined=is_joined)
-                    )
-                
-                # Уведомляем перемещенных участников
-                for moved_participant in moved_participants:
-                    await self.notification_service.send_moved_to_main_notification(
-                        moved_participant['telegram_id'], moved_participant['username']
-                    )
-                
-                # Если в резерве никого нет, уведомляем всех
-                if not moved_participants:
-                    await self.notification_service.send_no_reserve_notification(event['id'])
+        active_events = await self.event_service.get_active_events_async()
         
-        except Exception as e:
-            logger.error(f"Ошибка при автоматической отписке: {e}")
+        for event in active_events:
+            # Отписываем всех неподтвердивших и поднимаем резерв одной транзакцией
+            result = await self.event_service.auto_leave_unconfirmed_bulk_async(event['id'])
+            moved_participants = result['promoted']
+            
+            # Сообщаем отписанным и обновляем их клавиатуры
+            if result['removed']:
+                await self.notification_service.send_auto_leave_notifications(
+                    [participant['telegram_id'] for participant in result['removed']], event['name']
+                )
+            
+            # Уведомляем перемещенных участников
+            for moved_participant in moved_participants:
+                await self.notification_service.send_moved_to_main_notification(
+                    moved_participant['telegram_id'], moved_participant['username']
+                )
+            
+            # Если в резерве никого нет, уведомляем всех
+            if not moved_participants:
+                await self.notification_service.send_no_reserve_notification(event['id'])
     
     async def cleanup_past_events(self, context: ContextTypes.DEFAULT_TYPE):
         """Очистка прошедших событий"""
+        await self.event_service.cleanup_past_events_async()
+        if self.leader:
+            await self.async_db.cleanup_job_runs()
+        logger.info("Прошедшие события очищены")
+
+    async def checkpoint_database(self, context: ContextTypes.DEFAULT_TYPE):
+        """Checkpoint WAL-журнала базы данных"""
         try:
-            self.event_service.cleanup_past_events()
-            logger.info("Прошедшие события очищены")
+            result = await self.async_db.checkpoint()
+            if result and result['busy']:
+                logger.warning(f"Checkpoint базы данных выполнен не полностью: {result}")
         except Exception as e:
-            logger.error(f"Ошибка при очистке событий: {e}")
+            logger.error(f"Ошибка при checkpoint базы данных: {e}")
+
+    async def log_query_stats(self, context: ContextTypes.DEFAULT_TYPE):
+        """Записать в журнал сводку запросов к базе по обработчикам"""
+        logger.info(self.db.query_stats.summary())
 
     def run(self):
         """Запуск бота"""
@@ -391,25 +608,33 @@ class VolleyballBot:
         self.setup_handlers()
         self.setup_jobs()
         
-        # Определяем режим запуска
-        if os.getenv("USE_WEBHOOK", "0") == "1":
-            # Для Amvera/продакшн с webhook
-            logger.info("Запуск в режиме webhook")
-            self.application.run_webhook(
-                listen="0.0.0.0",
-                port=int(os.getenv("PORT", 80)),
-                url_path="",
-                webhook_url=os.getenv("WEBHOOK_URL", "")
-            )
-        elif os.getenv("AMVERA_DEPLOY", "0") == "1":
-            # Для Amvera без webhook (платформа сама настроит)
-            logger.info("Запуск на Amvera - платформа сама настроит webhook")
-            # Не вызываем ни run_polling, ни run_webhook
-            # Amvera сама вызовет нужный entrypoint
-        else:
-            # Для локальной разработки
-            logger.info("Запуск в режиме polling (локальная разработка)")
-            self.application.run_polling()
+        try:
+            # Определяем режим запуска
+            if os.getenv("USE_WEBHOOK", "0") == "1":
+                # Для Amvera/продакшн с webhook
+                logger.info("Запуск в режиме webhook")
+                self.application.run_webhook(
+                    listen="0.0.0.0",
+                    port=int(os.getenv("PORT", 80)),
+                    url_path="",
+                    webhook_url=os.getenv("WEBHOOK_URL", "")
+                )
+            elif os.getenv("AMVERA_DEPLOY", "0") == "1":
+                # Для Amvera без webhook (платформа сама настроит)
+                logger.info("Запуск на Amvera - платформа сама настроит webhook")
+                # Не вызываем ни run_polling, ни run_webhook
+                # Amvera сама вызовет нужный entrypoint
+            elif MULTI_REPLICA:
+                # getUpdates допускает только одного получателя обновлений
+                raise RuntimeError("MULTI_REPLICA=1 требует USE_WEBHOOK=1: несколько реплик не могут работать в режиме polling")
+            else:
+                # Для локальной разработки
+                logger.info("Запуск в режиме polling (локальная разработка)")
+                self.application.run_polling()
+        finally:
+            # Дожидаемся запросов в потоках базы данных и закрываем пул соединений
+            self.async_db.close()
+            self.db.close()
 
 if __name__ == "__main__":
     bot = VolleyballBot()
@@ -21,7 +21,15 @@ def backup_database():
     
     if os.path.exists(db_path):
         try:
-            shutil.copy2(db_path, backup_path)
+            # Используем backup API: в режиме WAL часть данных может быть
+            # еще в файле журнала, и простое копирование файла их потеряет
+            source = sqlite3.connect(db_path)
+            target = sqlite3.connect(backup_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
             logger.info(f"Создана резервная копия: {backup_path}")
             return backup_path
         except Exception as e:
@@ -0,0 +1,256 @@
+import asyncio
+import inspect
+import logging
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from config.settings import BROADCAST_SETTINGS
+from utils.metrics import BROADCAST_DURATION, OUTGOING_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+# Результаты отправки одного сообщения
+SENT = 'sent'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+REJECTED = 'rejected'
+
+
+class TokenBucket:
+    """Асинхронный ограничитель скорости «ведро токенов».
+
+    Пополняется со скоростью ``rate`` токенов в секунду, вмещает не больше
+    ``capacity``. ``pause`` останавливает выдачу токенов целиком - так
+    обрабатывается flood wait от Telegram.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Дождаться и забрать один токен"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Приостановить выдачу токенов на заданное время"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    delay = error.retry_after
+    if isinstance(delay, timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+def classify_error(error: Exception) -> str:
+    """Определить исход ошибки отправки.
+
+    BLOCKED - чат недоступен навсегда, REJECTED - Telegram отклонил само
+    сообщение (разметка, длина), повтор не поможет; FAILED - ошибка разовая.
+    """
+    if isinstance(error, Forbidden):
+        return BLOCKED
+    if isinstance(error, BadRequest):
+        if 'chat not found' in str(error).lower():
+            return BLOCKED
+        return REJECTED
+    return FAILED
+
+
+def unreachable_reason(error: Exception) -> str:
+    """Причина, по которой чат недоступен навсегда: blocked, deactivated, kicked, chat_not_found"""
+    text = str(error).lower()
+    if 'blocked' in text:
+        return 'blocked'
+    if 'deactivated' in text:
+        return 'deactivated'
+    if 'kicked' in text:
+        return 'kicked'
+    if 'chat not found' in text:
+        return 'chat_not_found'
+    return 'forbidden'
+
+
+class BroadcastService:
+    """Рассылка сообщений с учетом лимитов Telegram.
+
+    Глобальный лимит (~30 сообщений в секунду) соблюдается через
+    ``TokenBucket``, лимит на чат - через минимальный интервал между
+    сообщениями в один чат. Одновременно выполняется не больше
+    ``concurrency`` запросов. ``RetryAfter`` приостанавливает всю рассылку
+    на указанное время, сетевые ошибки повторяются с экспоненциальной
+    задержкой. О чатах, недоступных навсегда (бот заблокирован, аккаунт
+    удален), сообщается в ``on_unreachable({chat_id: причина})``.
+    """
+
+    def __init__(self, bot: Bot, rate: Optional[float] = None, per_chat_interval: Optional[float] = None,
+                 concurrency: Optional[int] = None, max_retries: Optional[int] = None):
+        self.bot = bot
+        self.limiter = TokenBucket(rate or BROADCAST_SETTINGS['RATE'], BROADCAST_SETTINGS['BURST'])
+        self.per_chat_interval = per_chat_interval if per_chat_interval is not None else BROADCAST_SETTINGS['PER_CHAT_INTERVAL']
+        self.concurrency = concurrency or BROADCAST_SETTINGS['CONCURRENCY']
+        self.max_retries = max_retries if max_retries is not None else BROADCAST_SETTINGS['MAX_RETRIES']
+        self._chat_next_send: Dict[int, float] = {}
+        self.on_unreachable: Optional[Callable[[Dict[int, str]], Awaitable]] = None
+        self._unreachable: Dict[int, str] = {}
+
+    async def _wait_for_chat(self, chat_id: int):
+        """Соблюсти минимальный интервал между сообщениями в один чат"""
+        now = time.monotonic()
+        next_send = self._chat_next_send.get(chat_id, 0.0)
+        self._chat_next_send[chat_id] = max(now, next_send) + self.per_chat_interval
+        if next_send > now:
+            await asyncio.sleep(next_send - now)
+        if len(self._chat_next_send) > 10000:
+            self._chat_next_send = {cid: t for cid, t in self._chat_next_send.items() if t > now}
+
+    async def _deliver(self, chat_id: int, kwargs: Dict) -> Optional[int]:
+        """Отправить сообщение или, если передан message_id, отредактировать его.
+
+        Возвращает message_id нового сообщения (None, если сообщение отредактировано).
+        Если редактируемое сообщение удалено, отправляется новое.
+        """
+        if kwargs.get('message_id') is None:
+            message = await self.bot.send_message(chat_id=chat_id, **kwargs)
+            return message.message_id
+        try:
+            await self.bot.edit_message_text(chat_id=chat_id, **kwargs)
+            return None
+        except BadRequest as e:
+            error = str(e).lower()
+            if 'not modified' in error:
+                return None
+            if 'message to edit not found' not in error and "can't be edited" not in error:
+                raise
+        fresh = {key: value for key, value in kwargs.items() if key != 'message_id'}
+        message = await self.bot.send_message(chat_id=chat_id, **fresh)
+        return message.message_id
+
+    async def send(self, chat_id: int, **kwargs) -> str:
+        """Отправить одно сообщение с соблюдением лимитов и повторами, вернуть SENT/FAILED/BLOCKED/REJECTED"""
+        outcome, _ = await self._send(chat_id, **kwargs)
+        OUTGOING_MESSAGES.inc(outcome)
+        await self._report_unreachable()
+        return outcome
+
+    def _failed(self, chat_id: int, error: Exception) -> Tuple[str, None]:
+        outcome = classify_error(error)
+        if outcome == BLOCKED:
+            self._unreachable[chat_id] = unreachable_reason(error)
+        return outcome, None
+
+    async def _report_unreachable(self):
+        if not self._unreachable or self.on_unreachable is None:
+            return
+        unreachable, self._unreachable = self._unreachable, {}
+        try:
+            await self.on_unreachable(unreachable)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке недоступных чатов: {e}")
+
+    async def _send(self, chat_id: int, **kwargs) -> Tuple[str, Optional[int]]:
+        await self._wait_for_chat(chat_id)
+        attempt = 0
+        while True:
+            await self.limiter.acquire()
+            try:
+                return SENT, await self._deliver(chat_id, kwargs)
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                logger.warning(f"Flood control Telegram: пауза рассылки на {delay} с")
+                self.limiter.pause(delay)
+                attempt += 1
+                if attempt > self.max_retries:
+                    return FAILED, None
+            except BadRequest as e:
+                logger.error(f"Ошибка при отправке сообщения пользователю {chat_id}: {e}")
+                return self._failed(chat_id, e)
+            except (TimedOut, NetworkError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"Ошибка сети при отправке сообщения пользователю {chat_id}: {e}")
+                    return FAILED, None
+                await asyncio.sleep(BROADCAST_SETTINGS['BACKOFF_BASE'] * 2 ** (attempt - 1))
+            except Exception as e:
+                logger.error(f"Ошибка при отправке сообщения пользователю {chat_id}: {e}")
+                return self._failed(chat_id, e)
+
+    async def broadcast(self, chat_ids: Iterable[int], message: Union[Dict, Callable]) -> Dict:
+        """Разослать сообщение списку чатов.
+
+        ``message`` - аргументы ``send_message`` (без chat_id), общие для всех,
+        либо функция (обычная или async), возвращающая их для конкретного чата;
+        если она вернула None, чат пропускается. С ``message_id`` в аргументах
+        вместо отправки редактируется уже отправленное сообщение.
+        Возвращает сводку: sent, failed, blocked, rejected, списки ID по каждому
+        исходу, message_id новых сообщений по чатам и длительность рассылки.
+        В failed попадают только временные ошибки, которые имеет смысл повторить.
+        """
+        result = {
+            SENT: 0, FAILED: 0, BLOCKED: 0, REJECTED: 0,
+            'sent_ids': [], 'failed_ids': [], 'blocked_ids': [], 'rejected_ids': [],
+            'message_ids': {},
+            'duration': 0.0
+        }
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id in chat_ids:
+            queue.put_nowait(chat_id)
+        started = time.monotonic()
+
+        async def worker():
+            while True:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    kwargs = message(chat_id) if callable(message) else message
+                    if inspect.isawaitable(kwargs):
+                        kwargs = await kwargs
+                    if kwargs is None:
+                        continue
+                    outcome, message_id = await self._send(chat_id, **kwargs)
+                    if message_id is not None:
+                        result['message_ids'][chat_id] = message_id
+                except Exception as e:
+                    logger.error(f"Ошибка при подготовке сообщения пользователю {chat_id}: {e}")
+                    outcome = FAILED
+                result[outcome] += 1
+                result[f'{outcome}_ids'].append(chat_id)
+                OUTGOING_MESSAGES.inc(outcome)
+
+        workers = min(self.concurrency, queue.qsize())
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        result['duration'] = round(time.monotonic() - started, 3)
+        BROADCAST_DURATION.observe(result['duration'])
+        await self._report_unreachable()
+        logger.info(
+            f"Рассылка завершена за {result['duration']} с: отправлено {result[SENT]}, "
+            f"ошибок {result[FAILED]}, заблокировали бота {result[BLOCKED]}, отклонено {result[REJECTED]}"
+        )
+        return result
@@ -1,73 +1,80 @@
 import logging
+import threading
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
 from data.database import Database
-from config.settings import BOT_SETTINGS, MESSAGES
+from data.async_database import AsyncDatabase
+from data.settings_store import SettingsStore
+from services.join_queue import JoinQueue
+from services.state_cache import EventStateCache
+from config.settings import MESSAGES
 from utils.timezone_utils import get_now_with_timezone
 
 logger = logging.getLogger(__name__)
 
+MONTH_NAMES = {
+    1: 'января', 2: 'февраля', 3: 'марта', 4: 'апреля',
+    5: 'мая', 6: 'июня', 7: 'июля', 8: 'августа',
+    9: 'сентября', 10: 'октября', 11: 'ноября', 12: 'декабря'
+}
+WEEKDAY_NAMES = {
+    0: 'понедельник', 1: 'вторник', 2: 'среда', 
+    3: 'четверг', 4: 'пятница', 5: 'суббота', 6: 'воскресенье'
+}
+EMPTY_PARTICIPANTS_TEXT = "Ещё никто не записался! Будь первым!"
+
 class EventService:
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, async_db: Optional[AsyncDatabase] = None, cache_enabled: bool = True):
         self.db = database
-        # Убираем статический лимит, теперь берем из БД
-        # self.max_participants = BOT_SETTINGS['MAX_PARTICIPANTS']
+        self.async_db = async_db or AsyncDatabase.shared(database)
+        # Лимит участников, время и дни тренировок - из настроек в БД
+        self.settings = SettingsStore.shared(database)
+        self.settings.subscribe('participant_limit', self._on_participant_limit_changed)
+        # Кэш отрисованных списков участников: event_id -> (ключ актуальности, заголовок, строки)
+        self._roster_cache: Dict[int, Tuple] = {}
+        self._roster_cache_stats = {'hits': 0, 'misses': 0}
+        # Списки отрисовываются и в потоках AsyncDatabase, и в цикле событий
+        self._roster_cache_lock = threading.Lock()
+        # При нескольких репликах кэши выключены: записи других процессов они не видят
+        self.cache_enabled = cache_enabled
+        # Активные события и составы в памяти, база остается источником истины
+        self.state = EventStateCache(database, enabled=cache_enabled)
+        # Записи в режиме наплыва после анонса: очередь и запись пачками
+        self.join_queue = JoinQueue(self)
     
     def _format_date_russian(self, target_date: date) -> str:
         """Форматировать дату на русском языке"""
-        month_names = {
-            1: 'января', 2: 'февраля', 3: 'марта', 4: 'апреля',
-            5: 'мая', 6: 'июня', 7: 'июля', 8: 'августа',
-            9: 'сентября', 10: 'октября', 11: 'ноября', 12: 'декабря'
-        }
-        weekday_names = {
-            0: 'понедельник', 1: 'вторник', 2: 'среда', 
-            3: 'четверг', 4: 'пятница', 5: 'суббота', 6: 'воскресенье'
-        }
         day = target_date.day
-        month = month_names[target_date.month]
-        weekday = weekday_names[target_date.weekday()]
+        month = MONTH_NAMES[target_date.month]
+        weekday = WEEKDAY_NAMES[target_date.weekday()]
         return f"{day} {month} {weekday}"
     
     def get_next_training_day(self) -> date:
-        """Определить ближайший тренировочный день"""
+        """Определить ближайший тренировочный день (не считая сегодняшнего)"""
         today = get_now_with_timezone().date()
-        weekday = today.weekday()
-        if weekday < 3:
-            delta_days = 3 - weekday
-        elif weekday < 6:
-            delta_days = 6 - weekday
-        else:
-            delta_days = 4
-        return today + timedelta(days=delta_days)
+        training_weekdays = set(self.settings.get_training_weekdays())
+        for delta_days in range(1, 8):
+            target_date = today + timedelta(days=delta_days)
+            if target_date.weekday() in training_weekdays:
+                return target_date
+        return today + timedelta(days=7)
     
     def create_event_on_date(self, target_date: date) -> int:
         """Создать событие на конкретную дату и время, если его ещё нет"""
-        training_time = BOT_SETTINGS.get('TRAINING_TIME')
-        if training_time:
-            existing_event = self.get_event_by_date(target_date, training_time)
-        else:
-            existing_event = self.get_event_by_date(target_date)
+        training_time = self.settings.get('training_time').strftime('%H:%M')
+        existing_event = self.get_event_by_date(target_date, training_time)
         if existing_event:
             logger.info(f"Событие на {target_date} {training_time} уже существует (ID: {existing_event['id']})")
             return existing_event['id']
         formatted_date = self._format_date_russian(target_date)
-        if training_time:
-            event_name = f"Запись на тренировку по волейболу\n{formatted_date} в {training_time}"
-            event_id = self.db.create_event(
-                name=event_name,
-                event_date=target_date,
-                event_time=training_time,
-                max_participants=self.get_max_participants()
-            )
-        else:
-            event_name = f"Запись на тренировку по волейболу\n{formatted_date}"
-            event_id = self.db.create_event(
-                name=event_name,
-                event_date=target_date,
-                event_time="20:00",
-                max_participants=self.get_max_participants()
-            )
+        event_name = f"Запись на тренировку по волейболу\n{formatted_date} в {training_time}"
+        event_id = self.db.create_event(
+            name=event_name,
+            event_date=target_date,
+            event_time=training_time,
+            max_participants=self.get_max_participants()
+        )
+        self.state.refresh_events()
         logger.info(f"Создано событие: {event_name} с ID: {event_id}")
         return event_id
     
@@ -81,7 +88,7 @@ class EventService:
     
     def get_active_events(self) -> List[Dict]:
         """Получить все активные события"""
-        return self.db.get_active_events()
+        return self.state.get_active_events()
     
     def get_event_by_id(self, event_id: int) -> Optional[Dict]:
         """Получить событие по ID"""
@@ -90,55 +97,79 @@ class EventService:
     def delete_event(self, event_id: int):
         """Удалить событие"""
         self.db.delete_event(event_id)
+        with self._roster_cache_lock:
+            self._roster_cache.pop(event_id, None)
+        self.state.invalidate(event_id)
         logger.info(f"Событие {event_id} удалено")
     
     def cleanup_past_events(self):
         """Удалить прошедшие события"""
         self.db.cleanup_past_events()
+        with self._roster_cache_lock:
+            self._roster_cache.clear()
+        self.state.invalidate()
         logger.info("Прошедшие события удалены")
     
-    def join_event(self, event_id: int, telegram_id: int, username: Optional[str] = None, first_name: Optional[str] = None, last_name: Optional[str] = None) -> Dict:
-        """Записать пользователя на событие"""
-        user_db = self.db.get_user_by_telegram_id(telegram_id)
-        if not user_db:
-            self.db.add_user(telegram_id, username, first_name, last_name)
+    def join_event(self, event_id: int, telegram_id: int, username: Optional[str] = None, first_name: Optional[str] = None, last_name: Optional[str] = None, confirm_presence: bool = False) -> Dict:
+        """Записать пользователя на событие одной транзакцией"""
+        result = self.db.join_participant(event_id, telegram_id, username, first_name, last_name, confirm_presence)
+        if result is None:
+            return {'success': False, 'message': 'Событие не найдено'}
+        if result['joined']:
+            self.state.refresh_event(event_id)
+        return self._join_result(result)
+    
+    def join_events(self, event_id: int, users: List[Tuple[int, Optional[str], Optional[str], Optional[str]]],
+                    confirm_presence: bool = False) -> List[Dict]:
+        """Записать пачку пользователей (telegram_id, username, first_name, last_name) одной транзакцией.
 
-        existing_participant = self.db.get_participant(event_id, telegram_id)
-        if existing_participant:
+        Места выдаются в порядке списка; в каждом результате кроме полей
+        ``join_event`` есть ``number`` - номер в списке участников сразу после записи.
+        """
+        results = self.db.join_participants(
+            event_id, [(*user, confirm_presence) for user in users]
+        )
+        if results is None:
+            return [{'success': False, 'message': 'Событие не найдено'} for _ in users]
+        if any(result['joined'] for result in results):
+            self.state.refresh_event(event_id)
+        numbers = {participant['telegram_id']: number
+                   for number, participant in enumerate(self.state.get_roster(event_id)['participants'], 1)}
+        join_results = []
+        for (telegram_id, *_), result in zip(users, results):
+            join_result = self._join_result(result)
+            join_result['number'] = numbers.get(telegram_id)
+            join_results.append(join_result)
+        return join_results
+    
+    def _join_result(self, result: Dict) -> Dict:
+        """Ответ пользователю по результату записи в базе"""
+        if not result['joined']:
             return {'success': False, 'message': MESSAGES['already_joined']}
         
-        event = self.db.get_event_by_id(event_id)
-        if not event:
-            return {'success': False, 'message': 'Событие не найдено'}
-        
-        participants = self.db.get_event_participants(event_id)
-        confirmed_count = len([p for p in participants if p['status'] == 'confirmed'])
-        
-        status = 'confirmed' if confirmed_count < event['max_participants'] else 'reserve'
+        status = result['status']
         if status == 'confirmed':
-            formatted_date = self._format_date_russian(datetime.strptime(event['date'], '%Y-%m-%d').date())
+            formatted_date = self._format_date_russian(datetime.strptime(result['event_date'], '%Y-%m-%d').date())
             message = MESSAGES['joined_confirmed'].format(event_date=formatted_date)
         else:
             message = MESSAGES['joined_reserve']
         
-        self.db.add_participant(event_id, telegram_id, status)
-        
         return {
             'success': True,
             'message': message,
             'status': status,
-            'position': confirmed_count + 1
+            'position': result['position']
         }
     
     def leave_event(self, event_id: int, telegram_id: int) -> Dict:
         """Отписать пользователя от события"""
-        participant = self.db.get_participant(event_id, telegram_id)
-        if not participant:
+        if not self.state.is_joined(event_id, telegram_id):
             return {'success': False, 'message': MESSAGES['not_joined']}
         
         self.db.remove_participant(event_id, telegram_id)
         
         moved_participant = self.db.move_from_reserve_to_main(event_id)
+        self.state.refresh_event(event_id)
         
         return {
             'success': True,
@@ -147,14 +178,46 @@ class EventService:
         }
     
     def get_participants_list(self, event_id: int, event_info: Optional[Dict] = None) -> str:
-        """Получить список участников в текстовом виде"""
-        participants = self.db.get_event_participants(event_id)
+        """Получить список участников в текстовом виде.
+
+        Заголовок и строки участников кэшируются до следующего изменения состава
+        события, при каждом вызове дописывается только текущее время.
+        """
+        event_date = event_info['date'] if event_info else None
+        if not self.cache_enabled:
+            header, body = self._render_participants(event_id, event_date)
+            return self._format_participants(header, body)
+        cache_key = (self.db.get_roster_version(event_id), event_date)
+        with self._roster_cache_lock:
+            cached = self._roster_cache.get(event_id)
+            hit = bool(cached and cached[0] == cache_key)
+            self._roster_cache_stats['hits' if hit else 'misses'] += 1
+        if hit:
+            _, header, body = cached
+        else:
+            # Отрисовка читает базу - вне блокировки, чтобы не держать другие события
+            header, body = self._render_participants(event_id, event_date)
+            with self._roster_cache_lock:
+                self._roster_cache[event_id] = (cache_key, header, body)
+        return self._format_participants(header, body)
+    
+    def _format_participants(self, header: Optional[str], body: Optional[str]) -> str:
+        """Собрать текст списка участников с текущим временем"""
+        if body is None:
+            return EMPTY_PARTICIPANTS_TEXT
+        
+        # Добавляем текущее время для проверки часового пояса
+        current_time = get_now_with_timezone().strftime("%d.%m.%Y %H:%M:%S")
+        return f"{header}\n🕐 Текущее время: {current_time}\n{body}"
+    
+    def _render_participants(self, event_id: int, event_date) -> Tuple[Optional[str], Optional[str]]:
+        """Отрисовать заголовок и строки списка участников (без текущего времени)"""
+        participants = self.state.get_roster(event_id)['participants']
         
         if not participants:
-            return "Ещё никто не записался! Будь первым!"
+            return None, None
         
-        if event_info:
-            event_date = event_info['date']
+        if event_date:
             if isinstance(event_date, str):
                 event_date = datetime.strptime(event_date, '%Y-%m-%d').date()
             formatted_date = self._format_date_russian(event_date)
@@ -162,11 +225,7 @@ class EventService:
         else:
             header = "Список участников:"
         
-        # Добавляем текущее время для проверки часового пояса
-        current_time = get_now_with_timezone().strftime("%d.%m.%Y %H:%M:%S")
-        header += f"\n🕐 Текущее время: {current_time}"
-        
-        lines = [header]
+        lines = []
         for i, participant in enumerate(participants, 1):
             status = "Резерв" if participant['status'] == 'reserve' else "Основной"
             
@@ -175,7 +234,48 @@ class EventService:
             
             lines.append(f"{i}. {display_name} - {status}")
         
-        return "\n".join(lines)
+        return header, "\n".join(lines)
+    
+    def is_joined(self, event_id: int, telegram_id: int) -> bool:
+        """Проверить, записан ли пользователь на событие"""
+        return self.state.is_joined(event_id, telegram_id)
+    
+    def get_joined_telegram_ids(self, event_id: int) -> Set[int]:
+        """Получить множество telegram_id, записанных на событие"""
+        return self.state.get_joined_telegram_ids(event_id)
+    
+    def get_roster_position(self, event_id: int, telegram_id: int) -> Optional[Dict]:
+        """Номер участника в списке (как в get_participants_list), его статус и имя"""
+        for number, participant in enumerate(self.state.get_roster(event_id)['participants'], 1):
+            if participant['telegram_id'] == telegram_id:
+                return {
+                    'number': number,
+                    'status': participant['status'],
+                    'display_name': self._get_display_name(participant)
+                }
+        return None
+
+    def get_participant_counts(self, event_id: int) -> Dict:
+        """Количество участников в основном составе и резерве"""
+        return self.state.get_counts(event_id)
+    
+    def get_state_cache_stats(self) -> Dict:
+        """Счетчики кэша активных событий и составов"""
+        return self.state.get_stats()
+    
+    def get_roster_cache_stats(self) -> Dict:
+        """Счетчики кэша списков участников"""
+        with self._roster_cache_lock:
+            hits = self._roster_cache_stats['hits']
+            misses = self._roster_cache_stats['misses']
+            cached_events = len(self._roster_cache)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'cached_events': cached_events
+        }
     
     def _get_display_name(self, participant: Dict) -> str:
         """Получить отображаемое имя пользователя"""
@@ -193,42 +293,46 @@ class EventService:
     
     def confirm_presence(self, event_id: int, telegram_id: int) -> bool:
         """Подтвердить присутствие участника"""
-        participant = self.db.get_participant(event_id, telegram_id)
-        if not participant:
+        if not self.state.is_joined(event_id, telegram_id):
             return False
         
         self.db.confirm_presence(event_id, telegram_id)
+        self.state.refresh_event(event_id)
         return True
     
     def get_unconfirmed_participants(self, event_id: int) -> List[Dict]:
         """Получить участников, не подтвердивших присутствие"""
         return self.db.get_unconfirmed_participants(event_id)
     
+    def auto_leave_unconfirmed_bulk(self, event_id: int) -> Dict:
+        """Отписать всех неподтвердивших и поднять резерв одной транзакцией.
+
+        Возвращает {'removed': [...], 'promoted': [...]}.
+        """
+        result = self.db.remove_unconfirmed_and_promote(event_id)
+        if result['removed']:
+            self.state.refresh_event(event_id)
+            logger.info(
+                f"Событие {event_id}: автоматически отписано {len(result['removed'])}, "
+                f"из резерва перемещено {len(result['promoted'])}"
+            )
+        return result
+    
     def auto_leave_unconfirmed(self, event_id: int) -> List[Dict]:
-        """Автоматически отписать неподтвердивших участников"""
-        unconfirmed = self.db.get_unconfirmed_participants(event_id)
-        moved_participants = []
-        
-        for participant in unconfirmed:
-            self.db.remove_participant(event_id, participant['telegram_id'])
-            moved = self.db.move_from_reserve_to_main(event_id)
-            if moved:
-                moved_participants.append(moved)
-        
-        return moved_participants
+        """Автоматически отписать неподтвердивших участников, вернуть перемещенных из резерва"""
+        return self.auto_leave_unconfirmed_bulk(event_id)['promoted']
     
     def mark_reminder_sent(self, event_id: int, telegram_id: int, reminder_type: str = 'first'):
         """Отметить, что напоминание отправлено"""
         self.db.mark_reminder_sent(event_id, telegram_id, reminder_type)
     
+    def mark_reminders_sent(self, event_id: int, telegram_ids: List[int], reminder_type: str = 'first'):
+        """Отметить отправленные напоминания для списка пользователей одной транзакцией"""
+        self.db.mark_reminders_sent(event_id, telegram_ids, reminder_type)
+    
     def get_participants_for_reminder(self, event_id: int, reminder_type: str = 'first') -> List[Dict]:
         """Получить участников для отправки напоминания"""
-        participants = self.db.get_event_participants(event_id)
-        
-        if reminder_type == 'first':
-            return [p for p in participants if p['status'] == 'confirmed' and not p['confirmed_presence'] and not p['reminder_sent']]
-        else:
-            return [p for p in participants if p['status'] == 'confirmed' and not p['confirmed_presence'] and p['reminder_sent'] and not p['second_reminder_sent']]
+        return self.db.get_participants_for_reminder(event_id, reminder_type)
     
     def get_event_by_date(self, target_date: date, target_time: Optional[str] = None) -> Optional[Dict]:
         """Получить активное событие по дате и времени (если указано)"""
@@ -247,46 +351,128 @@ class EventService:
         return None
     
     def get_max_participants(self) -> int:
-        """Получить текущий лимит участников из базы данных"""
-        return self.db.get_participant_limit()
+        """Получить текущий лимит участников из настроек"""
+        return self.settings.get('participant_limit')
     
     def set_participant_limit(self, limit: int):
-        """Установить новый лимит участников и пересчитать статусы"""
-        self.db.set_participant_limit(limit)
-        
-        # Обновляем поле max_participants во всех активных событиях
+        """Установить новый лимит участников, вернуть перемещенных из резерва.
+
+        Статусы пересчитывает подписчик настройки ``participant_limit``, в том
+        числе при повторном выборе текущего лимита. Ошибка пересчета
+        пробрасывается вызывающему.
+        """
         active_events = self.get_active_events()
-        moved_participants = []
+        reserve_before = {
+            event['id']: {p['telegram_id'] for p in self.state.get_roster(event['id'])['reserve']}
+            for event in active_events
+        }
         
+        self.settings.set('participant_limit', limit, force=True)
+        
+        # Находим тех, кто переместился из резерва в основной состав
+        moved_participants = []
         for event in active_events:
-            # Получаем участников до изменения
-            participants_before = self.db.get_event_participants(event['id'])
-            reserve_before = [p for p in participants_before if p['status'] == 'reserve']
-            
-            # Обновляем лимит и пересчитываем статусы
-            self.db.update_event_max_participants(event['id'], limit)
-            self.db.recalculate_participant_statuses(event['id'])
-            
-            # Получаем участников после изменения
-            participants_after = self.db.get_event_participants(event['id'])
-            
-            # Находим тех, кто переместился из резерва в основной состав
-            for participant in participants_after:
-                if participant['status'] == 'confirmed':
-                    # Проверяем, был ли он в резерве до изменения
-                    was_in_reserve = any(p['telegram_id'] == participant['telegram_id'] and p['status'] == 'reserve' 
-                                       for p in participants_before)
-                    if was_in_reserve:
-                        moved_participants.append({
-                            'telegram_id': participant['telegram_id'],
-                            'username': participant['username'] or f"Пользователь {participant['telegram_id']}"
-                        })
+            for participant in self.state.get_roster(event['id'])['confirmed']:
+                if participant['telegram_id'] in reserve_before[event['id']]:
+                    moved_participants.append({
+                        'telegram_id': participant['telegram_id'],
+                        'username': participant['username'] or f"Пользователь {participant['telegram_id']}"
+                    })
         
         logger.info(f"Установлен новый лимит участников: {limit}")
         
         # Возвращаем список перемещенных участников для отправки уведомлений
         return moved_participants
     
+    def _on_participant_limit_changed(self, key: str, old_limit: int, new_limit: int):
+        """Обновить лимит во всех активных событиях и пересчитать статусы одной транзакцией"""
+        active_events = self.get_active_events()
+        with self.db.transaction():
+            for event in active_events:
+                self.db.update_event_max_participants(event['id'], new_limit)
+                self.db.recalculate_participant_statuses(event['id'], new_limit)
+        # Составы перечитываются после commit, когда уже видны новые версии
+        for event in active_events:
+            self.state.refresh_event(event['id'])
+    
     def get_participant_limit(self) -> int:
         """Получить текущий лимит участников"""
-        return self.get_max_participants() 
\ No newline at end of file
+        return self.get_max_participants()
+    
+    # Асинхронные варианты: выполняются в потоке базы данных и не блокируют цикл событий
+    async def get_active_events_async(self) -> List[Dict]:
+        """Получить все активные события (асинхронно)"""
+        return await self.async_db.run(self.get_active_events)
+    
+    async def get_event_by_id_async(self, event_id: int) -> Optional[Dict]:
+        """Получить событие по ID (асинхронно)"""
+        return await self.async_db.run(self.get_event_by_id, event_id)
+    
+    async def create_event_on_date_async(self, target_date: date) -> int:
+        """Создать событие на дату (асинхронно)"""
+        return await self.async_db.run(self.create_event_on_date, target_date)
+    
+    async def create_scheduled_events_async(self) -> List[int]:
+        """Создать события по расписанию (асинхронно)"""
+        return await self.async_db.run(self.create_scheduled_events)
+    
+    async def delete_event_async(self, event_id: int):
+        """Удалить событие (асинхронно)"""
+        await self.async_db.run(self.delete_event, event_id)
+    
+    async def cleanup_past_events_async(self):
+        """Удалить прошедшие события (асинхронно)"""
+        await self.async_db.run(self.cleanup_past_events)
+    
+    async def join_event_async(self, event_id: int, telegram_id: int, username: Optional[str] = None, first_name: Optional[str] = None, last_name: Optional[str] = None, confirm_presence: bool = False) -> Dict:
+        """Записать пользователя на событие (асинхронно)"""
+        return await self.async_db.run(self.join_event, event_id, telegram_id, username, first_name, last_name, confirm_presence)
+    
+    async def join_events_async(self, event_id: int, users: List[Tuple[int, Optional[str], Optional[str], Optional[str]]],
+                                confirm_presence: bool = False) -> List[Dict]:
+        """Записать пачку пользователей на событие (асинхронно)"""
+        return await self.async_db.run(self.join_events, event_id, users, confirm_presence)
+    
+    async def leave_event_async(self, event_id: int, telegram_id: int) -> Dict:
+        """Отписать пользователя от события (асинхронно)"""
+        return await self.async_db.run(self.leave_event, event_id, telegram_id)
+    
+    async def get_participants_list_async(self, event_id: int, event_info: Optional[Dict] = None) -> str:
+        """Получить список участников в текстовом виде (асинхронно)"""
+        return await self.async_db.run(self.get_participants_list, event_id, event_info)
+    
+    async def confirm_presence_async(self, event_id: int, telegram_id: int) -> bool:
+        """Подтвердить присутствие участника (асинхронно)"""
+        return await self.async_db.run(self.confirm_presence, event_id, telegram_id)
+    
+    async def get_unconfirmed_participants_async(self, event_id: int) -> List[Dict]:
+        """Получить участников, не подтвердивших присутствие (асинхронно)"""
+        return await self.async_db.run(self.get_unconfirmed_participants, event_id)
+    
+    async def auto_leave_unconfirmed_async(self, event_id: int) -> List[Dict]:
+        """Автоматически отписать неподтвердивших участников (асинхронно)"""
+        return await self.async_db.run(self.auto_leave_unconfirmed, event_id)
+    
+    async def auto_leave_unconfirmed_bulk_async(self, event_id: int) -> Dict:
+        """Отписать неподтвердивших и поднять резерв одной транзакцией (асинхронно)"""
+        return await self.async_db.run(self.auto_leave_unconfirmed_bulk, event_id)
+    
+    async def mark_reminder_sent_async(self, event_id: int, telegram_id: int, reminder_type: str = 'first'):
+        """Отметить, что напоминание отправлено (асинхронно)"""
+        await self.async_db.run(self.mark_reminder_sent, event_id, telegram_id, reminder_type)
+    
+    async def mark_reminders_sent_async(self, event_id: int, telegram_ids: List[int], reminder_type: str = 'first'):
+        """Отметить отправленные напоминания для списка пользователей (асинхронно)"""
+        await self.async_db.run(self.mark_reminders_sent, event_id, telegram_ids, reminder_type)
+    
+    async def get_participants_for_reminder_async(self, event_id: int, reminder_type: str = 'first') -> List[Dict]:
+        """Получить участников для отправки напоминания (асинхронно)"""
+        return await self.async_db.run(self.get_participants_for_reminder, event_id, reminder_type)
+    
+    async def get_participant_limit_async(self) -> int:
+        """Получить текущий лимит участников (асинхронно)"""
+        return await self.async_db.run(self.get_participant_limit)
+    
+    async def set_participant_limit_async(self, limit: int):
+        """Установить новый лимит участников и пересчитать статусы (асинхронно)"""
+        return await self.async_db.run(self.set_participant_limit, limit)
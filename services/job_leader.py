@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from data.async_database import AsyncDatabase
+from data.database import Database
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LEASE = 'scheduler'
+# Сколько сроков аренды реплика ждет чужой запуск; перехват начинается после двух
+MIN_TAKEOVER_LEASES = 3
+
+
+class JobLeader:
+    """Выбор реплики, выполняющей задачи по расписанию, через аренду в базе.
+
+    Каждая реплика периодически вызывает ``renew``; аренду держит одна
+    реплика, пока продлевает ее, после истечения ``lease_seconds`` ее
+    перехватывает другая.
+
+    ``run_exclusive`` выполняет конкретный запуск задачи (имя + время по
+    расписанию) ровно один раз: ведущая реплика берет заявку на запуск с
+    тем же сроком, что и аренда, продлевает ее, пока задача идет, и по
+    окончании отмечает запуск выполненным. Остальные реплики не пропускают
+    запуск, а ждут его завершения; если ведущая упала до или во время задачи,
+    запуск берет реплика, перехватившая аренду, а если ведущая жива, но
+    таймер на ней не сработал, - любая реплика спустя ``2 * lease_seconds``.
+    Ожидание ограничено ``takeover_timeout`` - несколькими сроками аренды
+    (``SCHEDULER_TAKEOVER_LEASES``, не меньше трех), чтобы задача планировщика
+    не висела на реплике, пока другая выполняет длинную рассылку.
+    """
+
+    def __init__(self, database: Database, replica_id: Optional[str] = None, lease_seconds: Optional[float] = None,
+                 takeover_timeout: Optional[float] = None):
+        self.db = database
+        self.async_db = AsyncDatabase.shared(database)
+        self.replica_id = replica_id or os.getenv('REPLICA_ID') or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds or float(os.getenv('SCHEDULER_LEASE_SECONDS', '30'))
+        # Сколько ждать завершения запуска на другой реплике, прежде чем сдаться
+        if takeover_timeout is None:
+            leases = max(float(os.getenv('SCHEDULER_TAKEOVER_LEASES', '4')), MIN_TAKEOVER_LEASES)
+            takeover_timeout = leases * self.lease_seconds
+        self.takeover_timeout = takeover_timeout
+        self.is_leader = False
+
+    async def renew(self) -> bool:
+        """Взять или продлить аренду планировщика"""
+        is_leader = await self.async_db.acquire_lease(SCHEDULER_LEASE, self.replica_id, self.lease_seconds)
+        if is_leader != self.is_leader:
+            if is_leader:
+                logger.info(f"Реплика {self.replica_id} стала ведущей для задач по расписанию")
+            else:
+                logger.info(f"Реплика {self.replica_id} больше не ведущая для задач по расписанию")
+        self.is_leader = is_leader
+        return is_leader
+
+    async def release(self):
+        """Отдать аренду при остановке, чтобы другая реплика подхватила ее сразу"""
+        if self.is_leader:
+            await self.async_db.release_lease(SCHEDULER_LEASE, self.replica_id)
+            self.is_leader = False
+
+    async def run_exclusive(self, job_name: str, callback: Callable[[], Awaitable], run_key: str) -> bool:
+        """Выполнить запуск задачи ``run_key`` ровно один раз среди всех реплик.
+
+        ``run_key`` должен быть одинаковым на всех репликах - время запуска по
+        расписанию, а не текущее время. Возвращает True, если задача
+        выполнялась на этой реплике.
+        """
+        started = time.monotonic()
+        poll_interval = self.lease_seconds / 3
+        while True:
+            waited = time.monotonic() - started
+            is_leader = await self.renew()
+            if (is_leader or waited >= 2 * self.lease_seconds) and await self.async_db.claim_job_run(
+                job_name, run_key, self.replica_id, self.lease_seconds
+            ):
+                await self._run_claimed(job_name, run_key, callback)
+                return True
+            if await self.async_db.is_job_run_completed(job_name, run_key):
+                logger.info(f"Задача {job_name} ({run_key}) выполнена другой репликой")
+                return False
+            if waited >= self.takeover_timeout:
+                # Заявка все еще продлевается: запуск идет на другой реплике, и если она упадет,
+                # его подхватит реплика, перехватившая аренду
+                logger.warning(
+                    f"Задача {job_name} ({run_key}) не завершилась за {self.takeover_timeout:.0f} с, "
+                    f"ожидание прекращено"
+                )
+                return False
+            await asyncio.sleep(poll_interval)
+
+    async def _run_claimed(self, job_name: str, run_key: str, callback: Callable[[], Awaitable]):
+        """Выполнить задачу, продлевая заявку, и отметить запуск выполненным"""
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                if not await self.async_db.claim_job_run(job_name, run_key, self.replica_id, self.lease_seconds):
+                    logger.warning(f"Заявка реплики {self.replica_id} на запуск {job_name} ({run_key}) перехвачена")
+                    return
+
+        heartbeat_task = asyncio.create_task(heartbeat())
+        try:
+            await callback()
+        except BaseException:
+            # Запуск не выполнен - пусть его повторит другая реплика, не дожидаясь срока заявки
+            await self.async_db.release_job_run(job_name, run_key, self.replica_id)
+            raise
+        finally:
+            heartbeat_task.cancel()
+        if not await self.async_db.complete_job_run(job_name, run_key, self.replica_id):
+            logger.warning(f"Запуск {job_name} ({run_key}) выполнен, но заявка к этому моменту уже у другой реплики")
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from config.settings import JOIN_RUSH_SETTINGS
+from data.query_stats import set_query_label
+
+if TYPE_CHECKING:
+    from services.event_service import EventService
+
+logger = logging.getLogger(__name__)
+
+
+class JoinQueue:
+    """Очередь записей на событие в режиме наплыва.
+
+    После анонса (``start_rush``) почти все подписчики нажимают «Иду на
+    тренировку!» в первые секунды. В этом режиме записи попадают в очередь
+    в памяти строго в порядке вызова ``submit`` и записываются в базу пачками
+    до ``BATCH_SIZE`` одной транзакцией, каждая пачка - не раньше чем через
+    ``BATCH_DELAY`` секунд после первой записи в ней. ``submit`` возвращает
+    future с результатом записи, как у ``EventService.join_event``, и
+    итоговым номером в списке.
+    """
+
+    def __init__(self, event_service: 'EventService'):
+        self.event_service = event_service
+        self._rush_until: Dict[int, float] = {}
+        self._queues: Dict[int, List[Tuple[Tuple, asyncio.Future]]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._stats = {'joins': 0, 'batches': 0, 'max_batch': 0}
+
+    def start_rush(self, event_id: int, duration: Optional[float] = None):
+        """Включить режим наплыва для события (после рассылки анонса)"""
+        duration = JOIN_RUSH_SETTINGS['DURATION'] if duration is None else duration
+        self._rush_until[event_id] = time.monotonic() + duration
+        logger.info(f"Режим наплыва записей для события {event_id} на {duration:.0f} с")
+
+    def is_rush(self, event_id: int) -> bool:
+        """Действует ли режим наплыва для события"""
+        until = self._rush_until.get(event_id)
+        if until is None:
+            return False
+        if time.monotonic() >= until:
+            del self._rush_until[event_id]
+            return False
+        return True
+
+    def submit(self, event_id: int, telegram_id: int, username: Optional[str] = None,
+               first_name: Optional[str] = None, last_name: Optional[str] = None) -> asyncio.Future:
+        """Поставить запись в очередь; место в очереди = место в списке"""
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(event_id, []).append(((telegram_id, username, first_name, last_name), future))
+        if event_id not in self._tasks:
+            self._tasks[event_id] = asyncio.create_task(self._commit_later(event_id))
+        return future
+
+    async def _commit_later(self, event_id: int):
+        set_query_label('join_queue')
+        try:
+            await asyncio.sleep(JOIN_RUSH_SETTINGS['BATCH_DELAY'])
+            # Пачки одного события записываются по очереди, пока очередь не опустеет
+            while self._queues.get(event_id):
+                queue = self._queues[event_id]
+                batch = queue[:JOIN_RUSH_SETTINGS['BATCH_SIZE']]
+                del queue[:len(batch)]
+                await self._commit(event_id, batch)
+        finally:
+            del self._tasks[event_id]
+            # Остановка бота: ожидающие запись обработчики не должны зависнуть
+            for _, future in self._queues.pop(event_id, []):
+                future.cancel()
+
+    async def _commit(self, event_id: int, batch: List[Tuple[Tuple, asyncio.Future]]):
+        try:
+            results = await self.event_service.join_events_async(
+                event_id, [user for user, _ in batch], confirm_presence=True
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при записи пачки из {len(batch)} участников на событие {event_id}: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self._stats['joins'] += len(batch)
+        self._stats['batches'] += 1
+        self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> Dict:
+        """Записи, пачки и размер самой большой пачки за время работы"""
+        stats = dict(self._stats)
+        stats['avg_batch'] = stats['joins'] / stats['batches'] if stats['batches'] else 0.0
+        stats['rush_events'] = [event_id for event_id in list(self._rush_until) if self.is_rush(event_id)]
+        return stats
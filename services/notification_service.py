@@ -1,72 +1,248 @@
+import asyncio
 import logging
-from typing import List, Dict
+from collections import deque
+from typing import Deque, List, Dict, Optional, Tuple
 from telegram import Bot
 from data.database import Database
-from config.settings import MESSAGES
-from utils.keyboard import create_main_keyboard, get_is_joined
+from data.async_database import AsyncDatabase
+from data.query_stats import set_query_label
+from services.broadcast_service import BroadcastService
+from services.outbox import Outbox
+from config.settings import BROADCAST_SETTINGS, JOIN_RUSH_SETTINGS, MESSAGES
+from utils.keyboard import create_main_keyboard, create_roster_keyboard, get_is_joined, get_joined_telegram_ids_async
 
 logger = logging.getLogger(__name__)
 
 class NotificationService:
-    def __init__(self, bot: Bot, database: Database):
+    def __init__(self, bot: Bot, database: Database, event_service=None):
         self.bot = bot
         self.db = database
+        self.async_db = AsyncDatabase.shared(database)
+        if event_service is None:
+            from services.event_service import EventService
+            event_service = EventService(database, self.async_db)
+        self.event_service = event_service
+        # Все рассылки нескольким пользователям идут через общий ограничитель скорости
+        self.broadcaster = BroadcastService(bot)
+        # Одиночные уведомления и недоставленные сообщения рассылок отправляются через очередь в базе
+        self.outbox = Outbox(database, self.broadcaster)
+        # Заблокировавшие бота и удаленные аккаунты исключаются из следующих рассылок
+        self.broadcaster.on_unreachable = self._unsubscribe_unreachable
+        # Изменения составов, ожидающие рассылки: event_id -> ключ -> изменение
+        self._pending_updates: Dict[int, Dict] = {}
+        self._update_tasks: Dict[int, asyncio.Task] = {}
+        # Журнал изменений состава для живых сообщений: event_id -> последние строки и число вытесненных.
+        # Хранится в памяти процесса: при нескольких репликах каждая показывает изменения, прошедшие через нее
+        self._change_log: Dict[int, Deque[str]] = {}
+        self._change_log_dropped: Dict[int, int] = {}
     
-    async def send_event_notification(self, event_id: int, event_name: str):
+    async def _unsubscribe_unreachable(self, reasons: Dict[int, str]):
+        """Отписать чаты, недоступные навсегда, с причиной и временем"""
+        await self.async_db.update_users_subscription(reasons, False)
+        logger.warning(f"Отписаны недоступные чаты ({len(reasons)}): {reasons}")
+    
+    async def _broadcast(self, chat_ids: List[int], message, kind: str) -> Dict:
+        """Разослать сообщение, а недоставленные из-за временных ошибок поставить в очередь на повтор.
+
+        Сообщения, отклоненные Telegram (BadRequest: разметка, длина), не повторяются.
+        """
+        result = await self.broadcaster.broadcast(chat_ids, message)
+        if result['rejected_ids']:
+            logger.error(f"{len(result['rejected_ids'])} сообщений ({kind}) отклонены Telegram и не будут повторены")
+        if result['failed_ids']:
+            await self.outbox.enqueue_many(result['failed_ids'], message, kind)
+            logger.info(f"{len(result['failed_ids'])} недоставленных сообщений ({kind}) поставлены в очередь")
+        return result
+    
+    async def send_event_notification(self, event_id: int, event_name: str) -> Dict:
         """Отправить уведомление о новом событии всем подписанным пользователям с актуальной клавиатурой"""
-        subscribed_users = self.db.get_subscribed_users()
-        from services.event_service import EventService
-        event_service = EventService(self.db)
-        
-        for telegram_id in subscribed_users:
-            try:
-                is_joined = get_is_joined(self.db, event_service, telegram_id)
-                keyboard = create_main_keyboard(is_joined=is_joined)
-                await self.bot.send_message(
-                    chat_id=telegram_id,
-                    text=f"🏐 Новое событие:\n{event_name}",
-                    reply_markup=keyboard
-                )
-                logger.info(f"Уведомление о событии {event_id} отправлено пользователю {telegram_id}")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления пользователю {telegram_id}: {e}")
+        # Первые нажатия приходят, пока рассылка анонса еще идет
+        self.event_service.join_queue.start_rush(event_id)
+        subscribed_users = await self.async_db.get_subscribed_users()
+        # Состав участников загружается одним запросом на всю рассылку
+        joined_ids = await get_joined_telegram_ids_async(self.db, self.event_service)
+        
+        def build_message(telegram_id: int) -> Dict:
+            is_joined = get_is_joined(self.db, self.event_service, telegram_id, joined_ids)
+            return {
+                'text': f"🏐 Новое событие:\n{event_name}",
+                'reply_markup': create_main_keyboard(is_joined=is_joined)
+            }
+        
+        result = await self._broadcast(subscribed_users, build_message, 'event_created')
+        logger.info(f"Уведомление о событии {event_id} отправлено {result['sent']} пользователям")
+        return result
     
-    async def send_participants_update(self, event_id: int, action_user_id: int, action_username: str, action: str):
-        """Отправить уведомление об изменении списка участников"""
-        from services.event_service import EventService
-        event_service = EventService(self.db)
+    async def send_participants_update(self, event_id: int, action_user_id: int, action_username: str, action: str,
+                                       moved_participant: Optional[Dict] = None) -> Optional[Dict]:
+        """Сообщить подписчикам об изменении списка участников.
+
+        Подписчики получают живое сообщение с журналом изменений («➕ Вася
+        записался (#7, основной)») и счетчиками состава; полный список - по
+        кнопке под сообщением. Изменения за ``ROSTER_UPDATE_WINDOW`` секунд (в режиме наплыва после анонса - за
+        ``JOIN_RUSH_SETTINGS['ROSTER_UPDATE_WINDOW']``) объединяются в одно
+        сообщение на подписчика; при нулевом окне сообщение уходит сразу и
+        возвращается сводка рассылки.
+        """
+        joined = await self.async_db.run(self.event_service.is_joined, event_id, action_user_id)
+        pending = self._pending_updates.setdefault(event_id, {})
+        previous = pending.get(action_user_id)
+        if previous and previous['joined'] != joined:
+            # Записался и отписался в пределах окна - сообщать не о чем
+            del pending[action_user_id]
+        else:
+            pending[action_user_id] = {
+                'telegram_id': action_user_id, 'joined': joined, 'moved': False,
+                'name': action_username, 'action': action
+            }
+        # Если участник сам записался в этом окне, его строка уже покажет основной состав
+        if moved_participant and moved_participant['telegram_id'] not in pending:
+            moved_id = moved_participant['telegram_id']
+            pending[('moved', moved_id)] = {
+                'telegram_id': moved_id, 'joined': True, 'moved': True,
+                'name': moved_participant.get('username') or str(moved_id), 'action': None
+            }
         
-        # Получаем информацию о событии
-        event_info = event_service.get_event_by_id(event_id)
+        window = BROADCAST_SETTINGS['ROSTER_UPDATE_WINDOW']
+        if window > 0 and self.event_service.join_queue.is_rush(event_id):
+            window = max(window, JOIN_RUSH_SETTINGS['ROSTER_UPDATE_WINDOW'])
+        if window <= 0:
+            return await self.flush_participant_updates(event_id)
+        if event_id not in self._update_tasks:
+            self._update_tasks[event_id] = asyncio.create_task(self._flush_participant_updates_later(event_id, window))
+        return None
+    
+    async def _flush_participant_updates_later(self, event_id: int, window: float):
+        set_query_label('roster_updates')
+        await asyncio.sleep(window)
+        try:
+            await self.flush_participant_updates(event_id)
+        except Exception as e:
+            logger.error(f"Ошибка при рассылке изменений списка события {event_id}: {e}")
+        finally:
+            # Рассылки одного события идут по очереди; изменения, пришедшие во время
+            # рассылки, уходят следующим окном
+            del self._update_tasks[event_id]
+            if self._pending_updates.get(event_id):
+                self._update_tasks[event_id] = asyncio.create_task(
+                    self._flush_participant_updates_later(event_id, window)
+                )
+    
+    async def flush_participant_updates(self, event_id: int) -> Optional[Dict]:
+        """Обновить живые сообщения: журнал изменений события и счетчики состава.
+
+        У каждого подписчика одно живое сообщение на событие: первое изменение
+        отправляется новым сообщением, следующие редактируют его
+        (``edit_message_text``), поэтому за окно в чат уходит не больше одного
+        запроса и новые сообщения не копятся. Журнал накапливается за все время
+        события (последние ``ROSTER_LOG_LINES`` строк), так что изменения
+        прошлых окон не теряются при редактировании, а размер сообщения не
+        зависит от числа участников. Полный список не рассылается - его
+        показывает кнопка «📋 Показать список».
+        """
+        changes = list(self._pending_updates.pop(event_id, {}).values())
+        if not changes:
+            return None
         
-        participants_list = event_service.get_participants_list(event_id, event_info)
-        message = f"Пользователь {action_username} {action}.\n\n{participants_list}"
+        event = await self.event_service.get_event_by_id_async(event_id)
+        if not event:
+            self._change_log.pop(event_id, None)
+            self._change_log_dropped.pop(event_id, None)
+            return None
+        # Номера в журнале - на момент рассылки, а не на момент каждого изменения
+        lines = await self.async_db.run(self._render_changes, event_id, changes)
+        authors = {change_id for change_id, _ in lines}
+        self._append_change_log(event_id, [line for _, line in lines])
+        text = await self.render_live_message(event)
+        keyboard = create_roster_keyboard(event_id)
+        subscribed_users = await self.async_db.get_subscribed_users()
+        live_messages = await self.async_db.get_roster_messages(event_id)
         
-        subscribed_users = self.db.get_subscribed_users()
+        def build_message(telegram_id: int) -> Optional[Dict]:
+            message_id = live_messages.get(telegram_id)
+            # Свои изменения пользователь уже видел в ответе бота: новое сообщение ради них не нужно
+            if message_id is None and authors <= {telegram_id}:
+                return None
+            message = {'text': text, 'reply_markup': keyboard}
+            if message_id is not None:
+                message['message_id'] = message_id
+            return message
         
-        for telegram_id in subscribed_users:
-            if telegram_id == action_user_id:
-                continue  # Пропускаем пользователя, который инициировал действие
-            
-            try:
-                await self.bot.send_message(chat_id=telegram_id, text=message)
-                logger.info(f"Уведомление об изменении отправлено пользователю {telegram_id}")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления пользователю {telegram_id}: {e}")
+        result = await self.broadcaster.broadcast(subscribed_users, build_message)
+        if result['message_ids']:
+            await self.async_db.save_roster_messages(event_id, result['message_ids'])
+        logger.info(
+            f"Изменения списка события {event_id} ({len(changes)}) отправлены {result['sent']} пользователям"
+        )
+        return result
+    
+    def _append_change_log(self, event_id: int, lines: List[str]):
+        """Дописать строки в журнал события, вытесняя самые старые"""
+        log = self._change_log.setdefault(event_id, deque())
+        log.extend(lines)
+        limit = BROADCAST_SETTINGS['ROSTER_LOG_LINES']
+        while len(log) > limit:
+            log.popleft()
+            self._change_log_dropped[event_id] = self._change_log_dropped.get(event_id, 0) + 1
+    
+    async def _render_counts(self, event: Dict) -> str:
+        counts = await self.async_db.run(self.event_service.get_participant_counts, event['id'])
+        return f"Основной состав: {counts['confirmed']}/{event['max_participants']}, резерв: {counts['reserve']}"
+    
+    async def render_live_message(self, event: Dict) -> str:
+        """Текст живого сообщения: журнал изменений состава и счетчики"""
+        log = list(self._change_log.get(event['id'], ()))
+        dropped = self._change_log_dropped.get(event['id'], 0)
+        if dropped:
+            log.insert(0, f"… ранее изменений: {dropped}")
+        counts = await self._render_counts(event)
+        return "\n\n".join(part for part in (f"🏐 {event['name']}", "\n".join(log), counts) if part)
+    
+    async def render_full_roster(self, event: Dict) -> str:
+        """Полный список участников со счетчиками - по кнопке под живым сообщением"""
+        participants_list = await self.event_service.get_participants_list_async(event['id'], event)
+        counts = await self._render_counts(event)
+        return f"🏐 {event['name']}\n\n{participants_list}\n\n{counts}"
+    
+    def _render_changes(self, event_id: int, changes: List[Dict]) -> List[Tuple[int, str]]:
+        """Строки уведомления об изменениях: (telegram_id автора изменения, текст)"""
+        lines = []
+        for change in changes:
+            if not change['joined']:
+                lines.append((change['telegram_id'], f"➖ {change['name']} {change['action']}"))
+                continue
+            position = self.event_service.get_roster_position(event_id, change['telegram_id'])
+            if not position:
+                continue
+            if change['moved']:
+                if position['status'] == 'confirmed':
+                    lines.append((change['telegram_id'], f"⬆️ {position['display_name']} переходит в основной состав"))
+                continue
+            status = "основной" if position['status'] == 'confirmed' else "резерв"
+            lines.append((
+                change['telegram_id'],
+                f"➕ {position['display_name']} {change['action']} (#{position['number']}, {status})"
+            ))
+        return lines
     
     async def send_moved_to_main_notification(self, telegram_id: int, username: str):
-        """Отправить уведомление о перемещении из резерва в основной состав"""
+        """Поставить в очередь уведомление о перемещении из резерва в основной состав"""
         try:
-            await self.bot.send_message(
-                chat_id=telegram_id,
-                text=MESSAGES['moved_to_main']
-            )
-            logger.info(f"Уведомление о перемещении в основной состав отправлено пользователю {telegram_id}")
+            await self.outbox.enqueue(telegram_id, {'text': MESSAGES['moved_to_main']}, 'moved_to_main')
+            logger.info(f"Уведомление о перемещении в основной состав поставлено в очередь для пользователя {telegram_id}")
         except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления о перемещении пользователю {telegram_id}: {e}")
+            logger.error(f"Ошибка при постановке в очередь уведомления о перемещении пользователю {telegram_id}: {e}")
+    
+    async def send_moved_to_main_notifications(self, telegram_ids: List[int], participants_list: str) -> Dict:
+        """Сообщить перемещенным из резерва о переходе в основной состав вместе с обновленным списком"""
+        result = await self._broadcast(telegram_ids, {
+            'text': f"{MESSAGES['moved_to_main']}\n\n📋 Обновленный список участников:\n\n{participants_list}"
+        }, 'moved_to_main')
+        logger.info(f"Уведомление о перемещении в основной состав отправлено {result['sent']} пользователям")
+        return result
     
     async def send_presence_reminder(self, event_id: int, telegram_id: int, event_name: str, reminder_type: str = 'first'):
-        """Отправить напоминание о подтверждении присутствия"""
+        """Поставить в очередь напоминание о подтверждении присутствия"""
         from utils.keyboard import create_presence_confirmation_keyboard
         
         if reminder_type == 'first':
@@ -74,61 +250,103 @@ class NotificationService:
         else:
             message = MESSAGES['second_reminder']
         
-        keyboard = create_presence_confirmation_keyboard(event_id, telegram_id)
-        
         try:
-            await self.bot.send_message(
-                chat_id=telegram_id,
-                text=f"{message}\n\n{event_name}",
-                reply_markup=keyboard
-            )
-            logger.info(f"Напоминание о присутствии отправлено пользователю {telegram_id}")
+            await self.outbox.enqueue(telegram_id, {
+                'text': f"{message}\n\n{event_name}",
+                'reply_markup': create_presence_confirmation_keyboard(event_id, telegram_id)
+            }, 'presence_reminder')
+            logger.info(f"Напоминание о присутствии поставлено в очередь для пользователя {telegram_id}")
         except Exception as e:
-            logger.error(f"Ошибка при отправке напоминания пользователю {telegram_id}: {e}")
+            logger.error(f"Ошибка при постановке в очередь напоминания пользователю {telegram_id}: {e}")
+    
+    async def send_presence_reminders(self, event_id: int, telegram_ids: List[int], event_name: str,
+                                      reminder_type: str = 'first') -> Dict:
+        """Разослать напоминания о подтверждении присутствия, вернуть сводку рассылки"""
+        from utils.keyboard import create_presence_confirmation_keyboard
+        
+        if reminder_type == 'first':
+            message = MESSAGES['presence_reminder']
+        else:
+            message = MESSAGES['second_reminder']
+        
+        def build_message(telegram_id: int) -> Dict:
+            return {
+                'text': f"{message}\n\n{event_name}",
+                'reply_markup': create_presence_confirmation_keyboard(event_id, telegram_id)
+            }
+        
+        return await self.broadcaster.broadcast(telegram_ids, build_message)
     
     async def send_auto_leave_notification(self, telegram_id: int, event_name: str):
-        """Отправить уведомление об автоматической отписке"""
+        """Поставить в очередь уведомление об автоматической отписке"""
         try:
-            await self.bot.send_message(
-                chat_id=telegram_id,
-                text=f"{MESSAGES['auto_leave']}\n\n{event_name}"
-            )
-            logger.info(f"Уведомление об автоматической отписке отправлено пользователю {telegram_id}")
+            await self.outbox.enqueue(telegram_id, {'text': f"{MESSAGES['auto_leave']}\n\n{event_name}"}, 'auto_leave')
+            logger.info(f"Уведомление об автоматической отписке поставлено в очередь для пользователя {telegram_id}")
         except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления об отписке пользователю {telegram_id}: {e}")
+            logger.error(f"Ошибка при постановке в очередь уведомления об отписке пользователю {telegram_id}: {e}")
+    
+    async def send_auto_leave_notifications(self, telegram_ids: List[int], event_name: str) -> Dict:
+        """Сообщить автоматически отписанным участникам об отписке и обновить их клавиатуры"""
+        joined_ids = await get_joined_telegram_ids_async(self.db, self.event_service)
+        
+        def build_message(telegram_id: int) -> Dict:
+            is_joined = get_is_joined(self.db, self.event_service, telegram_id, joined_ids)
+            return {
+                'text': f"{MESSAGES['auto_leave']}\n\n{event_name}\n\nВы можете снова записаться на тренировку!",
+                'reply_markup': create_main_keyboard(is_joined=is_joined)
+            }
+        
+        return await self._broadcast(telegram_ids, build_message, 'auto_leave')
     
-    async def send_no_reserve_notification(self, event_id: int):
+    async def send_no_reserve_notification(self, event_id: int) -> Optional[Dict]:
         """Отправить уведомление о том, что в резерве никого нет"""
-        subscribed_users = self.db.get_subscribed_users()
-        event = self.db.get_event_by_id(event_id)
+        subscribed_users = await self.async_db.get_subscribed_users()
+        event = await self.async_db.get_event_by_id(event_id)
         
         if not event:
-            return
+            return None
         
         message = f"{MESSAGES['no_reserve']}\n\n{event['name']}"
         
-        for telegram_id in subscribed_users:
-            try:
-                await self.bot.send_message(chat_id=telegram_id, text=message)
-                logger.info(f"Уведомление об отсутствии резерва отправлено пользователю {telegram_id}")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления пользователю {telegram_id}: {e}")
+        result = await self._broadcast(subscribed_users, {'text': message}, 'no_reserve')
+        logger.info(f"Уведомление об отсутствии резерва отправлено {result['sent']} пользователям")
+        return result
+    
+    async def send_limit_changed_notification(self, old_limit: int, new_limit: int) -> Dict:
+        """Сообщить всем подписанным об изменении лимита и обновить их клавиатуры"""
+        subscribed_users = await self.async_db.get_subscribed_users()
+        joined_ids = await get_joined_telegram_ids_async(self.db, self.event_service)
+        
+        def build_message(telegram_id: int) -> Dict:
+            is_joined = get_is_joined(self.db, self.event_service, telegram_id, joined_ids)
+            return {
+                'text': f"🔄 Лимит участников изменен с {old_limit} на {new_limit}",
+                'reply_markup': create_main_keyboard(is_joined=is_joined)
+            }
+        
+        return await self._broadcast(subscribed_users, build_message, 'limit_changed')
+    
+    async def send_event_cancelled_notification(self, telegram_ids: List[int]) -> Dict:
+        """Сообщить участникам об отмене события и сбросить их клавиатуры"""
+        return await self._broadcast(telegram_ids, {
+            'text': "❌ Событие отменено. Вы можете записаться на следующее!",
+            'reply_markup': create_main_keyboard(is_joined=False)
+        }, 'event_cancelled')
     
     async def send_admin_notification(self, admin_id: int, message: str):
-        """Отправить уведомление администратору"""
+        """Поставить в очередь уведомление администратору"""
         try:
-            await self.bot.send_message(chat_id=admin_id, text=message)
-            logger.info(f"Админ уведомление отправлено: {admin_id}")
+            await self.outbox.enqueue(admin_id, {'text': message}, 'admin')
+            logger.info(f"Админ уведомление поставлено в очередь: {admin_id}")
         except Exception as e:
-            logger.error(f"Ошибка при отправке админ уведомления {admin_id}: {e}")
+            logger.error(f"Ошибка при постановке в очередь админ уведомления {admin_id}: {e}")
     
     async def send_error_notification(self, telegram_id: int, error_message: str):
-        """Отправить уведомление об ошибке"""
+        """Поставить в очередь уведомление об ошибке"""
         try:
-            await self.bot.send_message(
-                chat_id=telegram_id,
-                text=f"❌ Произошла ошибка: {error_message}\n\nПопробуйте позже или обратитесь к администратору."
-            )
-            logger.error(f"Уведомление об ошибке отправлено пользователю {telegram_id}: {error_message}")
+            await self.outbox.enqueue(telegram_id, {
+                'text': f"❌ Произошла ошибка: {error_message}\n\nПопробуйте позже или обратитесь к администратору."
+            }, 'error')
+            logger.error(f"Уведомление об ошибке поставлено в очередь для пользователя {telegram_id}: {error_message}")
         except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления об ошибке пользователю {telegram_id}: {e}") 
\ No newline at end of file
+            logger.error(f"Ошибка при постановке в очередь уведомления об ошибке пользователю {telegram_id}: {e}")
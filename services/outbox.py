@@ -0,0 +1,175 @@
+import asyncio
+import inspect
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+from config.settings import BROADCAST_SETTINGS
+from data.async_database import AsyncDatabase
+from data.database import Database
+from data.query_stats import set_query_label
+from services.broadcast_service import FAILED, SENT, BroadcastService
+
+logger = logging.getLogger(__name__)
+
+# Сообщение, которое не удалось восстановить из очереди
+INVALID = 'invalid'
+
+_MARKUP_TYPES = {cls.__name__: cls for cls in (InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove)}
+
+
+def serialize_message(message: Dict) -> str:
+    """Аргументы send_message -> JSON для таблицы outbox"""
+    data = dict(message)
+    markup = data.pop('reply_markup', None)
+    if markup is not None:
+        data['reply_markup'] = {'type': type(markup).__name__, 'data': markup.to_dict()}
+    return json.dumps(data, ensure_ascii=False)
+
+
+def deserialize_message(payload: str) -> Dict:
+    """JSON из таблицы outbox -> аргументы send_message"""
+    data = json.loads(payload)
+    markup = data.pop('reply_markup', None)
+    if markup is not None:
+        data['reply_markup'] = _MARKUP_TYPES[markup['type']].de_json(markup['data'], None)
+    return data
+
+
+class Outbox:
+    """Надежная очередь исходящих сообщений в базе бота.
+
+    ``enqueue`` только записывает сообщение в таблицу ``outbox`` и сразу
+    возвращает управление, отправкой занимается фоновый диспетчер
+    (``start``/``stop``). Он забирает пачки по ``OUTBOX_BATCH`` сообщений,
+    отправляет их через ``BroadcastService`` (с его лимитами скорости),
+    неудачные повторяет с экспоненциальной задержкой, а после
+    ``OUTBOX_MAX_ATTEMPTS`` попыток или блокировки бота переводит в
+    dead-letter. Сообщения переживают перезапуск бота.
+    """
+
+    def __init__(self, database: Database, broadcaster: BroadcastService):
+        self.db = database
+        self.async_db = AsyncDatabase.shared(database)
+        self.broadcaster = broadcaster
+        self.batch_size = BROADCAST_SETTINGS['OUTBOX_BATCH']
+        self.max_attempts = BROADCAST_SETTINGS['OUTBOX_MAX_ATTEMPTS']
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {'sent': 0, 'retried': 0, 'dead': 0, 'last_lag': 0.0}
+
+    async def enqueue(self, chat_id: int, message: Dict, kind: str = 'message'):
+        """Поставить одно сообщение в очередь"""
+        await self.enqueue_many([chat_id], message, kind)
+
+    async def enqueue_many(self, chat_ids: List[int], message, kind: str = 'message'):
+        """Поставить сообщения в очередь одной записью.
+
+        ``message`` - аргументы send_message или функция (обычная или async)
+        chat_id -> аргументы (None - чат пропускается), как в
+        ``BroadcastService.broadcast``. Аргументы сериализуются сразу, поэтому
+        функция вызывается при постановке в очередь, а не при отправке.
+        """
+        rows = []
+        for chat_id in chat_ids:
+            kwargs = message(chat_id) if callable(message) else message
+            if inspect.isawaitable(kwargs):
+                kwargs = await kwargs
+            if kwargs is not None:
+                rows.append((chat_id, kind, serialize_message(kwargs)))
+        if not rows:
+            return
+        await self.async_db.enqueue_outbox(rows)
+        if self._wakeup:
+            self._wakeup.set()
+
+    # Диспетчер
+    def start(self):
+        """Запустить фоновую отправку (в работающем цикле событий)"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info("Диспетчер очереди сообщений запущен")
+
+    async def stop(self):
+        """Остановить фоновую отправку; недоставленное останется в базе"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("Диспетчер очереди сообщений остановлен")
+
+    async def _run(self):
+        set_query_label('outbox')
+        while True:
+            try:
+                processed = await self.dispatch_once()
+            except Exception as e:
+                logger.error(f"Ошибка диспетчера очереди сообщений: {e}")
+                processed = 0
+            if processed:
+                continue
+            # Очередь пуста - ждем новых сообщений или наступления времени повторов
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), BROADCAST_SETTINGS['OUTBOX_POLL_INTERVAL'])
+            except asyncio.TimeoutError:
+                pass
+
+    async def dispatch_once(self) -> int:
+        """Отправить одну пачку сообщений, вернуть ее размер"""
+        messages = await self.async_db.claim_outbox_batch(self.batch_size, BROADCAST_SETTINGS['OUTBOX_LEASE'])
+        if not messages:
+            return 0
+
+        async def deliver(message: Dict) -> Tuple[Dict, str]:
+            try:
+                outcome = await self.broadcaster.send(message['chat_id'], **deserialize_message(message['payload']))
+            except Exception as e:
+                logger.error(f"Некорректное сообщение {message['id']} в очереди: {e}")
+                outcome = INVALID
+            return message, outcome
+
+        results = await asyncio.gather(*(deliver(message) for message in messages))
+        now = time.time()
+        sent_ids = []
+        failures = []
+        for message, outcome in results:
+            if outcome == SENT:
+                sent_ids.append(message['id'])
+                self._stats['last_lag'] = now - message['created_at']
+                continue
+            attempts = message['attempts'] + 1
+            # Заблокированный чат, отклоненное Telegram и некорректное сообщение повторять бессмысленно
+            if outcome != FAILED or attempts >= self.max_attempts:
+                failures.append((message['id'], attempts, None, outcome))
+                self._stats['dead'] += 1
+                logger.warning(
+                    f"Сообщение {message['id']} ({message['kind']}) пользователю {message['chat_id']} "
+                    f"не доставлено после {attempts} попыток, перенесено в dead-letter"
+                )
+            else:
+                delay = BROADCAST_SETTINGS['OUTBOX_BACKOFF_BASE'] * 2 ** (attempts - 1)
+                failures.append((message['id'], attempts, now + delay, outcome))
+                self._stats['retried'] += 1
+        if sent_ids:
+            await self.async_db.complete_outbox_messages(sent_ids)
+            self._stats['sent'] += len(sent_ids)
+        if failures:
+            await self.async_db.fail_outbox_messages(failures)
+        return len(messages)
+
+    async def get_stats(self) -> Dict:
+        """Глубина очереди, dead-letter, задержка доставки и счетчики диспетчера"""
+        stats = await self.async_db.get_outbox_stats()
+        oldest = stats.pop('oldest_pending_at')
+        stats['lag'] = time.time() - oldest if oldest else 0.0
+        stats.update(self._stats)
+        return stats
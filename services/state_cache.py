@@ -0,0 +1,145 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from data.database import Database
+from utils.timezone_utils import get_now_with_timezone
+
+logger = logging.getLogger(__name__)
+
+
+class EventStateCache:
+    """Горячее состояние в памяти процесса: активные события и их составы.
+
+    Источник истины - база данных. Каждая запись сначала фиксируется в базе,
+    затем ``refresh_event``/``refresh_events`` сразу перечитывают затронутое
+    состояние (write-through). Записи в обход сервиса событий (например,
+    из админ-панели) тоже не приводят к устаревшим данным: снимки сверяются
+    с версиями ``Database.get_roster_version``/``get_events_version`` и при
+    расхождении перечитываются.
+
+    Версии отслеживают только записи своего процесса, поэтому при нескольких
+    репликах кэш выключается (``enabled=False``) и каждое чтение идет в базу.
+
+    Состав события хранится как упорядоченные списки основного состава и
+    резерва плюс индекс telegram_id -> участник, поэтому проверка записи,
+    счетчики и отрисовка списка - это обращения к словарям.
+    """
+
+    def __init__(self, database: Database, enabled: bool = True):
+        self.db = database
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # (версия событий, дата) -> список активных событий
+        self._active_events: Optional[Tuple[tuple, List[Dict]]] = None
+        # event_id -> снимок состава
+        self._rosters: Dict[int, Dict] = {}
+        self._stats = {'hits': 0, 'misses': 0}
+
+    # Активные события
+    def get_active_events(self) -> List[Dict]:
+        """Получить активные события (копии, их можно менять)"""
+        if not self.enabled:
+            return self.db.get_active_events()
+        key = (self.db.get_events_version(), get_now_with_timezone().date())
+        cached = self._active_events
+        if cached and cached[0] == key:
+            self._count('hits')
+            events = cached[1]
+        else:
+            self._count('misses')
+            events = self.db.get_active_events()
+            self._active_events = (key, events)
+        return [dict(event) for event in events]
+
+    def refresh_events(self):
+        """Перечитать активные события после изменения таблицы событий"""
+        if not self.enabled:
+            return
+        key = (self.db.get_events_version(), get_now_with_timezone().date())
+        self._active_events = (key, self.db.get_active_events())
+
+    # Составы событий
+    def _load_roster(self, event_id: int) -> Dict:
+        # Версию берем до чтения: если состав изменится во время загрузки,
+        # снимок окажется со старой версией и будет перечитан при следующем обращении
+        version = self.db.get_roster_version(event_id)
+        participants = self.db.get_event_participants(event_id)
+        roster = {
+            'version': version,
+            'participants': participants,
+            'confirmed': [p for p in participants if p['status'] == 'confirmed'],
+            'reserve': [p for p in participants if p['status'] == 'reserve'],
+            'by_telegram_id': {p['telegram_id']: p for p in participants}
+        }
+        if not self.enabled:
+            return roster
+        with self._lock:
+            self._rosters[event_id] = roster
+        return roster
+
+    def get_roster(self, event_id: int) -> Dict:
+        """Получить снимок состава события.
+
+        Снимок нельзя изменять: он общий для всех читателей.
+        """
+        roster = self._rosters.get(event_id)
+        if roster and roster['version'] == self.db.get_roster_version(event_id):
+            self._count('hits')
+            return roster
+        self._count('misses')
+        return self._load_roster(event_id)
+
+    def refresh_event(self, event_id: int):
+        """Перечитать состав события после записи в базу"""
+        if self.enabled:
+            self._load_roster(event_id)
+
+    def get_participant(self, event_id: int, telegram_id: int) -> Optional[Dict]:
+        """Получить участника события по telegram_id"""
+        participant = self.get_roster(event_id)['by_telegram_id'].get(telegram_id)
+        return dict(participant) if participant else None
+
+    def is_joined(self, event_id: int, telegram_id: int) -> bool:
+        """Проверить, записан ли пользователь на событие"""
+        return telegram_id in self.get_roster(event_id)['by_telegram_id']
+
+    def get_joined_telegram_ids(self, event_id: int) -> Set[int]:
+        """Получить множество telegram_id, записанных на событие"""
+        return set(self.get_roster(event_id)['by_telegram_id'])
+
+    def get_counts(self, event_id: int) -> Dict:
+        """Количество участников в основном составе и резерве"""
+        roster = self.get_roster(event_id)
+        return {
+            'confirmed': len(roster['confirmed']),
+            'reserve': len(roster['reserve']),
+            'total': len(roster['participants'])
+        }
+
+    def invalidate(self, event_id: Optional[int] = None):
+        """Сбросить состав события (None - все составы и список событий)"""
+        with self._lock:
+            if event_id is None:
+                self._rosters.clear()
+                self._active_events = None
+            else:
+                self._rosters.pop(event_id, None)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_stats(self) -> Dict:
+        """Счетчики попаданий в кэш состояния"""
+        with self._lock:
+            hits = self._stats['hits']
+            misses = self._stats['misses']
+            cached_events = len(self._rosters)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'cached_events': cached_events
+        }
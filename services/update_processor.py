@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config.settings import ADMIN_IDS
+from data.query_stats import get_query_label
+from utils.metrics import UPDATE_DURATION, UPDATES
+
+logger = logging.getLogger(__name__)
+
+# Ключ изменений состава событий: записи, отписки, подтверждения, действия администратора
+ROSTER_KEY = 'roster'
+
+# Кнопки и callback-и, которые меняют состав события
+ROSTER_MUTATION_TEXTS = {"Иду на тренировку!"}
+ROSTER_MUTATION_CALLBACKS = ('confirm_',)
+# Команды администратора, которые меняют состав: выбор лимита участников и ID удаляемого события
+ADMIN_ROSTER_MUTATION_TEXTS = {"4 участника", "6 участников", "12 участников", "18 участников", "24 участника"}
+
+# Ключи, которые удерживает обновление, обрабатываемое в текущей задаче
+_held_keys: ContextVar[Optional[Dict[str, asyncio.Lock]]] = ContextVar('held_update_keys', default=None)
+
+
+def _is_admin_roster_mutation(text: str) -> bool:
+    # Состояние админ-панели ключу недоступно, поэтому ID события узнается по виду текста
+    return text in ADMIN_ROSTER_MUTATION_TEXTS or text.strip().isdigit()
+
+
+def update_keys(update: object) -> List[str]:
+    """Ключи упорядочивания обновления: пользователь и, если обновление меняет состав, ROSTER_KEY"""
+    if not isinstance(update, Update):
+        return []
+    keys = []
+    user = update.effective_user
+    if user:
+        keys.append(f'user:{user.id}')
+    if update.message and update.message.text:
+        text = update.message.text
+        is_admin = user is not None and user.id in ADMIN_IDS
+        if text in ROSTER_MUTATION_TEXTS or (is_admin and _is_admin_roster_mutation(text)):
+            keys.append(ROSTER_KEY)
+    elif update.callback_query and update.callback_query.data:
+        if update.callback_query.data.startswith(ROSTER_MUTATION_CALLBACKS):
+            keys.append(ROSTER_KEY)
+    return keys
+
+
+def release_update_key(key: str):
+    """Отпустить ключ текущего обновления до конца его обработки.
+
+    Обработчик вызывает это, когда изменение уже записано в базу: порядок
+    изменений состава зафиксирован, а ответы пользователю могут идти
+    параллельно с обработкой следующих нажатий.
+    """
+    held = _held_keys.get()
+    if held and key in held:
+        held.pop(key).release()
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с упорядочиванием по ключам.
+
+    Обновления с общим ключом обрабатываются строго в порядке поступления
+    (``asyncio.Lock`` пропускает ожидающих по очереди), с разными ключами -
+    параллельно, не больше ``max_concurrent_updates`` одновременно. Ключи
+    берет ``key_func``: каждый пользователь - свой ключ, изменения состава
+    событий дополнительно идут под общим ``ROSTER_KEY``, чтобы места
+    распределялись в порядке нажатий. Ключи захватываются в одном и том же
+    порядке, поэтому взаимных блокировок нет.
+    """
+
+    def __init__(self, max_concurrent_updates: int,
+                 key_func: Callable[[object], Iterable[str]] = update_keys):
+        super().__init__(max_concurrent_updates)
+        self.key_func = key_func
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Сколько обновлений держат или ждут ключ; свободные замки удаляются
+        self._users: Dict[str, int] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Общий ключ состава захватывается последним: пока обновление ждет
+        # своего пользователя, оно не задерживает чужие записи
+        keys = sorted(set(self.key_func(update)), key=lambda key: (key == ROSTER_KEY, key))
+        for key in keys:
+            self._users[key] = self._users.get(key, 0) + 1
+            if key not in self._locks:
+                self._locks[key] = asyncio.Lock()
+        held: Dict[str, asyncio.Lock] = {}
+        token = _held_keys.set(held)
+        try:
+            for key in keys:
+                lock = self._locks[key]
+                await lock.acquire()
+                held[key] = lock
+            started = time.perf_counter()
+            try:
+                await coroutine
+            finally:
+                # Обработчик назвал себя через set_query_label; время ожидания ключей не входит
+                handler = get_query_label()
+                UPDATE_DURATION.observe(time.perf_counter() - started, handler)
+                UPDATES.inc(handler)
+        finally:
+            for lock in held.values():
+                lock.release()
+            _held_keys.reset(token)
+            for key in keys:
+                self._users[key] -= 1
+                if not self._users[key]:
+                    del self._users[key]
+                    del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
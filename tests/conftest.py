@@ -0,0 +1,52 @@
+"""Общие фикстуры тестов: база данных на каждом из бэкендов хранения.
+
+Тесты с фикстурой ``database_url`` выполняются дважды: на временном файле
+SQLite и на PostgreSQL из ``TEST_DATABASE_URL`` (или ``DATABASE_URL``, если он
+указывает на PostgreSQL). Для PostgreSQL каждый тест получает свою схему,
+которая удаляется после теста; без строки подключения или psycopg2 вариант
+пропускается. Только варианты PostgreSQL: ``pytest -m postgres``.
+"""
+import os
+import uuid
+from urllib.parse import quote, urlparse
+
+import pytest
+
+from data.backends import create_backend
+from data.database import Database
+
+
+def _postgres_url():
+    url = os.getenv('TEST_DATABASE_URL') or os.getenv('DATABASE_URL')
+    if not url or urlparse(url).scheme not in ('postgres', 'postgresql'):
+        return None
+    return url
+
+
+@pytest.fixture(params=['sqlite', pytest.param('postgresql', marks=pytest.mark.postgres)])
+def database_url(request, tmp_path):
+    if request.param == 'sqlite':
+        yield f"sqlite:///{tmp_path / 'test.db'}"
+        return
+
+    url = _postgres_url()
+    if url is None:
+        pytest.skip("PostgreSQL не задан: TEST_DATABASE_URL=postgresql://...")
+    psycopg2 = pytest.importorskip('psycopg2')
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    conn.cursor().execute(f'CREATE SCHEMA {schema}')
+    separator = '&' if urlparse(url).query else '?'
+    try:
+        yield f"{url}{separator}options={quote(f'-csearch_path={schema}')}"
+    finally:
+        conn.cursor().execute(f'DROP SCHEMA {schema} CASCADE')
+        conn.close()
+
+
+@pytest.fixture
+def db(database_url):
+    database = Database(backend=create_backend(database_url))
+    yield database
+    database.close()
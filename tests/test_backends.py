@@ -0,0 +1,36 @@
+import pytest
+
+from data.backends import create_backend, translate_sql
+
+
+def test_translate_sql_replaces_placeholders_outside_literals():
+    sql = "SELECT '?', \"a?\" FROM t WHERE a = ? AND b LIKE 'x%' -- нужен ли ?\n"
+
+    assert translate_sql(sql) == "SELECT '?', \"a?\" FROM t WHERE a = %s AND b LIKE 'x%%' -- нужен ли ?\n"
+
+
+def test_translate_sql_handles_escaped_quotes_and_block_comments():
+    sql = "SELECT 'it''s ?' /* ? */, ? FROM t"
+
+    assert translate_sql(sql) == "SELECT 'it''s ?' /* ? */, %s FROM t"
+
+
+def test_translate_sql_rewrites_null_safe_comparison():
+    assert translate_sql('WHERE a IS NOT ? AND b IS NOT NULL') == 'WHERE a IS DISTINCT FROM %s AND b IS NOT NULL'
+    assert translate_sql('id INTEGER PRIMARY KEY AUTOINCREMENT') == 'id BIGSERIAL PRIMARY KEY'
+
+
+def test_literals_with_placeholder_characters_survive(db):
+    db.add_user(1, 'a?b%c')
+
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT username, '?%' FROM users WHERE username LIKE 'a?b%' AND telegram_id = ?", (1,)
+        )
+        assert cursor.fetchone() == ('a?b%c', '?%')
+
+
+def test_unknown_database_url_is_rejected():
+    with pytest.raises(ValueError):
+        create_backend('mysql://localhost/db')
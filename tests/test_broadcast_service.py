@@ -0,0 +1,112 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from services.broadcast_service import (
+    BLOCKED, FAILED, REJECTED, SENT, BroadcastService, TokenBucket, classify_error
+)
+
+
+class FakeBot:
+    """Бот без сети: для чатов из ``errors`` send_message выбрасывает заданные ошибки по очереди"""
+
+    def __init__(self, errors=None):
+        self.errors = {chat_id: list(queue) for chat_id, queue in (errors or {}).items()}
+        self.calls = []
+        self.delivered = []
+
+    async def send_message(self, chat_id, **kwargs):
+        self.calls.append((time.monotonic(), chat_id))
+        queue = self.errors.get(chat_id)
+        if queue:
+            raise queue.pop(0)
+        self.delivered.append(chat_id)
+        return SimpleNamespace(message_id=1000 + chat_id)
+
+
+def test_classify_error():
+    assert classify_error(Forbidden("Forbidden: bot was blocked by the user")) == BLOCKED
+    assert classify_error(BadRequest("Chat not found")) == BLOCKED
+    assert classify_error(BadRequest("Message is too long")) == REJECTED
+    assert classify_error(TimedOut()) == FAILED
+    assert classify_error(NetworkError("connection reset")) == FAILED
+    assert classify_error(RuntimeError("boom")) == FAILED
+
+
+def test_token_bucket_throttles_after_burst():
+    bucket = TokenBucket(rate=20, capacity=2)
+
+    async def scenario():
+        started = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # Два токена из запаса, еще четыре - по 1/20 с каждый
+    assert asyncio.run(scenario()) >= 4 / 20 - 0.01
+
+
+def test_token_bucket_pause_blocks_acquire():
+    bucket = TokenBucket(rate=1000)
+
+    async def scenario():
+        bucket.pause(0.2)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.19
+
+
+def test_broadcast_outcomes_and_flood_wait():
+    bot = FakeBot({
+        1: [RetryAfter(0.2)],
+        2: [Forbidden("Forbidden: bot was blocked by the user")],
+        3: [BadRequest("Message is too long")],
+        4: [TimedOut(), TimedOut()],
+    })
+    service = BroadcastService(bot, rate=1000, per_chat_interval=0, concurrency=3, max_retries=1)
+    unreachable = []
+
+    async def on_unreachable(chats):
+        unreachable.append(chats)
+
+    service.on_unreachable = on_unreachable
+    result = asyncio.run(service.broadcast([1, 2, 3, 4, 5, 6], {'text': 'Тренировка'}))
+
+    assert (result[SENT], result[FAILED], result[BLOCKED], result[REJECTED]) == (3, 1, 1, 1)
+    assert sorted(result['sent_ids']) == [1, 5, 6]
+    assert result['failed_ids'] == [4] and result['blocked_ids'] == [2] and result['rejected_ids'] == [3]
+    assert result['message_ids'] == {1: 1001, 5: 1005, 6: 1006}
+    assert unreachable == [{2: 'blocked'}]
+    # RetryAfter останавливает всю рассылку, а не только свой чат
+    flood_at, first_chat = bot.calls[0]
+    assert first_chat == 1
+    assert all(at - flood_at >= 0.19 for at, _ in bot.calls[1:])
+
+
+def test_broadcast_respects_rate_limit():
+    bot = FakeBot()
+    service = BroadcastService(bot, rate=50, per_chat_interval=0, concurrency=10)
+    capacity = service.limiter.capacity
+
+    result = asyncio.run(service.broadcast(range(1, 21), lambda chat_id: {'text': str(chat_id)}))
+
+    assert result[SENT] == 20
+    assert result['duration'] >= (20 - capacity) / 50 - 0.01
+
+
+def test_per_chat_interval_spaces_messages_to_one_chat():
+    bot = FakeBot()
+    service = BroadcastService(bot, rate=1000, per_chat_interval=0.1, concurrency=1)
+
+    async def scenario():
+        for _ in range(3):
+            assert await service.send(7, text='x') == SENT
+
+    asyncio.run(scenario())
+    times = [at for at, _ in bot.calls]
+
+    assert all(later - earlier >= 0.09 for earlier, later in zip(times, times[1:]))
@@ -0,0 +1,118 @@
+from datetime import date, timedelta
+
+import pytest
+
+from services.event_service import EMPTY_PARTICIPANTS_TEXT, EventService
+
+
+@pytest.fixture
+def cached_service(db):
+    service = EventService(db, cache_enabled=True)
+    service.set_participant_limit(2)
+    return service
+
+
+def create_event(service: EventService) -> int:
+    return service.create_event_on_date(date.today() + timedelta(days=2))
+
+
+def roster_lines(text: str):
+    """Строки участников без заголовка и текущего времени"""
+    return text.splitlines()[2:]
+
+
+def test_rendered_list_is_cached_until_roster_changes(db, cached_service):
+    event_id = create_event(cached_service)
+    for telegram_id in (1, 2, 3):
+        cached_service.join_event(event_id, telegram_id, f'user{telegram_id}')
+
+    first = cached_service.get_participants_list(event_id)
+    cached_service.get_participants_list(event_id)
+    stats = cached_service.get_roster_cache_stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+    assert roster_lines(first) == ["1. @user1 - Основной", "2. @user2 - Основной", "3. @user3 - Резерв"]
+
+    # Записи в обход сервиса (как из админ-панели) тоже сбрасывают отрисованный список
+    db.join_participant(event_id, 4, 'user4')
+    assert roster_lines(cached_service.get_participants_list(event_id))[-1] == "4. @user4 - Резерв"
+
+    # Без пересчета статусов: сервис поднял бы резерв сам, здесь видно только удаление
+    db.remove_participant(event_id, 1)
+    assert roster_lines(cached_service.get_participants_list(event_id)) == [
+        "1. @user2 - Основной", "2. @user3 - Резерв", "3. @user4 - Резерв"
+    ]
+
+    with db.transaction():
+        db.update_event_max_participants(event_id, 3)
+        db.recalculate_participant_statuses(event_id, 3)
+    assert roster_lines(cached_service.get_participants_list(event_id)) == [
+        "1. @user2 - Основной", "2. @user3 - Основной", "3. @user4 - Основной"
+    ]
+    assert cached_service.get_roster_cache_stats()['misses'] == 4
+
+
+def test_rolled_back_change_keeps_list(db, cached_service):
+    event_id = create_event(cached_service)
+    cached_service.join_event(event_id, 1, 'user1')
+    before = roster_lines(cached_service.get_participants_list(event_id))
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.join_participant(event_id, 2, 'user2')
+            raise RuntimeError("откат")
+
+    assert roster_lines(cached_service.get_participants_list(event_id)) == before
+
+
+def test_deleted_event_list_is_dropped(db, cached_service):
+    event_id = create_event(cached_service)
+    cached_service.join_event(event_id, 1, 'user1')
+    cached_service.get_participants_list(event_id)
+
+    cached_service.delete_event(event_id)
+
+    assert cached_service.get_roster_cache_stats()['cached_events'] == 0
+    assert cached_service.get_participants_list(event_id) == EMPTY_PARTICIPANTS_TEXT
+
+
+def test_state_cache_follows_roster_writes(db, cached_service):
+    event_id = create_event(cached_service)
+    for telegram_id in (1, 2, 3):
+        cached_service.join_event(event_id, telegram_id, f'user{telegram_id}')
+    assert cached_service.get_joined_telegram_ids(event_id) == {1, 2, 3}
+    hits = cached_service.get_state_cache_stats()['hits']
+    assert cached_service.get_participant_counts(event_id) == {'confirmed': 2, 'reserve': 1, 'total': 3}
+    assert cached_service.get_state_cache_stats()['hits'] == hits + 1
+
+    db.join_participant(event_id, 4, 'user4')
+    assert cached_service.is_joined(event_id, 4)
+
+    db.remove_participant(event_id, 1)
+    assert cached_service.get_joined_telegram_ids(event_id) == {2, 3, 4}
+
+    db.recalculate_participant_statuses(event_id, 2)
+    assert cached_service.get_participant_counts(event_id) == {'confirmed': 2, 'reserve': 1, 'total': 3}
+    assert cached_service.get_roster_position(event_id, 3)['status'] == 'confirmed'
+
+    db.confirm_presence(event_id, 2)
+    db.remove_unconfirmed_and_promote(event_id)
+    assert cached_service.get_joined_telegram_ids(event_id) == {2, 4}
+    assert cached_service.get_roster_position(event_id, 4)['status'] == 'confirmed'
+
+
+def test_active_events_follow_event_writes(db, cached_service):
+    first = create_event(cached_service)
+    assert [event['id'] for event in cached_service.get_active_events()] == [first]
+    hits = cached_service.get_state_cache_stats()['hits']
+    cached_service.get_active_events()
+    assert cached_service.get_state_cache_stats()['hits'] == hits + 1
+
+    second = db.create_event("Тренировка", date.today() + timedelta(days=5), "20:00", 2)
+    assert [event['id'] for event in cached_service.get_active_events()] == [first, second]
+
+    db.update_event_max_participants(first, 6)
+    assert cached_service.get_active_events()[0]['max_participants'] == 6
+
+    db.delete_event(first)
+    assert [event['id'] for event in cached_service.get_active_events()] == [second]
+    assert not cached_service.is_joined(first, 1)
@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from data.connection_pool import ConnectionPool, PoolTimeoutError
+from utils.metrics import DB_POOL_CHECKOUTS, DB_POOL_CONNECTIONS, bind_pool_stats
+
+
+def make_pool(max_size: int = 1, timeout: float = 1.0) -> ConnectionPool:
+    return ConnectionPool(lambda: sqlite3.connect(':memory:', check_same_thread=False),
+                          max_size=max_size, timeout=timeout)
+
+
+def test_pool_counts_hits_misses_and_reentrant_use():
+    pool = make_pool(max_size=2)
+
+    with pool.connection() as first:
+        with pool.connection() as nested:
+            assert nested is first
+    with pool.connection() as again:
+        assert again is first
+
+    stats = pool.stats()
+    assert (stats['misses'], stats['hits'], stats['reentrant'], stats['size'], stats['idle']) == (1, 1, 1, 1, 1)
+
+
+def test_pool_counts_waits_and_times_out():
+    pool = make_pool(max_size=1, timeout=0.2)
+    taken = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pool.connection():
+            taken.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    taken.wait()
+    with pytest.raises(PoolTimeoutError):
+        with pool.connection():
+            pass
+    threading.Timer(0.05, release.set).start()
+    started = time.monotonic()
+    with pool.connection():
+        pass
+    holder.join()
+
+    stats = pool.stats()
+    assert stats['waits'] == 1
+    assert 0 < stats['wait_time'] <= time.monotonic() - started
+
+
+def test_pool_stats_are_exported_as_metrics():
+    pool = make_pool(max_size=3)
+    with pool.connection():
+        pass
+    bind_pool_stats(pool.stats)
+
+    assert 'bot_db_pool_checkouts_total{result="miss"} 1' in DB_POOL_CHECKOUTS.collect()
+    assert 'bot_db_pool_connections{state="max"} 3' in DB_POOL_CONNECTIONS.collect()
+
+
+def test_nested_writes_roll_back_with_outer_transaction(db):
+    db.add_user(1, 'before')
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.add_user(1, 'after')
+            db.add_user(2, 'new')
+            db.set_setting('participant_limit', '6')
+            db.update_user_subscription(1, False)
+            raise RuntimeError("откат")
+
+    assert db.get_user_by_telegram_id(1)['username'] == 'before'
+    assert db.get_subscribed_users() == [1]
+    assert db.get_user_by_telegram_id(2) is None
+    assert db.get_setting('participant_limit', '18') == '18'
@@ -0,0 +1,109 @@
+from datetime import date, timedelta
+
+import pytest
+
+
+def create_event(db, max_participants: int = 3) -> int:
+    return db.create_event("Тренировка", date.today() + timedelta(days=2), "20:00", max_participants)
+
+
+def join(db, event_id: int, telegram_id: int):
+    return db.join_participant(event_id, telegram_id, f"user{telegram_id}")
+
+
+def statuses(db, event_id: int):
+    return [(p['telegram_id'], p['status']) for p in db.get_event_participants(event_id)]
+
+
+def test_join_positions_are_numbered_per_event(db):
+    first = create_event(db)
+    second = create_event(db)
+
+    positions = []
+    for telegram_id in range(1, 5):
+        positions.append((join(db, first, telegram_id)['position'], join(db, second, 100 + telegram_id)['position']))
+
+    assert positions == [(1, 1), (2, 2), (3, 3), (4, 4)]
+
+
+def test_join_respects_capacity_and_is_idempotent(db):
+    event_id = create_event(db, max_participants=3)
+
+    results = [join(db, event_id, telegram_id) for telegram_id in range(1, 6)]
+    repeated = join(db, event_id, 1)
+
+    assert [result['status'] for result in results] == ['confirmed'] * 3 + ['reserve'] * 2
+    assert repeated['joined'] is False and repeated['position'] == 1
+    assert join(db, event_id + 1000, 1) is None
+
+
+def test_join_participants_keeps_batch_order(db):
+    event_id = create_event(db, max_participants=2)
+
+    results = db.join_participants(event_id, [(telegram_id, None, None, None, False) for telegram_id in (7, 5, 9)])
+
+    assert [(result['position'], result['status']) for result in results] == [
+        (1, 'confirmed'), (2, 'confirmed'), (3, 'reserve')
+    ]
+
+
+def test_leave_renumbers_queue(db):
+    event_id = create_event(db)
+    for telegram_id in range(1, 5):
+        join(db, event_id, telegram_id)
+
+    db.remove_participant(event_id, 2)
+
+    assert [p['position'] for p in db.get_event_participants(event_id)] == [1, 2, 3]
+    assert join(db, event_id, 5)['position'] == 4
+
+
+def test_recalculate_statuses(db):
+    event_id = create_event(db, max_participants=2)
+    for telegram_id in range(1, 5):
+        join(db, event_id, telegram_id)
+
+    db.recalculate_participant_statuses(event_id, 3)
+
+    assert statuses(db, event_id) == [(1, 'confirmed'), (2, 'confirmed'), (3, 'confirmed'), (4, 'reserve')]
+
+
+def test_nested_roster_changes_roll_back_with_outer_transaction(db):
+    event_id = create_event(db, max_participants=2)
+    for telegram_id in range(1, 5):
+        join(db, event_id, telegram_id)
+    before = statuses(db, event_id)
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.remove_participant(event_id, 1)
+            db.recalculate_participant_statuses(event_id, 4)
+            raise RuntimeError("откат")
+
+    assert statuses(db, event_id) == before
+
+
+def test_unconfirmed_leave_promotes_reserve(db):
+    event_id = create_event(db, max_participants=2)
+    for telegram_id in range(1, 5):
+        join(db, event_id, telegram_id)
+    db.confirm_presence(event_id, 2)
+
+    result = db.remove_unconfirmed_and_promote(event_id)
+
+    assert [p['telegram_id'] for p in result['removed']] == [1]
+    assert [p['telegram_id'] for p in result['promoted']] == [3]
+    assert statuses(db, event_id) == [(2, 'confirmed'), (3, 'confirmed'), (4, 'reserve')]
+
+
+def test_nested_transaction_rolls_back_with_outer_one(db):
+    event_id = create_event(db)
+    join(db, event_id, 1)
+
+    # join_participant открывает свою transaction(): она должна присоединиться к внешней
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            join(db, event_id, 2)
+            raise RuntimeError("откат")
+
+    assert statuses(db, event_id) == [(1, 'confirmed')]
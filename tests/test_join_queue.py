@@ -0,0 +1,35 @@
+import asyncio
+import random
+from datetime import date, timedelta
+
+from config.settings import JOIN_RUSH_SETTINGS
+from services.event_service import EventService
+
+
+def test_concurrent_rush_joins_keep_enqueue_order(db, monkeypatch):
+    monkeypatch.setitem(JOIN_RUSH_SETTINGS, 'BATCH_SIZE', 4)
+    monkeypatch.setitem(JOIN_RUSH_SETTINGS, 'BATCH_DELAY', 0.01)
+    limit, users = 6, 30
+    event_service = EventService(db)
+    event_service.set_participant_limit(limit)
+    event_id = event_service.create_event_on_date(date.today() + timedelta(days=2))
+    rng = random.Random(22)
+    enqueued = []
+
+    async def press(telegram_id: int):
+        # Нажатия приходят вразнобой и растягиваются на несколько пачек
+        await asyncio.sleep(rng.random() / 20)
+        enqueued.append(telegram_id)
+        return telegram_id, await event_service.join_queue.submit(event_id, telegram_id, f'user{telegram_id}')
+
+    async def scenario():
+        event_service.join_queue.start_rush(event_id)
+        return dict(await asyncio.gather(*(press(telegram_id) for telegram_id in range(1, users + 1))))
+
+    results = asyncio.run(scenario())
+
+    assert [results[telegram_id]['position'] for telegram_id in enqueued] == list(range(1, users + 1))
+    assert [results[telegram_id]['status'] for telegram_id in enqueued] == ['confirmed'] * limit + ['reserve'] * (users - limit)
+    assert [p['telegram_id'] for p in db.get_event_participants(event_id)] == enqueued
+    stats = event_service.join_queue.get_stats()
+    assert stats['joins'] == users and stats['batches'] > 1 and stats['max_batch'] <= 4
@@ -0,0 +1,42 @@
+import asyncio
+from datetime import date, timedelta
+
+from services.event_service import EventService
+from utils.keyboard import get_is_joined, get_joined_telegram_ids, get_joined_telegram_ids_async
+
+
+def test_joined_ids_cover_nearest_event(db):
+    service = EventService(db)
+    assert get_joined_telegram_ids(db, service) == set()
+    assert not get_is_joined(db, service, 1)
+
+    nearest = service.create_event_on_date(date.today() + timedelta(days=1))
+    later = service.create_event_on_date(date.today() + timedelta(days=3))
+    for telegram_id in (1, 2):
+        service.join_event(nearest, telegram_id, f'user{telegram_id}')
+    service.join_event(later, 3, 'user3')
+
+    assert db.get_joined_telegram_ids(nearest) == {1, 2}
+    joined_ids = asyncio.run(get_joined_telegram_ids_async(db, service))
+    assert joined_ids == get_joined_telegram_ids(db, service) == {1, 2}
+    # Проверка по готовому множеству совпадает с проверкой по одному пользователю
+    for telegram_id in (1, 2, 3, 4):
+        assert get_is_joined(db, service, telegram_id, joined_ids) == get_is_joined(db, service, telegram_id)
+
+    service.leave_event(nearest, 2)
+    assert get_joined_telegram_ids(db, service) == {1}
+
+
+def test_fan_out_membership_does_not_query_per_user(db):
+    service = EventService(db, cache_enabled=False)
+    event_id = service.create_event_on_date(date.today() + timedelta(days=1))
+    for telegram_id in range(1, 6):
+        service.join_event(event_id, telegram_id, f'user{telegram_id}')
+    statements = db.get_query_stats()['statements']
+
+    joined_ids = get_joined_telegram_ids(db, service)
+    flags = [get_is_joined(db, service, telegram_id, joined_ids) for telegram_id in range(1, 101)]
+
+    assert flags.count(True) == 5
+    # Активные события и состав - по одному запросу на всю рассылку
+    assert db.get_query_stats()['statements'] - statements == 2
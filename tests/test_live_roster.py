@@ -0,0 +1,62 @@
+import asyncio
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from config.settings import BROADCAST_SETTINGS
+from services.event_service import EventService
+from services.notification_service import NotificationService
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = {}
+        self.edited = {}
+        self.next_message_id = 100
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.next_message_id += 1
+        self.sent.setdefault(chat_id, []).append((self.next_message_id, text, kwargs.get('reply_markup')))
+        return SimpleNamespace(message_id=self.next_message_id)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.edited.setdefault(chat_id, []).append((message_id, text))
+
+
+def test_live_message_keeps_change_log_not_full_list(db, monkeypatch):
+    monkeypatch.setitem(BROADCAST_SETTINGS, 'ROSTER_UPDATE_WINDOW', 0)
+    monkeypatch.setitem(BROADCAST_SETTINGS, 'ROSTER_LOG_LINES', 2)
+    event_service = EventService(db)
+    event_service.set_participant_limit(2)
+    event_id = event_service.create_event_on_date(date.today() + timedelta(days=2))
+    event = event_service.get_event_by_id(event_id)
+    bot = FakeBot()
+    notifications = NotificationService(bot, db, event_service)
+    notifications.broadcaster.per_chat_interval = 0
+    for telegram_id in range(1, 5):
+        db.add_user(telegram_id, f'user{telegram_id}')
+
+    async def scenario():
+        for telegram_id in (1, 2, 3):
+            event_service.join_event(event_id, telegram_id, f'user{telegram_id}')
+            await notifications.send_participants_update(event_id, telegram_id, f'user{telegram_id}', 'записался')
+        return await notifications.render_full_roster(event)
+
+    full_roster = asyncio.run(scenario())
+
+    # Каждый получает одно живое сообщение; автор первого изменения - только со следующим чужим
+    assert len(bot.sent[1]) == 1
+    assert [len(bot.sent[chat_id]) for chat_id in (2, 3, 4)] == [1, 1, 1]
+    message_id, _, markup = bot.sent[4][0]
+    assert markup.inline_keyboard[0][0].callback_data == f'roster_{event_id}'
+    # Последующие окна редактируют то же сообщение
+    assert [edited_id for edited_id, _ in bot.edited[4]] == [message_id, message_id]
+    live_text = bot.edited[4][-1][1]
+    assert live_text == (
+        f"🏐 {event['name']}\n\n"
+        "… ранее изменений: 1\n"
+        "➕ @user2 записался (#2, основной)\n"
+        "➕ @user3 записался (#3, резерв)\n\n"
+        "Основной состав: 2/2, резерв: 1"
+    )
+    # Полный список - только по кнопке
+    assert full_roster != live_text and "Основной состав: 2/2, резерв: 1" in full_roster
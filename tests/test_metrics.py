@@ -0,0 +1,75 @@
+import asyncio
+
+from utils.metrics import MetricsRegistry, MetricsServer
+
+
+async def http_get(port: int, path: str):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return head.decode().splitlines()[0], body.decode()
+
+
+def make_registry() -> MetricsRegistry:
+    registry = MetricsRegistry()
+    updates = registry.counter('bot_updates_total', "Обработанные обновления", ['handler'])
+    updates.inc('join')
+    updates.inc('join')
+    updates.inc('say "hi"\\\n', amount=3)
+    duration = registry.histogram('bot_update_duration_seconds', "Длительность", ['handler'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        duration.observe(value, 'join')
+    pool = registry.collector('bot_db_pool_connections', "Соединения пула", 'gauge', ['state'])
+    pool.bind(lambda: {('open',): 2, ('idle',): 1})
+    return registry
+
+
+def test_metrics_server_serves_registry():
+    server = MetricsServer(make_registry(), host='127.0.0.1', port=0)
+
+    async def scenario():
+        await server.start()
+        try:
+            return await http_get(server.port, '/metrics'), await http_get(server.port, '/')
+        finally:
+            await server.stop()
+
+    (status, body), (missing_status, _) = asyncio.run(scenario())
+    lines = body.splitlines()
+
+    assert status == 'HTTP/1.1 200 OK'
+    assert missing_status == 'HTTP/1.1 404 Not Found'
+    assert [line for line in lines if line.startswith('# TYPE')] == [
+        '# TYPE bot_updates_total counter',
+        '# TYPE bot_update_duration_seconds histogram',
+        '# TYPE bot_db_pool_connections gauge',
+    ]
+    assert 'bot_updates_total{handler="join"} 2' in lines
+    # Кавычки, обратная косая черта и перевод строки в значениях меток экранируются
+    assert 'bot_updates_total{handler="say \\"hi\\"\\\\\\n"} 3' in lines
+    assert [line for line in lines if line.startswith('bot_update_duration_seconds')] == [
+        'bot_update_duration_seconds_bucket{handler="join",le="0.1"} 1',
+        'bot_update_duration_seconds_bucket{handler="join",le="1.0"} 3',
+        'bot_update_duration_seconds_bucket{handler="join",le="+Inf"} 4',
+        'bot_update_duration_seconds_sum{handler="join"} 6.25',
+        'bot_update_duration_seconds_count{handler="join"} 4',
+    ]
+    assert 'bot_db_pool_connections{state="open"} 2' in lines
+    assert 'bot_db_pool_connections{state="idle"} 1' in lines
+
+
+def test_broken_collector_does_not_break_scrape():
+    registry = make_registry()
+    broken = registry.collector('bot_broken', "Ломается при сборе", 'gauge')
+
+    def fail():
+        raise RuntimeError("нет данных")
+
+    broken.bind(fail)
+    lines = registry.render().splitlines()
+
+    assert '# TYPE bot_broken gauge' in lines
+    assert 'bot_updates_total{handler="join"} 2' in lines
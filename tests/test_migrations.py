@@ -0,0 +1,151 @@
+import pytest
+
+from data import migrations
+from data.backends import create_backend
+from data.database import Database
+from data.migrations import MIGRATIONS, get_schema_version, run_migrations
+
+# Схема до версионных миграций: таблицы, которые создавала первая версия бота
+BASELINE_SCHEMA = [
+    '''
+    CREATE TABLE events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        date DATE NOT NULL,
+        time TIME NOT NULL,
+        max_participants INTEGER DEFAULT 18,
+        status TEXT DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id BIGINT UNIQUE NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        subscribed BOOLEAN DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE participants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id INTEGER,
+        user_id INTEGER,
+        status TEXT DEFAULT 'confirmed',
+        position INTEGER,
+        confirmed_presence BOOLEAN DEFAULT FALSE,
+        reminder_sent BOOLEAN DEFAULT FALSE,
+        second_reminder_sent BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (event_id) REFERENCES events (id),
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''',
+    '''
+    CREATE TABLE bot_settings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        setting_key TEXT UNIQUE NOT NULL,
+        setting_value TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+
+def create_baseline(database_url: str):
+    """База первой версии: событие, два пользователя и повторная запись одного из них"""
+    conn = create_backend(database_url).connect()
+    try:
+        cursor = conn.cursor()
+        for statement in BASELINE_SCHEMA:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO events (name, date, time) VALUES ('Тренировка', '2030-01-06', '20:00')")
+        cursor.execute("INSERT INTO users (telegram_id, username) VALUES (101, 'first'), (102, 'second')")
+        cursor.execute('''
+            INSERT INTO participants (event_id, user_id, status, position)
+            VALUES (1, 1, 'confirmed', 1), (1, 2, 'confirmed', 2), (1, 1, 'reserve', 3)
+        ''')
+        cursor.execute("INSERT INTO bot_settings (setting_key, setting_value) VALUES ('participant_limit', '12')")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def open_database(database_url: str) -> Database:
+    return Database(backend=create_backend(database_url))
+
+
+def schema_versions(db: Database):
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT version FROM schema_version ORDER BY version')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_baseline_database_is_migrated_to_latest_schema(database_url):
+    create_baseline(database_url)
+
+    db = open_database(database_url)
+    try:
+        assert schema_versions(db) == [version for version, _, _ in MIGRATIONS] == [1, 2, 3, 4, 5, 6]
+        # Повторная запись удалена, самая ранняя осталась, данные и настройки сохранены
+        assert [(p['telegram_id'], p['status']) for p in db.get_event_participants(1)] == [
+            (101, 'confirmed'), (102, 'confirmed')
+        ]
+        assert db.get_setting('participant_limit') == '12'
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            # Таблицы и столбцы, добавленные миграциями, доступны
+            cursor.execute('SELECT COUNT(*) FROM persistence_data')
+            cursor.execute('SELECT COUNT(*) FROM job_leases')
+            cursor.execute('SELECT expires_at, completed_at FROM job_runs')
+            cursor.execute('SELECT COUNT(*) FROM roster_messages')
+            cursor.execute('SELECT COUNT(*) FROM outbox')
+            cursor.execute('SELECT unsubscribed_reason, unsubscribed_at FROM users')
+            assert cursor.fetchall() == [(None, None), (None, None)]
+        # Уникальный индекс не дает записаться на событие дважды
+        with pytest.raises(Exception):
+            with db.transaction() as conn:
+                conn.cursor().execute('INSERT INTO participants (event_id, user_id) VALUES (1, 2)')
+    finally:
+        db.close()
+
+    # Повторный запуск ничего не применяет и не падает
+    db = open_database(database_url)
+    try:
+        assert schema_versions(db) == [1, 2, 3, 4, 5, 6]
+        with db.get_connection() as conn:
+            assert run_migrations(conn) == 6
+            assert get_schema_version(conn.cursor()) == 6
+        assert len(db.get_event_participants(1)) == 2
+    finally:
+        db.close()
+
+
+def test_job_runs_claimed_before_migration_count_as_completed(database_url, monkeypatch):
+    create_baseline(database_url)
+    # Реплика предыдущей версии: схема без срока заявки и отметки о завершении
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS[:5])
+    db = open_database(database_url)
+    try:
+        with db.transaction() as conn:
+            conn.cursor().execute(
+                "INSERT INTO job_runs (job_name, run_key, holder) VALUES ('reminders', '2030-01-05', 'old')"
+            )
+    finally:
+        db.close()
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS)
+    db = open_database(database_url)
+    try:
+        assert schema_versions(db)[-1] == 6
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT holder, expires_at, completed_at FROM job_runs')
+            assert cursor.fetchall() == [('old', 0, 0)]
+    finally:
+        db.close()
@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
+
+from config.settings import BROADCAST_SETTINGS
+from services.broadcast_service import BLOCKED, FAILED, REJECTED, SENT
+from services.outbox import INVALID, Outbox, deserialize_message, serialize_message
+
+BACKOFF = BROADCAST_SETTINGS['OUTBOX_BACKOFF_BASE']
+
+
+class StubBroadcaster:
+    """Вместо BroadcastService: исход отправки задан заранее для каждого чата"""
+
+    def __init__(self, outcomes=None):
+        self.outcomes = outcomes or {}
+        self.sent = []
+
+    async def send(self, chat_id, **kwargs):
+        self.sent.append((chat_id, kwargs))
+        return self.outcomes.get(chat_id, SENT)
+
+
+def rows(db):
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT chat_id, status, attempts, next_attempt_at, last_error FROM outbox ORDER BY id')
+        columns = [description[0] for description in cursor.description]
+        return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+
+
+def make_due(db):
+    """Отменить задержку повтора, чтобы следующий проход забрал сообщения"""
+    with db.get_connection() as conn:
+        conn.cursor().execute('UPDATE outbox SET next_attempt_at = ?', (time.time(),))
+
+
+def test_markup_survives_serialization():
+    markup = InlineKeyboardMarkup([[InlineKeyboardButton("✅ Записаться", callback_data='join_7')]])
+    message = {'text': 'Тренировка', 'parse_mode': 'HTML', 'reply_markup': markup}
+
+    restored = deserialize_message(serialize_message(message))
+    removed = deserialize_message(serialize_message({'text': 'x', 'reply_markup': ReplyKeyboardRemove()}))
+
+    assert restored == message
+    assert isinstance(removed['reply_markup'], ReplyKeyboardRemove)
+    assert deserialize_message(serialize_message({'text': 'x'})) == {'text': 'x'}
+
+
+def test_enqueue_many_accepts_sync_and_async_callables(db):
+    outbox = Outbox(db, StubBroadcaster())
+
+    async def personal(chat_id):
+        return {'text': f'привет, {chat_id}'}
+
+    async def scenario():
+        await outbox.enqueue_many([1, 2, 3], lambda chat_id: None if chat_id == 2 else {'text': 'общее'})
+        await outbox.enqueue_many([4], personal, kind='reminder')
+        batch = await outbox.async_db.claim_outbox_batch(10, 60)
+        return [(m['chat_id'], m['kind'], deserialize_message(m['payload'])) for m in batch]
+
+    assert asyncio.run(scenario()) == [
+        (1, 'message', {'text': 'общее'}),
+        (3, 'message', {'text': 'общее'}),
+        (4, 'reminder', {'text': 'привет, 4'}),
+    ]
+
+
+def test_claim_leases_batch(db):
+    db.enqueue_outbox([(chat_id, 'message', '{"text": "x"}') for chat_id in range(1, 4)])
+
+    before = time.time()
+    first = db.claim_outbox_batch(2, 60)
+    second = db.claim_outbox_batch(10, 60)
+    third = db.claim_outbox_batch(10, 60)
+
+    assert [m['chat_id'] for m in first] == [1, 2]
+    assert [m['chat_id'] for m in second] == [3]
+    # Забранные сообщения не отдаются повторно, пока не истечет срок
+    assert third == []
+    assert all(row['next_attempt_at'] >= before + 60 for row in rows(db).values())
+
+
+def test_dispatch_once_records_outcomes(db):
+    broadcaster = StubBroadcaster({2: FAILED, 3: BLOCKED, 4: REJECTED})
+    outbox = Outbox(db, broadcaster)
+    db.enqueue_outbox([(chat_id, 'message', '{"text": "x"}') for chat_id in range(1, 5)])
+
+    before = time.time()
+    processed = asyncio.run(outbox.dispatch_once())
+    after = time.time()
+    state = rows(db)
+
+    assert processed == 4
+    assert sorted(chat_id for chat_id, _ in broadcaster.sent) == [1, 2, 3, 4]
+    # Отправленное удаляется из очереди
+    assert 1 not in state
+    # Временная ошибка - повтор через OUTBOX_BACKOFF_BASE
+    assert state[2]['status'] == 'pending' and state[2]['attempts'] == 1 and state[2]['last_error'] == FAILED
+    assert before + BACKOFF <= state[2]['next_attempt_at'] <= after + BACKOFF
+    # Блокировка и отказ Telegram - сразу в dead-letter
+    assert (state[3]['status'], state[3]['attempts'], state[3]['last_error']) == ('dead', 1, BLOCKED)
+    assert (state[4]['status'], state[4]['attempts'], state[4]['last_error']) == ('dead', 1, REJECTED)
+    assert asyncio.run(outbox.dispatch_once()) == 0
+
+
+def test_backoff_doubles_until_dead_letter(db):
+    outbox = Outbox(db, StubBroadcaster({1: FAILED}))
+    outbox.max_attempts = 4
+    db.enqueue_outbox([(1, 'message', '{"text": "x"}')])
+
+    delays = []
+    for _ in range(outbox.max_attempts - 1):
+        before = time.time()
+        asyncio.run(outbox.dispatch_once())
+        delays.append(rows(db)[1]['next_attempt_at'] - before)
+        make_due(db)
+    asyncio.run(outbox.dispatch_once())
+    state = rows(db)[1]
+
+    assert delays == pytest.approx([BACKOFF, BACKOFF * 2, BACKOFF * 4], abs=0.5)
+    assert (state['status'], state['attempts']) == ('dead', outbox.max_attempts)
+    make_due(db)
+    assert asyncio.run(outbox.dispatch_once()) == 0
+
+
+def test_invalid_payload_goes_to_dead_letter(db):
+    broadcaster = StubBroadcaster()
+    outbox = Outbox(db, broadcaster)
+    db.enqueue_outbox([(1, 'message', 'не JSON'), (2, 'message', '{"text": "x"}')])
+
+    asyncio.run(outbox.dispatch_once())
+    state = rows(db)
+
+    assert [chat_id for chat_id, _ in broadcaster.sent] == [2]
+    assert (state[1]['status'], state[1]['attempts'], state[1]['last_error']) == ('dead', 1, INVALID)
+    assert 2 not in state
+    stats = asyncio.run(outbox.get_stats())
+    assert (stats['pending'], stats['dead'], stats['sent']) == (0, 1, 1)
@@ -0,0 +1,119 @@
+import asyncio
+
+from data.persistence import DatabasePersistence
+
+
+def count_writes(db, monkeypatch):
+    """Считать транзакции записи данных PTB"""
+    batches = []
+    write = db.write_persistent_entries
+
+    def counting_write(entries):
+        batches.append(sorted(entries))
+        return write(entries)
+
+    monkeypatch.setattr(db, 'write_persistent_entries', counting_write)
+    return batches
+
+
+def test_updates_of_one_pass_are_written_once(db, monkeypatch):
+    batches = count_writes(db, monkeypatch)
+    persistence = DatabasePersistence(db)
+
+    async def scenario():
+        # Так PTB передает все измененные записи за один проход update_interval
+        await persistence.update_user_data(1, {'admin_state': 'participant_limit'})
+        await persistence.update_user_data(2, {'pending_leave_confirmation': True})
+        await persistence.update_chat_data(10, {'topic': 'волейбол'})
+        await persistence.update_user_data(1, {'admin_state': None})
+        await persistence._flush_task
+        return await persistence.get_user_data(), await persistence.get_chat_data()
+
+    user_data, chat_data = asyncio.run(scenario())
+
+    assert len(batches) == 1 and len(batches[0]) == 3
+    assert user_data == {1: {'admin_state': None}, 2: {'pending_leave_confirmation': True}}
+    assert chat_data == {10: {'topic': 'волейбол'}}
+    stats = persistence.get_stats()
+    assert (stats['flushes'], stats['entries_written'], stats['dirty']) == (1, 3, 0)
+
+
+def test_flush_on_shutdown_writes_pending_changes(db):
+    persistence = DatabasePersistence(db)
+
+    async def scenario():
+        await persistence.update_user_data(1, {'admin_state': 'participant_limit'})
+        # PTB вызывает flush при остановке, не дожидаясь отложенной записи
+        await persistence.flush()
+        assert persistence.get_stats()['dirty'] == 0
+        await persistence._flush_task
+
+    asyncio.run(scenario())
+
+    restarted = DatabasePersistence(db)
+    assert asyncio.run(restarted.get_user_data()) == {1: {'admin_state': 'participant_limit'}}
+    assert persistence.get_stats()['flushes'] == 1
+
+
+def test_failed_flush_keeps_changes(db, monkeypatch):
+    persistence = DatabasePersistence(db)
+    write = db.write_persistent_entries
+
+    def broken_write(entries):
+        raise RuntimeError("база недоступна")
+
+    async def scenario():
+        monkeypatch.setattr(db, 'write_persistent_entries', broken_write)
+        await persistence.update_user_data(1, {'admin_state': 'participant_limit'})
+        await persistence.flush()
+        assert persistence.get_stats()['errors'] == 1 and persistence.get_stats()['dirty'] == 1
+        monkeypatch.setattr(db, 'write_persistent_entries', write)
+        await persistence.flush()
+
+    asyncio.run(scenario())
+
+    assert asyncio.run(DatabasePersistence(db).get_user_data()) == {1: {'admin_state': 'participant_limit'}}
+
+
+def test_drop_and_empty_data_delete_entries(db):
+    persistence = DatabasePersistence(db)
+
+    async def scenario():
+        await persistence.update_user_data(1, {'admin_state': 'participant_limit'})
+        await persistence.update_user_data(2, {'pending_leave_confirmation': True})
+        await persistence.update_chat_data(10, {'topic': 'волейбол'})
+        await persistence.flush()
+        await persistence.drop_user_data(1)
+        await persistence.update_user_data(2, {})
+        await persistence.drop_chat_data(10)
+        await persistence.flush()
+        return await persistence.get_user_data(), await persistence.get_chat_data()
+
+    assert asyncio.run(scenario()) == ({}, {})
+
+
+def test_refresh_reads_other_replica_writes(db):
+    writer = DatabasePersistence(db)
+    reader = DatabasePersistence(db, refresh=True)
+    cached = DatabasePersistence(db)
+    stale = {'admin_state': 'participant_limit'}
+    reader_data = dict(stale)
+    cached_data = dict(stale)
+
+    async def scenario():
+        await writer.update_user_data(1, {'pending_leave_confirmation': True})
+        await writer.flush()
+        await reader.refresh_user_data(1, reader_data)
+        await cached.refresh_user_data(1, cached_data)
+        # Несохраненные изменения самой реплики новее базы и не перезаписываются
+        await reader.update_user_data(1, {'admin_state': 'broadcast'})
+        local = {'admin_state': 'broadcast'}
+        await reader.refresh_user_data(1, local)
+        await reader.flush()
+        return local
+
+    local = asyncio.run(scenario())
+
+    assert reader_data == {'pending_leave_confirmation': True}
+    assert cached_data == stale
+    assert local == {'admin_state': 'broadcast'}
@@ -0,0 +1,95 @@
+import contextvars
+import sqlite3
+
+from data import query_stats
+from data.query_stats import InstrumentedConnection, QueryStats, query_label, set_query_label
+
+
+def explain(cursor, sql, params):
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+    return '; '.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def connect(stats: QueryStats) -> InstrumentedConnection:
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+    return InstrumentedConnection(conn, stats, explain)
+
+
+def run_handler(label: str, handler):
+    """Обработчик в своем контексте, как каждое обновление в своей asyncio-задаче"""
+    def run():
+        set_query_label(label)
+        handler()
+    contextvars.copy_context().run(run)
+
+
+def by_label(stats: QueryStats):
+    return {item['label']: item for item in stats.snapshot()['labels']}
+
+
+def test_statements_rows_and_runs_are_counted_per_label():
+    stats = QueryStats(slow_query_ms=10_000)
+    conn = connect(stats)
+
+    def join():
+        stats.record_connection()
+        conn.execute('INSERT INTO items (name) VALUES (?)', ('мяч',))
+        conn.execute('SELECT id, name FROM items').fetchall()
+
+    def show_cached_list():
+        pass
+
+    for _ in range(3):
+        run_handler('callback:join', join)
+    run_handler('callback:list', show_cached_list)
+    with query_label('persistence'):
+        conn.cursor().executemany('INSERT INTO items (name) VALUES (?)', [('сетка',), ('форма',)])
+
+    labels = by_label(stats)
+    join_stats = labels['callback:join']
+    assert (join_stats['runs'], join_stats['statements'], join_stats['connections']) == (3, 6, 3)
+    # 3 добавленные строки и 1 + 2 + 3 прочитанные
+    assert join_stats['rows'] == 9
+    assert join_stats['statements_per_run'] == 2
+    # Запуск без запросов тоже считается: по нему видно, сколько нажатий обслужил кэш
+    assert (labels['callback:list']['runs'], labels['callback:list']['statements']) == (1, 0)
+    assert (labels['persistence']['runs'], labels['persistence']['rows']) == (1, 2)
+    assert query_stats.get_query_label() == 'other'
+
+
+def test_runs_are_counted_from_instance_creation():
+    first = QueryStats()
+    run_handler('command:start', lambda: None)
+    second = QueryStats()
+    run_handler('command:start', lambda: None)
+
+    assert by_label(first)['command:start']['runs'] == 2
+    assert by_label(second)['command:start']['runs'] == 1
+
+
+def test_labels_over_limit_go_to_overflow(monkeypatch):
+    monkeypatch.setattr(query_stats, 'MAX_LABELS', 2)
+    stats = QueryStats()
+    for label in ('first', 'second', 'third', 'fourth'):
+        run_handler(label, lambda: None)
+
+    labels = by_label(stats)
+    assert sorted(labels) == ['first', 'other', 'second']
+    assert labels['other']['runs'] == 2
+
+
+def test_slow_query_is_logged_with_plan():
+    stats = QueryStats(slow_query_ms=0)
+    conn = connect(stats)
+
+    run_handler('job:cleanup', lambda: conn.execute('SELECT name FROM items WHERE id = ?', (1,)).fetchall())
+    conn.execute('DELETE FROM items')
+
+    slow = stats.snapshot()['slow_queries']
+    assert [(item['label'], item['sql']) for item in slow] == [
+        ('job:cleanup', 'SELECT name FROM items WHERE id = ?'),
+        ('other', 'DELETE FROM items'),
+    ]
+    assert 'items' in slow[0]['plan']
+    assert by_label(stats)['job:cleanup']['slow'] == 1
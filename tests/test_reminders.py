@@ -0,0 +1,69 @@
+import asyncio
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from telegram.error import TimedOut
+from telegram.ext import ExtBot
+
+from main import VolleyballBot
+
+
+class FakeBot:
+    def __init__(self, unreachable=()):
+        self.unreachable = set(unreachable)
+        self.sent = []
+
+    async def send_message(self, chat_id, **kwargs):
+        if chat_id in self.unreachable:
+            raise TimedOut()
+        self.sent.append(chat_id)
+        return SimpleNamespace(message_id=chat_id)
+
+
+class FakeJobQueue:
+    def __init__(self):
+        self.scheduled = []
+
+    def run_once(self, callback, when, data=None):
+        self.scheduled.append(data)
+
+
+def test_retry_reminders_resends_only_failed_chats(db):
+    bot = VolleyballBot(bot=ExtBot('0:test'), db=db)
+    bot.event_service.set_participant_limit(4)
+    event_id = bot.event_service.create_event_on_date(date.today() + timedelta(days=1))
+    for telegram_id in (1, 2, 3):
+        bot.event_service.join_event(event_id, telegram_id, f'user{telegram_id}')
+    broadcaster = bot.notification_service.broadcaster
+    broadcaster.per_chat_interval = 0
+    broadcaster.max_retries = 0
+    job_queue = FakeJobQueue()
+
+    def pending_reminders():
+        return [p['telegram_id'] for p in db.get_participants_for_reminder(event_id, 'first')]
+
+    # Основная рассылка: чат 2 недоступен
+    broadcaster.bot = FakeBot(unreachable={2})
+    asyncio.run(bot.send_presence_reminders(SimpleNamespace(job_queue=job_queue)))
+
+    assert sorted(broadcaster.bot.sent) == [1, 3]
+    assert pending_reminders() == [2]
+    assert job_queue.scheduled == [{'reminder_type': 'first', 'failed': {event_id: [2]}}]
+
+    # Пока ждали повтора, записался еще один участник - его напомнит следующая рассылка
+    bot.event_service.join_event(event_id, 4, 'user4')
+    retry_context = SimpleNamespace(job_queue=job_queue, job=SimpleNamespace(data=job_queue.scheduled[0]))
+
+    # Повтор снова не удался: отметки нет, нового повтора тоже
+    broadcaster.bot = FakeBot(unreachable={2})
+    asyncio.run(bot.retry_reminders(retry_context))
+    assert broadcaster.bot.sent == []
+    assert pending_reminders() == [2, 4]
+    assert len(job_queue.scheduled) == 1
+
+    broadcaster.bot = FakeBot()
+    asyncio.run(bot.retry_reminders(retry_context))
+
+    assert broadcaster.bot.sent == [2]
+    assert pending_reminders() == [4]
+    assert len(job_queue.scheduled) == 1
@@ -0,0 +1,227 @@
+"""Две реплики бота в одном процессе против одной базы.
+
+Каждая реплика - свой экземпляр Database (свой пул соединений), EventService
+с выключенными кэшами, DatabasePersistence и JobLeader, как в режиме
+MULTI_REPLICA=1.
+"""
+import asyncio
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from data.backends import create_backend
+from data.database import Database
+from data.persistence import DatabasePersistence
+from services.event_service import EventService
+from services.job_leader import JobLeader
+
+LEASE_SECONDS = 0.5
+
+
+class Replica:
+    def __init__(self, name: str, database_url: str):
+        self.name = name
+        self.db = Database(backend=create_backend(database_url))
+        self.event_service = EventService(self.db, cache_enabled=False)
+        self.persistence = DatabasePersistence(self.db, refresh=True)
+        self.leader = JobLeader(self.db, replica_id=name, lease_seconds=LEASE_SECONDS, takeover_timeout=10)
+
+    def close(self):
+        self.db.close()
+
+
+@pytest.fixture
+def replicas(database_url):
+    a = Replica('replica-a', database_url)
+    b = Replica('replica-b', database_url)
+    yield a, b
+    a.close()
+    b.close()
+
+
+def test_user_data_is_shared(replicas):
+    a, b = replicas
+    user_data = {'stale': True}
+
+    async def scenario():
+        # Как persist_user_state в main: запись сразу после обработки обновления
+        await a.persistence.update_user_data(1, {'admin_state': 'participant_limit', 'pending_leave_confirmation': True})
+        await a.persistence.flush()
+        await b.persistence.refresh_user_data(1, user_data)
+
+    asyncio.run(scenario())
+
+    assert user_data == {'admin_state': 'participant_limit', 'pending_leave_confirmation': True}
+
+
+def test_leader_lease_is_taken_over_after_expiry(replicas):
+    a, b = replicas
+
+    async def scenario():
+        first = await a.leader.renew()
+        second = await b.leader.renew()
+        # Ведущая реплика перестала продлевать аренду - через lease_seconds ее забирает другая
+        await asyncio.sleep(LEASE_SECONDS + 0.2)
+        takeover = await b.leader.renew()
+        stale = await a.leader.renew()
+        return first, second, takeover, stale
+
+    assert asyncio.run(scenario()) == (True, False, True, False)
+
+
+def test_job_runs_once_when_fired_on_both_replicas(replicas):
+    a, b = replicas
+    runs = []
+
+    async def job(replica: Replica, round_number: int):
+        await asyncio.sleep(0.05)
+        runs.append((replica.name, round_number))
+
+    async def scenario():
+        for round_number in range(6):
+            run_key = f'round-{round_number}'
+            results = await asyncio.gather(
+                a.leader.run_exclusive('test_job', lambda: job(a, round_number), run_key),
+                b.leader.run_exclusive('test_job', lambda: job(b, round_number), run_key),
+            )
+            assert sorted(results) == [False, True]
+            # Каждый третий раунд ведущая реплика «зависает», и аренда переходит
+            if round_number % 3 == 2:
+                await asyncio.sleep(LEASE_SECONDS + 0.2)
+
+    asyncio.run(scenario())
+
+    assert sorted(round_number for _, round_number in runs) == list(range(6))
+
+
+def test_job_runs_when_leader_died_before_firing(replicas):
+    a, b = replicas
+    runs = []
+
+    async def job():
+        runs.append('replica-b')
+
+    async def scenario():
+        # Ведущая упала: аренда еще действует, но задачу на ней никто не запустит
+        assert await a.leader.renew()
+        return await b.leader.run_exclusive('test_job', job, '2026-10-16 18:00')
+
+    assert asyncio.run(scenario()) is True
+    assert runs == ['replica-b']
+
+
+def test_job_is_taken_over_when_leader_died_mid_run(replicas):
+    a, b = replicas
+    runs = []
+
+    async def job():
+        runs.append('replica-b')
+
+    async def scenario():
+        # Ведущая застолбила запуск и упала, не завершив задачу
+        assert await a.leader.renew()
+        assert await a.leader.async_db.claim_job_run('test_job', 'run', a.leader.replica_id, LEASE_SECONDS)
+        return await b.leader.run_exclusive('test_job', job, 'run')
+
+    assert asyncio.run(scenario()) is True
+    assert runs == ['replica-b']
+    assert b.db.is_job_run_completed('test_job', 'run')
+
+
+def test_follower_waits_for_running_job(replicas):
+    a, b = replicas
+    runs = []
+
+    async def slow_job():
+        # Дольше срока заявки: ведущая должна продлевать ее, пока задача идет
+        await asyncio.sleep(LEASE_SECONDS * 3)
+        runs.append('replica-a')
+
+    async def fast_job():
+        runs.append('replica-b')
+
+    async def scenario():
+        assert await a.leader.renew()
+
+        async def keep_leading():
+            while True:
+                await asyncio.sleep(LEASE_SECONDS / 3)
+                await a.leader.renew()
+
+        renewal = asyncio.create_task(keep_leading())
+        leader_run = asyncio.create_task(a.leader.run_exclusive('test_job', slow_job, 'run'))
+        await asyncio.sleep(0.1)
+        follower = await b.leader.run_exclusive('test_job', fast_job, 'run')
+        leader = await leader_run
+        renewal.cancel()
+        return leader, follower
+
+    assert asyncio.run(scenario()) == (True, False)
+    assert runs == ['replica-a']
+
+
+def test_concurrent_joins_through_both_replicas(replicas):
+    a, b = replicas
+    limit, users = 12, 60
+    a.event_service.set_participant_limit(limit)
+    event_id = a.event_service.create_event_on_date(date.today() + timedelta(days=3))
+    # Вторая реплика видит событие сразу: кэши выключены
+    assert b.event_service.get_event_by_id(event_id) is not None
+
+    errors = []
+
+    def join(replica: Replica, telegram_ids):
+        for telegram_id in telegram_ids:
+            try:
+                replica.event_service.join_event(event_id, telegram_id, f'user{telegram_id}')
+            except Exception as e:
+                errors.append(e)
+
+    ids = [5_000_000_000 + i for i in range(users)]
+    threads = [
+        threading.Thread(target=join, args=(replica, ids[offset::4]))
+        for offset, replica in enumerate([a, b, a, b])
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts = b.event_service.get_participant_counts(event_id)
+    positions = [p['position'] for p in b.db.get_event_participants(event_id)]
+    assert errors == []
+    assert counts['confirmed'] == limit and counts['total'] == users
+    assert len(set(positions)) == len(positions)
+
+
+def test_failed_job_is_retried_by_another_replica(replicas):
+    a, b = replicas
+    runs = []
+
+    async def failing_job():
+        runs.append('replica-a')
+        raise RuntimeError("база недоступна")
+
+    async def job():
+        runs.append('replica-b')
+
+    async def scenario():
+        assert await a.leader.renew()
+        leader_run = asyncio.create_task(a.leader.run_exclusive('test_job', failing_job, 'run'))
+        follower = await b.leader.run_exclusive('test_job', job, 'run')
+        with pytest.raises(RuntimeError):
+            await leader_run
+        return follower
+
+    # Ошибка задачи не отмечает запуск выполненным
+    assert asyncio.run(scenario()) is True
+    assert runs == ['replica-a', 'replica-b']
+    assert b.db.is_job_run_completed('test_job', 'run')
+
+
+def test_takeover_timeout_is_a_few_leases(db, monkeypatch):
+    monkeypatch.delenv('SCHEDULER_TAKEOVER_LEASES', raising=False)
+    assert JobLeader(db, lease_seconds=30).takeover_timeout == 120
+    monkeypatch.setenv('SCHEDULER_TAKEOVER_LEASES', '1')
+    assert JobLeader(db, lease_seconds=30).takeover_timeout == 90
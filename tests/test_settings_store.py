@@ -0,0 +1,115 @@
+from datetime import date, time, timedelta
+
+import pytest
+
+from data.settings_store import SettingsStore
+from services.event_service import EventService
+
+
+def test_values_are_typed_and_validated(db):
+    store = SettingsStore(db)
+
+    store.set('participant_limit', '12')
+    store.set('reminder_time', '18:05')
+    store.set('training_days', ['Sunday', 'thursday'])
+
+    assert store.get('participant_limit') == 12
+    assert store.get('reminder_time') == time(18, 5)
+    assert store.get('training_days') == ['sunday', 'thursday']
+    assert store.get_training_weekdays() == [6, 3]
+
+    for key, value in [('participant_limit', 'много'), ('reminder_time', '25:00'), ('training_days', 'someday')]:
+        with pytest.raises(ValueError):
+            store.set(key, value)
+    with pytest.raises(KeyError):
+        store.set('unknown', 1)
+
+    # Некорректные значения не попадают ни в память, ни в базу
+    assert SettingsStore(db).get('participant_limit') == store.get('participant_limit') == 12
+    assert db.get_all_settings()['reminder_time'] == '18:05'
+
+
+def test_broken_stored_value_falls_back_to_default(db):
+    db.set_setting('training_time', 'вечером')
+
+    assert isinstance(SettingsStore(db).get('training_time'), time)
+
+
+def test_subscribers_get_changes(db):
+    store = SettingsStore(db)
+    calls = []
+    store.subscribe('participant_limit', lambda *args: calls.append(args))
+    store.subscribe(['reminder_time', 'auto_leave_time'], lambda key, old, new: calls.append((key, new)))
+    old_limit = store.get('participant_limit')
+
+    store.set('participant_limit', old_limit + 1)
+    store.set('participant_limit', old_limit + 1)
+    store.set('participant_limit', old_limit + 1, force=True)
+    store.set('auto_leave_time', '19:10')
+
+    assert calls == [
+        ('participant_limit', old_limit, old_limit + 1),
+        ('participant_limit', old_limit + 1, old_limit + 1),
+        ('auto_leave_time', time(19, 10)),
+    ]
+
+
+def test_subscriber_error_reaches_caller_after_other_subscribers(db):
+    store = SettingsStore(db)
+    calls = []
+
+    def broken(key, old, new):
+        raise RuntimeError("пересчет не удался")
+
+    store.subscribe('participant_limit', broken)
+    store.subscribe('participant_limit', lambda key, old, new: calls.append(new))
+
+    with pytest.raises(RuntimeError):
+        store.set('participant_limit', 7)
+
+    assert calls == [7]
+    assert SettingsStore(db).get('participant_limit') == 7
+
+
+def test_reload_notifies_about_external_changes(db):
+    store = SettingsStore(db)
+    calls = []
+    store.subscribe('reminder_time', lambda key, old, new: calls.append(new))
+
+    # Другая реплика записала настройку в обход этого экземпляра
+    db.set_setting('reminder_time', '17:45')
+    store.reload()
+    db.set_setting('reminder_time', '17:50')
+    store.reload(notify=True)
+
+    assert calls == [time(17, 50)]
+
+
+def test_limit_change_updates_all_events_in_one_transaction(db, monkeypatch):
+    service = EventService(db)
+    service.set_participant_limit(2)
+    events = [service.create_event_on_date(date.today() + timedelta(days=days)) for days in (2, 4)]
+    for event_id in events:
+        for telegram_id in (1, 2, 3):
+            service.join_event(event_id, telegram_id, f'user{telegram_id}')
+
+    recalculate = db.recalculate_participant_statuses
+
+    def fail_on_second_event(event_id, limit=None):
+        if event_id == events[1]:
+            raise RuntimeError("соединение потеряно")
+        return recalculate(event_id, limit)
+
+    monkeypatch.setattr(db, 'recalculate_participant_statuses', fail_on_second_event)
+    with pytest.raises(RuntimeError):
+        service.set_participant_limit(3)
+
+    # Лимит первого события и его статусы откатились вместе со вторым
+    assert [db.get_event_by_id(event_id)['max_participants'] for event_id in events] == [2, 2]
+    assert [service.get_participant_counts(event_id)['confirmed'] for event_id in events] == [2, 2]
+
+    monkeypatch.setattr(db, 'recalculate_participant_statuses', recalculate)
+    moved = service.set_participant_limit(3)
+
+    assert [db.get_event_by_id(event_id)['max_participants'] for event_id in events] == [3, 3]
+    assert [participant['telegram_id'] for participant in moved] == [3, 3]
@@ -0,0 +1,133 @@
+import asyncio
+import random
+from datetime import datetime
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+
+from config.settings import ADMIN_IDS
+from services.update_processor import ROSTER_KEY, KeyedUpdateProcessor, release_update_key, update_keys
+
+ADMIN_ID = ADMIN_IDS[0]
+
+
+def keyed_processor() -> KeyedUpdateProcessor:
+    # Вместо Update - кортеж ключей, чтобы проверять только упорядочивание
+    return KeyedUpdateProcessor(256, key_func=lambda keys: keys)
+
+
+def text_update(user_id: int, text: str) -> Update:
+    user = User(user_id, f'user{user_id}', False)
+    message = Message(1, datetime.now(), Chat(user_id, Chat.PRIVATE), from_user=user, text=text)
+    return Update(1, message=message)
+
+
+def callback_update(user_id: int, data: str) -> Update:
+    user = User(user_id, f'user{user_id}', False)
+    return Update(1, callback_query=CallbackQuery('1', user, 'chat', data=data))
+
+
+def test_same_key_runs_in_arrival_order():
+    processor = keyed_processor()
+    events = []
+
+    async def handler(number: int):
+        events.append(('start', number))
+        # Меньшие номера спят дольше: без упорядочивания порядок завершения перевернулся бы
+        await asyncio.sleep(0.01 * (5 - number))
+        events.append(('end', number))
+
+    async def scenario():
+        await asyncio.gather(*(
+            processor.do_process_update(('user:1',), handler(number)) for number in range(5)
+        ))
+
+    asyncio.run(scenario())
+
+    assert events == [(stage, number) for number in range(5) for stage in ('start', 'end')]
+    assert processor._locks == {}
+
+
+def test_different_keys_run_concurrently():
+    processor = keyed_processor()
+
+    async def scenario():
+        first_started, second_started = asyncio.Event(), asyncio.Event()
+
+        async def handler(own: asyncio.Event, other: asyncio.Event):
+            own.set()
+            # Дождаться второго обработчика можно, только если оба идут одновременно
+            await asyncio.wait_for(other.wait(), 1)
+
+        await asyncio.gather(
+            processor.do_process_update(('user:1',), handler(first_started, second_started)),
+            processor.do_process_update(('user:2',), handler(second_started, first_started)),
+        )
+
+    asyncio.run(scenario())
+
+
+def test_overlapping_key_sets_do_not_deadlock():
+    processor = keyed_processor()
+    rng = random.Random(7)
+    key_sets = []
+    for _ in range(200):
+        keys = rng.sample(['user:1', 'user:2', 'user:3', ROSTER_KEY], rng.randint(1, 3))
+        key_sets.append(tuple(keys))
+    active = set()
+    conflicts = []
+
+    async def handler(keys):
+        if active & set(keys):
+            conflicts.append(keys)
+        active.update(keys)
+        await asyncio.sleep(rng.random() / 1000)
+        active.difference_update(keys)
+
+    async def scenario():
+        # Ключи приходят в разном порядке; процессор захватывает их в одном
+        await asyncio.wait_for(asyncio.gather(*(
+            processor.do_process_update(keys, handler(keys)) for keys in key_sets
+        )), 10)
+
+    asyncio.run(scenario())
+
+    assert conflicts == []
+    assert processor._locks == {} and processor._users == {}
+
+
+def test_released_roster_key_lets_next_update_in():
+    processor = keyed_processor()
+    events = []
+
+    async def first():
+        events.append('first written')
+        release_update_key(ROSTER_KEY)
+        # Ответ пользователю идет уже без ключа состава
+        await asyncio.sleep(0.05)
+        events.append('first replied')
+
+    async def second():
+        events.append('second written')
+
+    async def scenario():
+        await asyncio.gather(
+            processor.do_process_update(('user:1', ROSTER_KEY), first()),
+            processor.do_process_update(('user:2', ROSTER_KEY), second()),
+        )
+
+    asyncio.run(scenario())
+
+    assert events == ['first written', 'second written', 'first replied']
+
+
+def test_update_keys():
+    assert update_keys(text_update(1, "Иду на тренировку!")) == ['user:1', ROSTER_KEY]
+    assert update_keys(text_update(1, "Список участников")) == ['user:1']
+    assert update_keys(callback_update(1, 'confirm_leave_7_1')) == ['user:1', ROSTER_KEY]
+    assert update_keys(callback_update(1, 'roster_7')) == ['user:1']
+    # Администратор берет ключ состава только для команд, которые меняют состав
+    assert update_keys(text_update(ADMIN_ID, "📊 Статистика")) == [f'user:{ADMIN_ID}']
+    assert update_keys(text_update(ADMIN_ID, "12 участников")) == [f'user:{ADMIN_ID}', ROSTER_KEY]
+    assert update_keys(text_update(ADMIN_ID, "14")) == [f'user:{ADMIN_ID}', ROSTER_KEY]
+    assert update_keys(text_update(1, "14")) == ['user:1']
+    assert update_keys(object()) == []
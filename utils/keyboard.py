@@ -25,6 +25,20 @@ def create_leave_confirmation_keyboard(event_id: int, telegram_id: int) -> Inlin
     ]
     return InlineKeyboardMarkup(keyboard)
 
+def create_roster_keyboard(event_id: int) -> InlineKeyboardMarkup:
+    """Создать кнопку полного списка участников под живым сообщением"""
+    keyboard = [
+        [InlineKeyboardButton("📋 Показать список", callback_data=f"roster_{event_id}")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def create_statistics_keyboard() -> InlineKeyboardMarkup:
+    """Создать кнопку подробной статистики нагрузки на базу"""
+    keyboard = [
+        [InlineKeyboardButton("🗄 Нагрузка на базу", callback_data="dbload")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
 def create_presence_confirmation_keyboard(event_id: int, telegram_id: int) -> InlineKeyboardMarkup:
     """Создать клавиатуру для подтверждения присутствия"""
     keyboard = [
@@ -69,12 +83,39 @@ def create_participant_limit_keyboard() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
-def get_is_joined(db, event_service, telegram_id):
-    """Проверить, записан ли пользователь на ближайшее активное событие по таблице participants"""
+def get_keyboard_texts() -> set:
+    """Тексты всех кнопок обычных (не инлайн) клавиатур бота"""
+    keyboards = [
+        create_main_keyboard(is_joined=False), create_main_keyboard(is_joined=True),
+        create_admin_keyboard(), create_event_creation_keyboard(),
+        create_settings_keyboard(), create_participant_limit_keyboard()
+    ]
+    return {button.text for keyboard in keyboards for row in keyboard.keyboard for button in row}
+
+def get_joined_telegram_ids(db, event_service):
+    """Получить множество telegram_id, записанных на ближайшее активное событие (из кэша состояния)"""
+    active_events = event_service.get_active_events()
+    if not active_events:
+        return set()
+    return event_service.get_joined_telegram_ids(active_events[0]['id'])
+
+def get_is_joined(db, event_service, telegram_id, joined_ids=None):
+    """Проверить, записан ли пользователь на ближайшее активное событие.
+
+    Если передано заранее вычисленное множество joined_ids (см. get_joined_telegram_ids),
+    проверка выполняется по нему, иначе - по кэшу состояния событий.
+    """
+    if joined_ids is not None:
+        return telegram_id in joined_ids
     active_events = event_service.get_active_events()
     if not active_events:
         return False
-    event_id = active_events[0]['id']
-    participant = db.get_participant(event_id, telegram_id)
-    return participant is not None
+    return event_service.is_joined(active_events[0]['id'], telegram_id)
+
+async def get_is_joined_async(db, event_service, telegram_id):
+    """Асинхронный вариант get_is_joined: запросы выполняются в потоке базы данных"""
+    return await event_service.async_db.run(get_is_joined, db, event_service, telegram_id)
 
+async def get_joined_telegram_ids_async(db, event_service):
+    """Асинхронный вариант get_joined_telegram_ids"""
+    return await event_service.async_db.run(get_joined_telegram_ids, db, event_service)
@@ -0,0 +1,274 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Счетчики и гистограммы живут в общем реестре ``REGISTRY``; запись - это
+поиск по словарю и несколько сложений под блокировкой, поэтому метрики
+можно обновлять на каждом обновлении, запросе к Bot API и запросе к базе.
+``MetricsServer`` отдает реестр по HTTP на отдельном порту (GET /metrics).
+"""
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм длительности, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Монотонный счетчик с метками: ``inc(*значения_меток, amount=1)``"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {value}' for labels, value in values]
+
+
+class Histogram:
+    """Гистограмма с метками: ``observe(значение, *значения_меток)``"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Метки -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            data[0][index] += 1
+            data[1] += value
+            data[2] += 1
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            data = self._values.get(labels)
+            return data[2] if data else 0
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(data[0]), data[1], data[2]) for labels, data in self._values.items()]
+        lines = []
+        for labels, bucket_counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Collector:
+    """Метрика, значения которой читаются при каждом сборе.
+
+    ``bind(read)`` задает источник: ``read()`` возвращает {значения_меток: значение}.
+    Подходит для счетчиков, которые уже ведет другой объект (например, пул соединений).
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._read: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def bind(self, read: Callable[[], Dict[Tuple[str, ...], float]]):
+        self._read = read
+
+    def collect(self) -> List[str]:
+        if self._read is None:
+            return []
+        try:
+            values = self._read()
+        except Exception as e:
+            logger.error(f"Ошибка при сборе метрики {self.name}: {e}")
+            return []
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {value}' for labels, value in values.items()]
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, name: str, documentation: str, kind: str, labelnames: Sequence[str] = ()) -> Collector:
+        return self._register(Collector(name, documentation, kind, labelnames))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+UPDATES = REGISTRY.counter('bot_updates_total', "Обработанные обновления по обработчикам", ['handler'])
+UPDATE_DURATION = REGISTRY.histogram(
+    'bot_update_duration_seconds', "Длительность обработки обновления (без ожидания очереди)", ['handler']
+)
+HANDLER_ERRORS = REGISTRY.counter('bot_handler_errors_total', "Необработанные исключения в обработчиках", ['type'])
+API_DURATION = REGISTRY.histogram('bot_telegram_api_duration_seconds', "Длительность запросов к Bot API", ['method'])
+API_ERRORS = REGISTRY.counter('bot_telegram_api_errors_total', "Ошибки запросов к Bot API", ['method', 'type'])
+OUTGOING_MESSAGES = REGISTRY.counter(
+    'bot_outgoing_messages_total', "Сообщения рассылок и очереди по исходу (sent, failed, blocked, rejected)", ['outcome']
+)
+BROADCAST_DURATION = REGISTRY.histogram('bot_broadcast_duration_seconds', "Длительность рассылок")
+DB_QUERY_DURATION = REGISTRY.histogram(
+    'bot_db_query_duration_seconds', "Длительность SQL-запросов по обработчикам", ['label']
+)
+JOB_DURATION = REGISTRY.histogram('bot_job_duration_seconds', "Длительность задач планировщика", ['job'])
+DB_POOL_CHECKOUTS = REGISTRY.collector(
+    'bot_db_pool_checkouts_total', "Выдачи соединений пула: hit, miss, wait, reentrant, health_check_failure",
+    'counter', ['result']
+)
+DB_POOL_WAIT = REGISTRY.collector(
+    'bot_db_pool_wait_seconds_total', "Суммарное ожидание свободного соединения пула", 'counter'
+)
+DB_POOL_CONNECTIONS = REGISTRY.collector(
+    'bot_db_pool_connections', "Соединения пула: open, idle, max", 'gauge', ['state']
+)
+
+
+def bind_pool_stats(read_stats: Callable[[], Dict]):
+    """Отдавать счетчики пула соединений (``Database.get_pool_stats``) в метриках"""
+    def checkouts():
+        stats = read_stats()
+        return {
+            ('hit',): stats['hits'], ('miss',): stats['misses'], ('wait',): stats['waits'],
+            ('reentrant',): stats['reentrant'], ('health_check_failure',): stats['health_check_failures'],
+        }
+
+    def connections():
+        stats = read_stats()
+        return {('open',): stats['size'], ('idle',): stats['idle'], ('max',): stats['max_size']}
+
+    DB_POOL_CHECKOUTS.bind(checkouts)
+    DB_POOL_WAIT.bind(lambda: {(): read_stats()['wait_time']})
+    DB_POOL_CONNECTIONS.bind(connections)
+
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """Сетевой слой бота, замеряющий запросы к Bot API по методам"""
+
+    async def post(self, url: str, *args, **kwargs):
+        method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().post(url, *args, **kwargs)
+        except Exception as e:
+            API_ERRORS.inc(method, type(e).__name__)
+            raise
+        finally:
+            API_DURATION.observe(time.perf_counter() - started, method)
+
+
+class MetricsServer:
+    """HTTP-сервер метрик на отдельном порту: GET /metrics"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = '0.0.0.0', port: int = 9090):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        try:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            # Метрики не должны мешать работе бота
+            logger.error(f"Не удалось открыть порт метрик {self.host}:{self.port}: {e}")
+            return
+        # С port=0 порт выбирает система
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\n'
+                f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()